@@ -0,0 +1,29 @@
+"""
+ASGI config, the counterpart of wsgi.py. It exposes the ASGI callable as a
+module-level variable named ``application``, served with the homepage's
+async view (see asgi_urls.py) and streaming responses read in a thread
+(see com/handlers.py), for example by uvicorn workers:
+
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+"""
+
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+from django.conf import settings
+
+from com.handlers import ASGIRequest, get_asgi_application
+from com.manifest import load_manifest
+from com.static import ASGIStaticFiles
+from com.warmup import warm
+
+application = ASGIStaticFiles(
+    get_asgi_application(),
+    settings.STATIC_MOUNTS,
+    manifest=load_manifest(settings.STATIC_MANIFEST),
+    check_mtime=settings.DEBUG,
+)
+
+# Do what the first requests would, before gunicorn forks any workers.
+warm(application, urlconf=ASGIRequest.urlconf)
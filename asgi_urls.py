@@ -0,0 +1,13 @@
+"""
+The URLconf asgi.py serves: urls.py with the homepage swapped for its
+async view.
+"""
+
+from django.conf.urls import url
+
+from com import views
+from urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [url(r"^$", views.async_index, name="index")] + [
+    pattern for pattern in wsgi_urlpatterns if getattr(pattern, "name", None) != "index"
+]
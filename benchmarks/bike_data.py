@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Bytes over the wire and parse time for the Boston bikes page's data: the
+full source files it used to download, next to the trimmed CSVs and
+per-zoom TopoJSON layers from com.bike_data.
+
+Parsing is timed with the csv and json modules as stand-ins for d3.csv
+and JSON.parse, which do the same work in the browser.
+
+    python benchmarks/bike_data.py [--iterations 20]
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from com.bike_data import (  # noqa: E402
+    DATASETS,
+    MAP_LAYERS,
+    MAP_ZOOMS,
+    build_map_layer,
+    map_layer_source_path,
+)
+
+DATA_DIR = os.path.join(ROOT, "bikes", "data")
+
+
+def parse_csv(body, keep=None):
+    rows = list(csv.DictReader(io.StringIO(body)))
+    if keep:
+        rows = [row for row in rows if keep(row)]
+    return rows
+
+
+def parse_json(body):
+    # Strip the `var neighborhoods_json = ...;` some sources are wrapped in.
+    return json.loads(body[body.index("{") : body.rindex("}") + 1])
+
+
+def time_parse(parse, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        parse()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def report(name, version, body, parse, iterations):
+    encoded = body.encode("utf-8")
+    print(
+        "%-14s %-8s %12s %12s %10.2f"
+        % (name, version, len(encoded), len(gzip.compress(encoded)), time_parse(parse, iterations))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    print("%-14s %-8s %12s %12s %10s" % ("dataset", "version", "bytes", "gzipped", "parse ms"))
+    for name, dataset in sorted(DATASETS.items()):
+        with open(dataset.source_path(DATA_DIR), encoding="utf-8-sig") as f:
+            source = f.read()
+        trimmed = dataset.build(DATA_DIR)
+        report(name, "source", source, lambda: parse_csv(source, dataset.keep), args.iterations)
+        report(name, "trimmed", trimmed, lambda: parse_csv(trimmed), args.iterations)
+
+    for name in sorted(MAP_LAYERS):
+        with open(map_layer_source_path(name, DATA_DIR)) as f:
+            source = f.read()
+        report(name, "source", source, lambda: parse_json(source), args.iterations)
+        for zoom in sorted(MAP_ZOOMS):
+            topology = build_map_layer(name, zoom, DATA_DIR)
+            report(name, "zoom %s" % zoom, topology, lambda: parse_json(topology), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
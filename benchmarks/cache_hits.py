@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Hit latency of the plain DatabaseCache next to the TwoTierCache in front of
+it, using a throwaway SQLite file like the one the site runs on.
+
+    python benchmarks/cache_hits.py [--iterations 5000]
+"""
+
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def setup_django(db_path):
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": db_path}},
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "cache"},
+            "two_tier": {"BACKEND": "com.cache_backends.TwoTierCache", "LOCATION": "default"},
+        },
+        INSTALLED_APPS=[],
+    )
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("createcachetable", verbosity=0)
+
+
+def blog_entries():
+    now = datetime.datetime.now()
+    return [
+        {
+            "link": "http://www.ofbrooklyn.com/2026/1/%s/post/" % i,
+            "title": "A blog post title number %s" % i,
+            "date": now - datetime.timedelta(days=i),
+        }
+        for i in range(20)
+    ]
+
+
+def time_hits(cache, iterations):
+    cache.set("blog_entries", blog_entries(), 60 * 60)
+    cache.get("blog_entries")
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        cache.get("blog_entries")
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[int(len(samples) * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, "bench.db"))
+        from django.core.cache import caches
+
+        results = {
+            "DatabaseCache": time_hits(caches["default"], args.iterations),
+            "TwoTierCache": time_hits(caches["two_tier"], args.iterations),
+        }
+
+    print("%-14s %10s %10s %10s" % ("backend", "mean us", "p50 us", "p99 us"))
+    for name, result in results.items():
+        print(
+            "%-14s %10.1f %10.1f %10.1f"
+            % (name, result["mean"] * 1e6, result["p50"] * 1e6, result["p99"] * 1e6)
+        )
+    speedup = results["DatabaseCache"]["mean"] / results["TwoTierCache"]["mean"]
+    print("\nTwoTierCache hits are %.1fx faster." % speedup)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+Throughput and latency of the site's hot routes, end to end: the app is
+booted under gunicorn with the real gunicorn.py, against a throwaway
+database and a local stand-in for the ofbrooklyn feed, then each route is
+hit at a fixed concurrency.
+
+Results are compared with benchmarks/http_baseline.json, and the exit
+status is 1 if any route got slower or served fewer requests a second than
+the baseline allows for. The baseline only means something on the machine
+that wrote it, so rewrite it with --write-baseline when moving to another.
+
+    python benchmarks/http_load.py [--concurrency 8] [--duration 5]
+                                   [--tolerance 0.25] [--write-baseline]
+                                   [--gunicorn-arg=--workers=4 ...]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(BENCHMARKS, "http_baseline.json")
+
+ROUTES = {
+    "index": "/",
+    "project": "/schedulerjones/",
+    "portfolio": "/portfolio/",
+    "bikes": "/boston-bikes/",
+    "static-css": "/static/styles/global.css",
+    "static-js": "/boston-bikes/bike_crashes.js",
+}
+
+# Every TemplateView page, hit round-robin under "project" above. They
+# render the same way, so they share one set of numbers.
+PROJECT_PAGES = (
+    "/schedulerjones/",
+    "/caselife/",
+    "/sunraylab/",
+    "/brainexplorer/",
+    "/donationparty/",
+    "/kickpoint/",
+    "/comfortmaps/",
+    "/newyorkfieldguide/",
+    "/podlife/",
+)
+
+FEED = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0"><channel><title>ofbrooklyn</title><link>http://www.ofbrooklyn.com/</link>
+%s
+</channel></rss>"""
+FEED_ITEM = """<item><title>A stand-in post number %(i)s</title>
+<link>http://www.ofbrooklyn.com/2026/1/%(i)s/post/</link><pubDate>%(date)s</pubDate></item>"""
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    body = FEED % "\n".join(
+        FEED_ITEM % {"i": i, "date": formatdate(1767225600 - i * 86400)} for i in range(20)
+    )
+    body = body.encode("utf-8")
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(tmp, port, feed_url, gunicorn_args, config="gunicorn.py"):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE="http_settings",
+        BENCHMARK_DB=os.path.join(tmp, "bench.db"),
+        BENCHMARK_FEED_URL=feed_url,
+        # Not ROOT: gunicorn.py there would shadow gunicorn itself. gunicorn
+        # puts its working directory on the path once it's imported.
+        PYTHONPATH=os.pathsep.join(filter(None, [BENCHMARKS, os.environ.get("PYTHONPATH")])),
+    )
+    subprocess.run(
+        [sys.executable, "manage.py", "createcachetable"], cwd=ROOT, env=env, check=True, capture_output=True
+    )
+    log = open(os.path.join(tmp, "gunicorn.log"), "w")
+    # Everything in gunicorn.py applies except where it would write to the
+    # production log and pid paths, or listen on the production port.
+    command = (
+        [
+            "gunicorn",
+            "-c",
+            config,
+            "--bind",
+            "127.0.0.1:%s" % port,
+            "--pid",
+            os.path.join(tmp, "gunicorn.pid"),
+            "--access-logfile",
+            os.path.join(tmp, "access.log"),
+            "--error-logfile",
+            "-",
+        ]
+        + gunicorn_args
+        + ["wsgi:application"]
+    )
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    # Ready once a round of concurrent requests all come back quickly, so
+    # every worker has finished booting, not just the first.
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("gunicorn exited, see %s" % log.name)
+        result = run_route(port, ["/static/styles/global.css"], 8, 0)
+        if not result["errors"] and result["max_ms"] < 1000:
+            return process
+        time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("gunicorn didn't start in 60s, see %s" % log.name)
+
+
+def request(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("GET", path, headers={"Accept-Encoding": "gzip, br", "Connection": "close"})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def run_route(port, paths, concurrency, duration):
+    """
+    Keep `concurrency` clients requesting `paths` in turn for `duration`
+    seconds, each starting its next request as soon as the last one ends.
+    """
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(offset):
+        mine, failed, i = [], 0, offset
+        while not mine or time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                status, _ = request(port, paths[i % len(paths)])
+                if status != 200:
+                    failed += 1
+            except OSError:
+                failed += 1
+            mine.append(time.perf_counter() - start)
+            i += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Routes that served fewer requests a second, or had a slower p95, than
+    the baseline by more than `tolerance`, or that had errors at all.
+    """
+    found = []
+    for name, result in results.items():
+        if result["errors"]:
+            found.append("%s: %s errors" % (name, result["errors"]))
+        before = baseline.get("routes", {}).get(name)
+        if not before:
+            continue
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            found.append("%s: %.0f req/s, baseline %.0f" % (name, result["rps"], before["rps"]))
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append("%s: p95 %.1f ms, baseline %.1f" % (name, result["p95_ms"], before["p95_ms"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5, help="seconds per route")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--routes", nargs="*", choices=sorted(ROUTES), default=list(ROUTES))
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--write-baseline", action="store_true")
+    parser.add_argument(
+        "--gunicorn-arg",
+        action="append",
+        default=[],
+        help="extra gunicorn option, e.g. --gunicorn-arg=--workers=4",
+    )
+    args = parser.parse_args()
+
+    feed = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    threading.Thread(target=feed.serve_forever, daemon=True).start()
+    feed_url = "http://127.0.0.1:%s/feeds/all/" % feed.server_port
+
+    tmp = tempfile.mkdtemp()
+    port = free_port()
+    process = start_gunicorn(tmp, port, feed_url, args.gunicorn_arg)
+    results = {}
+    try:
+        for name in args.routes:
+            paths = PROJECT_PAGES if name == "project" else (ROUTES[name],)
+            # Warm up: fill the caches and pools every worker keeps.
+            run_route(port, paths, args.concurrency, 1)
+            results[name] = run_route(port, paths, args.concurrency, args.duration)
+    finally:
+        process.terminate()
+        process.wait()
+        feed.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(
+        "%-12s %8s %8s %8s %8s %8s %8s %8s"
+        % ("route", "req/s", "base", "p50 ms", "p95 ms", "p99 ms", "max ms", "errors")
+    )
+    for name, result in results.items():
+        before = baseline.get("routes", {}).get(name, {})
+        print(
+            "%-12s %8.0f %8s %8.1f %8.1f %8.1f %8.1f %8d"
+            % (
+                name,
+                result["rps"],
+                "%.0f" % before["rps"] if before else "-",
+                result["p50_ms"],
+                result["p95_ms"],
+                result["p99_ms"],
+                result["max_ms"],
+                result["errors"],
+            )
+        )
+
+    if args.write_baseline:
+        machine = "%s, %s CPUs, Python %s" % (platform.machine(), os.cpu_count(), platform.python_version())
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "concurrency": args.concurrency,
+                    "duration": args.duration,
+                    "machine": machine,
+                    "routes": {
+                        name: {k: round(v, 1) for k, v in result.items()} for name, result in results.items()
+                    },
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+        print("\nWrote %s." % os.path.relpath(args.baseline))
+        return
+
+    found = regressions(results, baseline, args.tolerance)
+    if found:
+        print("\nRegressions beyond %d%%:\n  %s" % (args.tolerance * 100, "\n  ".join(found)))
+        sys.exit(1)
+    if baseline:
+        print("\nNo regressions beyond %d%% of the baseline." % (args.tolerance * 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""
+Settings for benchmarks/http_load.py: the site's own, pointed at a
+throwaway database and a stand-in for the blog feed.
+"""
+
+import os
+
+from settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["BENCHMARK_DB"],
+    }
+}
+
+BLOG_FEED_URL = os.environ["BENCHMARK_FEED_URL"]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Time to render the homepage template, with its {% fragment %}s rendered
+from scratch every time next to reusing them, the way the cached template
+loader and com.templatetags.fragments serve it after the first request.
+
+    python benchmarks/index_render.py [--iterations 200]
+"""
+
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+
+def blog_entries():
+    now = datetime.datetime.now()
+    return [
+        {
+            "link": "http://www.ofbrooklyn.com/2026/1/%s/post/" % i,
+            "title": "A blog post title number %s" % i,
+            "date": now - datetime.timedelta(days=i),
+        }
+        for i in range(20)
+    ]
+
+
+def time_renders(iterations, reuse_fragments):
+    from django.template.loader import render_to_string
+
+    from com.templatetags.fragments import clear_fragments
+    from com.views import _is_a_quotes
+
+    context = {"blog_entries": blog_entries(), "year": datetime.datetime.now().year}
+    quotes = _is_a_quotes()
+    clear_fragments()
+    render_to_string("index.html", dict(context, isa_quote=quotes[0]))
+
+    samples = []
+    for i in range(iterations):
+        if not reuse_fragments:
+            clear_fragments()
+        start = time.perf_counter()
+        render_to_string("index.html", dict(context, isa_quote=quotes[i % len(quotes)]))
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[int(len(samples) * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    import logging
+
+    import django
+
+    django.setup()
+    logging.disable(logging.INFO)
+
+    results = {
+        "whole template": time_renders(args.iterations, reuse_fragments=False),
+        "cached fragments": time_renders(args.iterations, reuse_fragments=True),
+    }
+
+    print("%-16s %10s %10s %10s" % ("render", "mean ms", "p50 ms", "p99 ms"))
+    for name, result in results.items():
+        print(
+            "%-16s %10.2f %10.2f %10.2f"
+            % (name, result["mean"] * 1e3, result["p50"] * 1e3, result["p99"] * 1e3)
+        )
+    speedup = results["whole template"]["mean"] / results["cached fragments"]["mean"]
+    print("\nRendering with cached fragments is %.1fx faster." % speedup)
+
+
+if __name__ == "__main__":
+    main()
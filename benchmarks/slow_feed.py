@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Latency of the static and TemplateView routes while the ofbrooklyn feed is
+slow, under gunicorn's sync workers and gunicorn.py's threaded ones.
+
+Each kind of worker is booted as in http_load.py and measured twice: once
+with the feed answering straight away, then with it hanging for longer
+than views.BLOG_FETCH_TIMEOUT while the shared cache is emptied every few
+seconds, so requests for / keep finding the blog cold and waiting on the
+feed. A couple of clients request / throughout; the rest request static
+files and project pages, and those are the numbers that shouldn't move.
+
+    python benchmarks/slow_feed.py [--duration 10] [--feed-delay 30]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from http_load import PROJECT_PAGES, ROOT, FeedHandler, free_port, request, run_route, start_gunicorn
+
+STATIC_PAGES = ("/static/styles/global.css", "/boston-bikes/bike_crashes.js")
+
+
+class SlowFeedHandler(FeedHandler):
+    delay = 0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        try:
+            super().do_GET()
+        except (BrokenPipeError, ConnectionResetError):
+            # The site gave up on us first.
+            pass
+
+
+# What each kind of worker changes in gunicorn.py. gunicorn quietly runs
+# gthread instead of sync if threads is over 1.
+WORKERS = {
+    "sync": "worker_class = 'sync'\nthreads = 1\n",
+    "threaded": "",
+}
+
+
+def write_config(tmp, workers):
+    path = os.path.join(tmp, "gunicorn_%s.py" % workers)
+    with open(path, "w") as f:
+        f.write("exec(open(%r).read())\n" % os.path.join(ROOT, "gunicorn.py"))
+        f.write(WORKERS[workers])
+        # At these request rates max_requests would recycle a worker every
+        # few seconds, and one waiting on the feed stops accepting while it
+        # drains. Measure the feed on its own.
+        f.write("max_requests = 0\n")
+    return path
+
+
+def empty_cache(tmp):
+    # Takes the TwoTierCache generation key with it, so every worker drops
+    # its local copy of the blog within CHECK_INTERVAL too.
+    with sqlite3.connect(os.path.join(tmp, "bench.db")) as db:
+        db.execute("DELETE FROM cache")
+
+
+def repeat_until(stop, interval, work):
+    while not stop.wait(interval):
+        work()
+
+
+def request_index(port, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            request(port, "/")
+        except OSError:
+            pass
+        latencies.append(time.perf_counter() - started)
+
+
+def measure_phase(port, tmp, args, slow):
+    stop = threading.Event()
+    index_latencies = []
+    background = [
+        threading.Thread(target=request_index, args=(port, stop, index_latencies))
+        for _ in range(args.index_clients)
+    ]
+    if slow:
+        SlowFeedHandler.delay = args.feed_delay
+        empty_cache(tmp)
+        emptier = threading.Thread(
+            target=repeat_until, args=(stop, args.empty_every, lambda: empty_cache(tmp))
+        )
+        background.append(emptier)
+    for thread in background:
+        thread.start()
+
+    results = {}
+
+    def measure_route(name, paths):
+        results[name] = run_route(port, paths, args.concurrency, args.duration)
+
+    routes = [
+        threading.Thread(target=measure_route, args=("static", STATIC_PAGES)),
+        threading.Thread(target=measure_route, args=("project", PROJECT_PAGES)),
+    ]
+    for thread in routes:
+        thread.start()
+    for thread in routes:
+        thread.join()
+
+    stop.set()
+    SlowFeedHandler.delay = 0
+    for thread in background:
+        thread.join()
+    index_latencies.sort()
+    results["index"] = {"requests": len(index_latencies), "max_ms": index_latencies[-1] * 1000}
+    return results
+
+
+def measure(workers, feed_url, args):
+    tmp = tempfile.mkdtemp()
+    port = free_port()
+    process = start_gunicorn(tmp, port, feed_url, [], config=write_config(tmp, workers))
+    try:
+        run_route(port, STATIC_PAGES + PROJECT_PAGES, args.concurrency, 1)
+        return {
+            phase: measure_phase(port, tmp, args, phase == "slow feed")
+            for phase in ("fast feed", "slow feed")
+        }
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    parser.add_argument("--concurrency", type=int, default=4, help="clients per measured route")
+    parser.add_argument("--index-clients", type=int, default=2)
+    parser.add_argument("--feed-delay", type=float, default=30)
+    parser.add_argument("--empty-every", type=float, default=2, help="seconds between emptying the cache")
+    args = parser.parse_args()
+
+    feed = ThreadingHTTPServer(("127.0.0.1", 0), SlowFeedHandler)
+    threading.Thread(target=feed.serve_forever, daemon=True).start()
+    feed_url = "http://127.0.0.1:%s/feeds/all/" % feed.server_port
+
+    results = {}
+    try:
+        for workers in WORKERS:
+            results[workers] = measure(workers, feed_url, args)
+    finally:
+        feed.shutdown()
+
+    print(
+        "%-9s %-10s %-8s %8s %8s %8s %9s %7s  %s"
+        % ("workers", "feed", "route", "req/s", "p50 ms", "p99 ms", "max ms", "errors", "/ requests, slowest")
+    )
+    for workers, phases in results.items():
+        for phase, routes in phases.items():
+            index = routes["index"]
+            for name in ("static", "project"):
+                result = routes[name]
+                print(
+                    "%-9s %-10s %-8s %8.0f %8.1f %8.1f %9.1f %7d  %s"
+                    % (
+                        workers,
+                        phase,
+                        name,
+                        result["rps"],
+                        result["p50_ms"],
+                        result["p99_ms"],
+                        result["max_ms"],
+                        result["errors"],
+                        "%d, %.0f ms" % (index["requests"], index["max_ms"]) if name == "static" else "",
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+How long a fresh gunicorn worker takes to serve its first request, with
+gunicorn.py's preload_app on (workers forked from a warmed master) and off
+(each worker imports and warms the app itself).
+
+gunicorn runs with one worker, which is killed each round the way
+max_requests would recycle it. A request sent at that moment waits in the
+listen queue for the replacement, so its time to first byte is the time
+until a recycled worker is useful. Also reports the master's boot time
+and the worker's proportional set size, its fair share of the memory it
+shares with the master.
+
+    python benchmarks/worker_startup.py [--rounds 5]
+"""
+
+import argparse
+import http.client
+import os
+import shutil
+import signal
+import statistics
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from http_load import ROOT, FeedHandler, free_port, start_gunicorn
+
+
+def write_config(tmp, preload):
+    path = os.path.join(tmp, "gunicorn_%s.py" % ("preload" if preload else "no_preload"))
+    with open(path, "w") as f:
+        f.write("exec(open(%r).read())\n" % os.path.join(ROOT, "gunicorn.py"))
+        f.write("preload_app = %r\nworkers = 1\n" % preload)
+    return path
+
+
+def worker_pids(master):
+    with open("/proc/%s/task/%s/children" % (master, master)) as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def pss_kb(pid):
+    with open("/proc/%s/smaps_rollup" % pid) as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1])
+    return None
+
+
+def time_to_first_byte(port, path):
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        connection.request("GET", path, headers={"Accept-Encoding": "gzip", "Connection": "close"})
+        response = connection.getresponse()
+        elapsed = time.perf_counter() - started
+        response.read()
+        return response.status, elapsed
+    finally:
+        connection.close()
+
+
+def measure(preload, rounds, feed_url, path):
+    tmp = tempfile.mkdtemp()
+    port = free_port()
+    started = time.perf_counter()
+    process = start_gunicorn(tmp, port, feed_url, [], config=write_config(tmp, preload))
+    boot = time.perf_counter() - started
+    try:
+        time_to_first_byte(port, path)
+        pss = pss_kb(worker_pids(process.pid)[0])
+        samples = []
+        for _ in range(rounds):
+            (worker,) = worker_pids(process.pid)
+            os.kill(worker, signal.SIGKILL)
+            status, elapsed = time_to_first_byte(port, path)
+            if status != 200:
+                raise SystemExit("%s returned %s" % (path, status))
+            samples.append(elapsed)
+            # Let the new worker settle before killing it in turn.
+            time.sleep(0.5)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {"boot": boot, "median": statistics.median(samples), "max": max(samples), "pss": pss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--path", default="/")
+    args = parser.parse_args()
+
+    feed = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    threading.Thread(target=feed.serve_forever, daemon=True).start()
+    feed_url = "http://127.0.0.1:%s/feeds/all/" % feed.server_port
+
+    results = {}
+    try:
+        for preload in (False, True):
+            results["preload" if preload else "no preload"] = measure(
+                preload, args.rounds, feed_url, args.path
+            )
+    finally:
+        feed.shutdown()
+
+    print("%-12s %10s %12s %12s %12s" % ("mode", "boot s", "TTFB p50 ms", "TTFB max ms", "worker PSS"))
+    for name, result in results.items():
+        print(
+            "%-12s %10.1f %12.0f %12.0f %9.1f MB"
+            % (name, result["boot"], result["median"] * 1e3, result["max"] * 1e3, result["pss"] / 1024)
+        )
+    speedup = results["no preload"]["median"] / results["preload"]["median"]
+    print("\nA recycled worker serves %s %.0fx sooner with preload_app." % (args.path, speedup))
+
+
+if __name__ == "__main__":
+    main()
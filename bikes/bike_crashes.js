@@ -17,6 +17,12 @@ window.BC = {
     
     BC.waitingDataLoads = 2;
     BC.waitingImgLoads = 0;
+
+    // Tiles at this zoom are about as detailed as the map is at scale 4.
+    BC.TILE_ZOOM = 13;
+    // Crash bins are hexagons this many pixels in radius, see BIN_PIXELS in
+    // com/bike_data.py.
+    BC.CRASH_BIN_RADIUS = 6;
     
     BC.zoom = [
       {
@@ -153,27 +159,93 @@ window.BC = {
       }, this));
   },
   
-  loadData: function() {
-    BC.neighborhoods = svg.append("g").selectAll("path")
-      .data(neighborhoods_json.features)
-      .enter()
-      .append("path")
-      .attr("fill", "#FCFCFC")
-      // .attr("stroke", "#d6d6d6")
-    .style('opacity', 0.05)
-    .attr("d", geoPath);
+  // Map layers are TopoJSON simplified for the whole-city view, see
+  // com/bike_data.py.
+  loadMapLayers: function() {
+    BC.mapLayers = {};
+    _.each(['neighborhoods', 'open-space', 'bike-network'], function(name) {
+      d3.json("data/" + name + "-z1.json", function(error, topology) {
+        if (error) return;
+        BC.mapLayers[name] = topojson.feature(topology, topology.objects[name]).features;
+        if (!BC.states.zoomedIn) BC.drawMapLayer[name](BC.mapLayers[name]);
+      });
+    });
+  },
 
-    BC.parks = svg.append("g");
-    d3.json("data/Open_Space.geojson", function(error, data) {
-      BC.parks.selectAll("path")
-        .data(data.features)
-        .enter()
+  // Zoomed in to a street, only the tiles in view are drawn, simplified for
+  // that scale instead of for the whole city. Features spanning several
+  // tiles come back in each, with the same id.
+  loadMapTiles: function(center) {
+    var request = BC.tileRequest = (BC.tileRequest || 0) + 1;
+    var tiles = tilesCovering(viewBounds(4, center), BC.TILE_ZOOM);
+
+    _.each(['open-space', 'bike-network'], function(name) {
+      var features = {};
+      var remaining = tiles.length;
+      _.each(tiles, function(tile) {
+        d3.json("tiles/" + name + "/" + tile.join("/") + ".json", function(error, topology) {
+          if (request != BC.tileRequest) return;
+          if (!error) {
+            _.each(topojson.feature(topology, topology.objects[name]).features, function(feature) {
+              features[feature.id] = feature;
+            });
+          }
+          remaining -= 1;
+          if (remaining == 0) BC.drawMapLayer[name](_.values(features));
+        });
+      });
+    });
+  },
+
+  showWholeMapLayers: function() {
+    BC.states.zoomedIn = false;
+    BC.tileRequest = (BC.tileRequest || 0) + 1;
+    _.each(BC.mapLayers, function(features, name) {
+      BC.drawMapLayer[name](features);
+    });
+  },
+
+  drawMapLayer: {
+    'neighborhoods': function(features) {
+      var paths = BC.neighborhoods.selectAll("path").data(features);
+      paths.exit().remove();
+      paths.enter()
+        .append("path")
+        .attr("fill", "#FCFCFC")
+        // .attr("stroke", "#d6d6d6")
+        .style('opacity', 0.05)
+      .merge(paths)
+        .attr("d", geoPath);
+    },
+
+    'open-space': function(features) {
+      var paths = BC.parks.selectAll("path").data(features);
+      paths.exit().remove();
+      paths.enter()
         .append("path")
         .attr("fill", "#D3E3E2")
         .style('opacity', 0.05)
         // .attr("stroke", "#447454")
+      .merge(paths)
         .attr("d", geoPath);
-    });
+    },
+
+    'bike-network': function(features) {
+      var paths = BC.bike_network.selectAll("path").data(features);
+      paths.exit().remove();
+      paths.enter()
+        .append("path")
+        .attr("fill", "transparent")
+        .style("opacity", BC.states.bikeLanes ? 1 : 0)
+        .style("stroke", "#45789C")
+      .merge(paths)
+        .attr("d", geoPath);
+    }
+  },
+
+  loadData: function() {
+    BC.neighborhoods = svg.append("g");
+    BC.parks = svg.append("g");
 
     // BC.mainStreet = svg.append("g");
     // d3.json("data/Main_Street_Districts.geojson", function(error, data) {
@@ -187,15 +259,10 @@ window.BC = {
     // });
         
     BC.bike_network = svg.append("g");
-    BC.bike_network.selectAll("path")
-      .data(window.bike_network_json.features)
-      .enter()
-      .append("path")
-      .attr("fill", "transparent")
-      .attr("d", geoPath)
-      .style("opacity", 0)
-      .style("stroke", "#45789C");
+    this.loadMapLayers();
 
+    // Racks and Hubway stations are served by tile, like the layers in
+    // loadMapTiles, at tiles/bike-racks/ and tiles/hubway-stations/.
     // var bike_racks = svg.append("g");
     //
     // bike_racks.selectAll("path")
@@ -219,22 +286,58 @@ window.BC = {
     //     .attr("stroke", "#999")
     //     .attr("d", geoPath);
 
-    d3.csv("data/Vision_Zero_Entry.csv", _.bind(function(error, data) {
-      var requests = _.filter(data, function(d) { return d.REQUESTTYPE.indexOf("bike") != -1; });
-      this.drawRequests(requests);
+    // Requests stream in bike requests first, see RecordStream in
+    // com/bike_data.py. Scrolling is set up as soon as the first are drawn.
+    var requestsLoaded = _.once(_.bind(function() {
       if (BC.waitingDataLoads) BC.waitingDataLoads -= 1;
       if (BC.waitingDataLoads == 0 && BC.fontsLoaded) this.setupScroll();
     }, this));
+    if (window.fetch && window.TextDecoder && window.ReadableStream) {
+      streamRecords("stream/requests.ndjson", _.bind(function(records) {
+        var bikeRequests = _.filter(records, function(d) { return d.request_type.indexOf("bike") != -1; });
+        if (bikeRequests.length) this.drawRequests(bikeRequests);
+        requestsLoaded();
+        // Everything after the first non-bike request is one too.
+        return bikeRequests.length == records.length;
+      }, this), requestsLoaded);
+    } else {
+      // Already filtered down to bike requests by the server. Coordinates
+      // are parsed to numbers once, here.
+      d3.csv("data/bike-requests.csv", function(d) { return {X: +d.X, Y: +d.Y}; }, _.bind(function(error, data) {
+        this.drawRequests(data);
+        requestsLoaded();
+      }, this));
+    }
 
-    d3.csv("data/crashopendata.csv", _.bind(function(error, data) {
-      window.crash_open_data = data;
-      var bikeData = _.filter(data, function(d) { return d.mode_type == 'bike'; });
-      this.drawCrashes(bikeData);
+    this.loadCrashBins(1, _.bind(function() {
       if (BC.waitingDataLoads) BC.waitingDataLoads -= 1;
       if (BC.waitingDataLoads == 0 && BC.fontsLoaded) this.setupScroll();
     }, this));
   },
 
+  // Bike crashes come counted into hexagons sized for the scale they're
+  // drawn at, a few hundred bins instead of every crash. See
+  // com/binning.py.
+  loadCrashBins: function(scale, callback) {
+    BC.crashBins = BC.crashBins || {};
+    BC.states.crashScale = scale;
+    if (BC.crashBins[scale]) {
+      this.drawCrashes(BC.crashBins[scale], scale);
+      if (callback) callback();
+      return;
+    }
+    d3.json("bins/crashes/hex-z" + scale + ".json?mode_type=bike", _.bind(function(error, data) {
+      if (!error) {
+        var bins = data.bins;
+        BC.crashBins[scale] = bins.count.map(function(count, i) {
+          return {long: bins.longitude[i], lat: bins.latitude[i], count: count};
+        });
+        if (BC.states.crashScale == scale) this.drawCrashes(BC.crashBins[scale], scale);
+      }
+      if (callback) callback();
+    }, this));
+  },
+
   setZoomLevel: function(level) {
     window.projection = window.projection
       .scale(level)
@@ -287,6 +390,9 @@ window.BC = {
   
   zoomIn: function(level) {
     BC.states.zoomIn = level;
+    BC.states.zoomedIn = true;
+    this.loadMapTiles(BC.zoom[level-1].center);
+    this.loadCrashBins(4);
 
     _.defer(zoom, 4, BC.zoom[level-1].center);
 
@@ -310,7 +416,13 @@ window.BC = {
     }
   },
 
-  drawRequests: function(data) {  
+  // Called again for each batch of requests as they arrive.
+  drawRequests: function(data) {
+    if (BC.bikeRequestsContainer) {
+      this.appendRequests(data);
+      return;
+    }
+
     $(window).on('mouseup', function(e) {
       console.log(['click', e.target.offsetX, e.target.offsetY]);
       if ($(e.target).closest("circle").length) return;
@@ -324,8 +436,43 @@ window.BC = {
       .attr('class', 'bike-requests')
       .style('opacity', 0);
 
-    BC.bikeRequests = BC.bikeRequestsContainer
-      .selectAll("g")
+    this.appendRequests(data);
+
+    var legendCoords1 = window.projection([-71.08, 42.25]);
+    var legendCoords2 = window.projection([-71.08, 42.247]);
+    BC.legend = svg.append("g").attr("class", "legend");
+    BC.legendRequests = BC.legend.append("g")
+      .attr("class", "legend-requests")
+      .style("opacity", 0)
+      .attr("transform", function(d) { return "translate(" + legendCoords1 + ")"; });
+    BC.legendRequests
+      .append("circle")
+      .attr('cx', -8)
+      .attr('cy', -4)
+      .attr("r", 4)
+      .attr("class", "bike-request-point");
+    BC.legendRequests
+      .append("text")
+      .attr('class', 'legend-text')
+      .text("Complaint about missing bike lanes");
+    BC.legendCrashes = BC.legend.append("g")
+      .attr("class", "legend-crashes")
+      .style("opacity", 0)
+      .attr("transform", function(d) { return "translate(" + legendCoords2 + ")"; });
+    BC.legendCrashes
+      .append("circle")
+      .attr('cx', -8)
+      .attr('cy', -4)
+      .attr("r", 4)
+      .attr("class", "bike-crash");
+    BC.legendCrashes.append("text")
+      .attr('class', 'legend-text')
+      .text("Bike crash involving 911");
+  },
+  
+  appendRequests: function(data) {
+    var added = BC.bikeRequestsContainer
+      .selectAll(null)
       .data(data)
       .enter()
       .append('g')
@@ -354,60 +501,35 @@ window.BC = {
         }
       });
     
-    BC.bikeRequests.append("circle")
+    added.append("circle")
       .attr("r", 1.5)
       .style('opacity', 0.8)
       .attr("class", "bike-request-point");
     
-    BC.bikeRequests.append("circle")
+    added.append("circle")
       .attr("r", 3)
       .attr("stroke", "none")
       .attr("fill", "transparent");
-      
-    var legendCoords1 = window.projection([-71.08, 42.25]);
-    var legendCoords2 = window.projection([-71.08, 42.247]);
-    BC.legend = svg.append("g").attr("class", "legend");
-    BC.legendRequests = BC.legend.append("g")
-      .attr("class", "legend-requests")
-      .style("opacity", 0)
-      .attr("transform", function(d) { return "translate(" + legendCoords1 + ")"; });
-    BC.legendRequests
-      .append("circle")
-      .attr('cx', -8)
-      .attr('cy', -4)
-      .attr("r", 4)
-      .attr("class", "bike-request-point");
-    BC.legendRequests
-      .append("text")
-      .attr('class', 'legend-text')
-      .text("Complaint about missing bike lanes");
-    BC.legendCrashes = BC.legend.append("g")
-      .attr("class", "legend-crashes")
-      .style("opacity", 0)
-      .attr("transform", function(d) { return "translate(" + legendCoords2 + ")"; });
-    BC.legendCrashes
-      .append("circle")
-      .attr('cx', -8)
-      .attr('cy', -4)
-      .attr("r", 4)
-      .attr("class", "bike-crash");
-    BC.legendCrashes.append("text")
-      .attr('class', 'legend-text')
-      .text("Bike crash involving 911");
+
+    BC.bikeRequests = BC.bikeRequestsContainer.selectAll("g");
   },
-  
-  drawCrashes: function(data) {
-    BC.crashes = svg.append("g").attr("class", "crashes").style("opacity", 0);
-    BC.crashes.selectAll("circle")
-      .data(data)
-      .enter()
+
+  // One circle per bin, its area growing with the number of crashes up to
+  // the size of the hexagon. Radii are in map units, so they're divided by
+  // the scale the map is drawn at.
+  drawCrashes: function(data, scale) {
+    if (!BC.crashes) {
+      BC.crashes = svg.append("g").attr("class", "crashes").style("opacity", 0);
+    }
+    var circles = BC.crashes.selectAll("circle").data(data);
+    circles.exit().remove();
+    circles.enter()
       .append("circle")
       .attr('class', 'bike-crash')
+    .merge(circles)
       .attr("transform", function(d) { return "translate(" + window.projection([+d['long'], +d['lat']]) + ")";})
-      .attr("r", function(d) { return 1.5; })
-      // .attr("stroke", function(d, i) { return "#f00"; })
+      .attr("r", function(d) { return Math.min(BC.CRASH_BIN_RADIUS, 1.5 * Math.sqrt(d.count)) / scale; })
     ;
-      // console.log(['draw crashes', BC.crashes.selectAll('circle')]);
   }
 };
 
@@ -471,10 +593,68 @@ function hideCrashData() {
 }
 
 function zoomOut() {
+  BC.showWholeMapLayers();
+  BC.loadCrashBins(1);
   _.defer(zoom, 1, 0);
   highlightBikeRequests(false);
 }
 
+// Read newline-delimited JSON from url as it downloads, handing each batch
+// of parsed records to onRecords. If that returns false the rest of the
+// download is cancelled. onDone is called at the end either way.
+function streamRecords(url, onRecords, onDone) {
+  fetch(url).then(function(response) {
+    var reader = response.body.getReader();
+    var decoder = new TextDecoder();
+    var partial = "";
+
+    function read() {
+      return reader.read().then(function(result) {
+        var text = partial + decoder.decode(result.value || new Uint8Array(), {stream: !result.done});
+        var lines = text.split("\n");
+        partial = result.done ? "" : lines.pop();
+        var records = _.map(_.compact(lines), JSON.parse);
+        if (records.length && onRecords(records) === false) {
+          reader.cancel();
+          return;
+        }
+        if (!result.done) return read();
+      });
+    }
+    return read();
+  }).catch(function(error) {
+    console.log(['stream failed', url, error]);
+  }).then(onDone);
+}
+
+// The [west, south, east, north] the map shows once zoom(scale, center) is
+// done.
+function viewBounds(scale, center) {
+  var coords = window.projection([+center[0]+.015, +center[1]]);
+  var dx = BC.width / 2 / scale;
+  var dy = BC.height / 2 / scale;
+  var topLeft = window.projection.invert([coords[0] - dx, coords[1] - dy]);
+  var bottomRight = window.projection.invert([coords[0] + dx, coords[1] + dy]);
+  return [topLeft[0], bottomRight[1], bottomRight[0], topLeft[1]];
+}
+
+// The [z, x, y] of every Web Mercator tile at zoom z that overlaps bounds.
+function tilesCovering(bounds, z) {
+  var n = Math.pow(2, z);
+  var column = function(longitude) { return Math.floor((longitude + 180) / 360 * n); };
+  var row = function(latitude) {
+    var radians = latitude * Math.PI / 180;
+    return Math.floor((1 - Math.log(Math.tan(radians) + 1 / Math.cos(radians)) / Math.PI) / 2 * n);
+  };
+  var tiles = [];
+  for (var x = column(bounds[0]); x <= column(bounds[2]); x++) {
+    for (var y = row(bounds[3]); y <= row(bounds[1]); y++) {
+      tiles.push([z, x, y]);
+    }
+  }
+  return tiles;
+}
+
 function zoom(scale, center) {
   var coords = center ? window.projection([+center[0]+.015, +center[1]]) : [BC.width/2, BC.height/2];
   // console.log(['zoom coords', coords]);
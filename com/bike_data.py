@@ -0,0 +1,487 @@
+import csv
+import io
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+
+# Five decimal places of a degree is about a metre, far finer than a
+# 1.5px dot on the map.
+COORDINATE_PLACES = 5
+
+
+def coordinate(value):
+    return ("%.*f" % (COORDINATE_PLACES, float(value))).rstrip("0").rstrip(".")
+
+
+class Dataset:
+    """
+    A pre-filtered, column-pruned copy of one of the Boston bikes CSVs,
+    holding only the rows and columns bikes/bike_crashes.js draws.
+
+    `columns` maps each output column to the source column it's read from
+    and a function that formats the value compactly.
+    """
+
+    def __init__(self, source, keep, columns):
+        self.source = source
+        self.keep = keep
+        self.columns = columns
+
+    def source_path(self, data_dir):
+        return os.path.join(data_dir, self.source)
+
+    def rows(self, data_dir):
+        """
+        The kept rows, as lists of formatted values in `columns` order.
+        """
+        # utf-8-sig: Vision_Zero_Entry.csv starts with a byte order mark.
+        with open(self.source_path(data_dir), newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                if not self.keep(row):
+                    continue
+                try:
+                    yield [convert(row[column]) for column, convert in self.columns.values()]
+                except ValueError:
+                    # No coordinates, nothing to draw.
+                    continue
+
+    def build(self, data_dir):
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator="\n")
+        writer.writerow(self.columns)
+        writer.writerows(self.rows(data_dir))
+        return output.getvalue()
+
+
+DATASETS = {
+    "bike-crashes": Dataset(
+        "crashopendata.csv",
+        keep=lambda row: row["mode_type"] == "bike",
+        columns={"lat": ("lat", coordinate), "long": ("long", coordinate)},
+    ),
+    "bike-requests": Dataset(
+        "Vision_Zero_Entry.csv",
+        keep=lambda row: "bike" in row["REQUESTTYPE"],
+        columns={"X": ("X", coordinate), "Y": ("Y", coordinate)},
+    ),
+}
+
+
+def dataset_filename(name):
+    return "%s.csv" % name
+
+
+# Map layers the bikes page draws, served as TopoJSON at each zoom it uses.
+MAP_LAYERS = {
+    "neighborhoods": "neighborhoods.js",
+    "open-space": "Open_Space.geojson",
+    "bike-network": "Existing_Bike_Network.geojson",
+}
+
+# The SVG scales bike_crashes.js draws whole layers at, and about how many
+# degrees one pixel covers at each. Anything finer than that is invisible,
+# so it's simplified away. Zoomed in to a street (scale 4), the page loads
+# only the tiles in view instead.
+MAP_ZOOMS = {1: 2e-4}
+
+
+def map_layer_filename(name, zoom):
+    return "%s-z%s.json" % (name, zoom)
+
+
+def map_layer_source_path(name, data_dir):
+    return os.path.join(data_dir, MAP_LAYERS[name])
+
+
+def build_map_layer(name, zoom, data_dir):
+    from com.geo import TopologyBuilder, dumps, load_geojson
+
+    pixel = MAP_ZOOMS[zoom]
+    features = load_geojson(map_layer_source_path(name, data_dir))["features"]
+    builder = TopologyBuilder(step=pixel / 8, tolerance=pixel / 2, min_area=pixel * pixel)
+    return dumps(builder.build(name, features))
+
+
+def point_feature(longitude, latitude):
+    return {
+        "type": "Feature",
+        "properties": {},
+        "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+    }
+
+
+def load_geojson_features(path):
+    from com.geo import load_geojson
+
+    return load_geojson(path)["features"]
+
+
+def load_bike_racks(path):
+    from com.geo import load_geojson
+
+    # A geocoder export rather than GeoJSON, with positions in "ln" and "lt".
+    return [point_feature(rack["ln"], rack["lt"]) for rack in load_geojson(path)["features"]]
+
+
+def load_bike_crashes(path):
+    dataset = DATASETS["bike-crashes"]
+    return [
+        point_feature(float(longitude), float(latitude))
+        for latitude, longitude in dataset.rows(os.path.dirname(path))
+    ]
+
+
+# Layers served a tile at a time, by source file and how to read it.
+TILE_LAYERS = {
+    "neighborhoods": (MAP_LAYERS["neighborhoods"], load_geojson_features),
+    "open-space": (MAP_LAYERS["open-space"], load_geojson_features),
+    "bike-network": (MAP_LAYERS["bike-network"], load_geojson_features),
+    "bike-racks": ("bike_racks.js", load_bike_racks),
+    "hubway-stations": ("Hubway_Stations.geojson", load_geojson_features),
+    "bike-crashes": (DATASETS["bike-crashes"].source, load_bike_crashes),
+}
+
+# Web Mercator tiles, simplified for 512px across, like vector map tiles.
+TILE_SIZE = 512
+TILE_ZOOMS = range(10, 19)
+
+# The tile index grid, in degrees. About a kilometre.
+TILE_INDEX_CELL = 0.01
+
+# Rendered tiles each process keeps per layer, and bin counts per source.
+# Zooms 10-18 come to thousands of tiles, and the breakdowns to thousands of
+# filter combinations, too many for the shared cache to hold alongside the
+# rest of the site.
+TILE_CACHE_SIZE = 256
+
+_tile_indexes = {}
+_tile_indexes_lock = threading.Lock()
+
+
+def _least_recently_used(rendered, lock, key, render):
+    """
+    rendered[key], or render() kept there, in an OrderedDict that drops
+    whatever was used longest ago past TILE_CACHE_SIZE entries.
+    """
+    with lock:
+        if key in rendered:
+            rendered.move_to_end(key)
+            return rendered[key]
+    value = render()
+    with lock:
+        rendered[key] = value
+        while len(rendered) > TILE_CACHE_SIZE:
+            rendered.popitem(last=False)
+    return value
+
+
+class TileIndex:
+    """
+    One layer's features and a grid index over their bounds, built once per
+    process and version of the source file.
+    """
+
+    def __init__(self, name, data_dir):
+        from com.geo import GridIndex, feature_bounds
+
+        source, load = TILE_LAYERS[name]
+        path = os.path.join(data_dir, source)
+        self.name = name
+        self.generation = os.path.getmtime(path)
+        # Tiles don't carry properties, so don't keep them around either.
+        self.features = [
+            {"id": i, "geometry": feature.get("geometry")} for i, feature in enumerate(load(path))
+        ]
+        self.grid = GridIndex(feature_bounds(self.features), TILE_INDEX_CELL)
+        self.rendered = OrderedDict()
+        self.lock = threading.Lock()
+
+    def rendered_tile(self, z, x, y, render):
+        """
+        render(self.tile(z, x, y)), kept in an LRU of the last
+        TILE_CACHE_SIZE tiles, which goes with the index when the source
+        file changes.
+        """
+        return _least_recently_used(self.rendered, self.lock, (z, x, y), lambda: render(self.tile(z, x, y)))
+
+    def tile(self, z, x, y):
+        """
+        The features touching tile z/x/y as TopoJSON, whole rather than
+        clipped, each with its "id" so the client can drop duplicates from
+        neighbouring tiles.
+        """
+        from com.geo import TopologyBuilder, dumps
+
+        pixel = 360 / TILE_SIZE / 2**z
+        features = [self.features[i] for i in self.grid.query(*tile_bounds(z, x, y))]
+        builder = TopologyBuilder(step=pixel / 8, tolerance=pixel / 2, min_area=pixel * pixel)
+        return dumps(builder.build(self.name, features))
+
+
+def _per_process(registry, lock, cls, name, data_dir, path):
+    """
+    The `cls` instance for `name` in `registry`, built again if the source
+    file at `path` has changed since.
+    """
+    instance = registry.get((name, data_dir))
+    if instance is not None and instance.generation == os.path.getmtime(path):
+        return instance
+    with lock:
+        instance = registry.get((name, data_dir))
+        if instance is None or instance.generation != os.path.getmtime(path):
+            instance = registry[name, data_dir] = cls(name, data_dir)
+        return instance
+
+
+def tile_index(name, data_dir):
+    """
+    The TileIndex for layer `name`, rebuilt if its source file has changed.
+    """
+    path = os.path.join(data_dir, TILE_LAYERS[name][0])
+    return _per_process(_tile_indexes, _tile_indexes_lock, TileIndex, name, data_dir, path)
+
+
+def tile_bounds(z, x, y):
+    """
+    (west, south, east, north) of Web Mercator tile z/x/y, in degrees.
+    """
+    n = 2**z
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def year(value):
+    return value[:4]
+
+
+def request_type(value):
+    # A few early requests kept the HTML of the form's icon before the type.
+    return value.rpartition("&nbsp;")[2]
+
+
+class BinSource:
+    """
+    Where the points binned for one of the bikes page's aggregate layers
+    come from: the source CSV, its coordinate columns, and the columns each
+    bin is broken down by, with a function cleaning up their values.
+    """
+
+    def __init__(self, source, longitude, latitude, dimensions):
+        self.source = source
+        self.longitude = longitude
+        self.latitude = latitude
+        self.dimensions = dimensions
+
+    def source_path(self, data_dir):
+        return os.path.join(data_dir, self.source)
+
+
+BIN_SOURCES = {
+    "crashes": BinSource(
+        "crashopendata.csv",
+        longitude="long",
+        latitude="lat",
+        dimensions={
+            "mode_type": ("mode_type", str),
+            "location_type": ("location_type", str),
+            "year": ("dispatch_ts", year),
+        },
+    ),
+    "requests": BinSource(
+        "Vision_Zero_Entry.csv",
+        longitude="X",
+        latitude="Y",
+        dimensions={
+            "user_type": ("USERTYPE", str),
+            "request_type": ("REQUESTTYPE", request_type),
+            "year": ("REQUESTDATE", year),
+        },
+    ),
+}
+
+# Degrees per pixel at each SVG scale bike_crashes.js draws bins at, like
+# MAP_ZOOMS, and the size of a bin in pixels: the radius of a hexagon, the
+# side of a square.
+BIN_ZOOMS = {1: 2e-4, 4: 5e-5}
+BIN_PIXELS = {"hex": 6, "grid": 10}
+
+_crash_bins = {}
+_crash_bins_lock = threading.Lock()
+
+
+class CrashBins:
+    """
+    One BinSource's points, loaded once per process and version of the
+    source file, and counted into every kind of bin at every zoom. Counts
+    of a subset (only bike crashes, say) are worked out the first time
+    they're asked for and kept, up to TILE_CACHE_SIZE of them.
+    """
+
+    def __init__(self, name, data_dir):
+        import numpy as np
+
+        source = BIN_SOURCES[name]
+        path = source.source_path(data_dir)
+        self.generation = os.path.getmtime(path)
+
+        longitudes, latitudes, values = [], [], {dimension: [] for dimension in source.dimensions}
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                try:
+                    longitude, latitude = float(row[source.longitude]), float(row[source.latitude])
+                except ValueError:
+                    continue
+                longitudes.append(longitude)
+                latitudes.append(latitude)
+                for dimension, (column, clean) in source.dimensions.items():
+                    values[dimension].append(clean(row[column]))
+
+        self.longitudes = np.array(longitudes)
+        self.latitudes = np.array(latitudes)
+        # Labels in sorted order, and each point's index into them.
+        self.dimensions = {
+            dimension: np.unique(np.array(column, dtype=str), return_inverse=True)
+            for dimension, column in values.items()
+        }
+        self.rendered = OrderedDict()
+        self.lock = threading.Lock()
+        for kind in BIN_PIXELS:
+            for zoom in BIN_ZOOMS:
+                self.rendered[kind, zoom, ()] = self.render(kind, zoom, ())
+
+    def render(self, kind, zoom, filters):
+        from com.binning import aggregate
+        from com.variants import RenderedVariant
+
+        mask = self.mask(filters)
+        size = BIN_ZOOMS[zoom] * BIN_PIXELS[kind]
+        dimensions = {
+            dimension: (labels.tolist(), codes[mask])
+            for dimension, (labels, codes) in self.dimensions.items()
+        }
+        result = aggregate(self.longitudes[mask], self.latitudes[mask], kind, size, dimensions)
+        result["zoom"] = zoom
+        result["filters"] = dict(filters)
+        return RenderedVariant(json.dumps(result, separators=(",", ":")))
+
+    def mask(self, filters):
+        """
+        Which points have every (dimension, label) in `filters`. Raises
+        KeyError for a dimension or label that isn't there.
+        """
+        import numpy as np
+
+        mask = np.ones(len(self.longitudes), dtype=bool)
+        for dimension, label in filters:
+            labels, codes = self.dimensions[dimension]
+            index = np.searchsorted(labels, label)
+            if index == len(labels) or labels[index] != label:
+                raise KeyError(label)
+            mask &= codes == index
+        return mask
+
+    def variant(self, kind, zoom, filters):
+        """
+        The RenderedVariant of the bins of `kind` at `zoom`, counting only
+        the points matching `filters`, a dict of dimension to label. Keys
+        that aren't dimensions, like a utm_source, are left out.
+        """
+        filters = tuple(sorted((key, label) for key, label in filters.items() if key in self.dimensions))
+        return _least_recently_used(
+            self.rendered, self.lock, (kind, zoom, filters), lambda: self.render(kind, zoom, filters)
+        )
+
+
+def crash_bins(name, data_dir):
+    """
+    The CrashBins for BIN_SOURCES `name`, rebuilt if its source file has
+    changed.
+    """
+    path = BIN_SOURCES[name].source_path(data_dir)
+    return _per_process(_crash_bins, _crash_bins_lock, CrashBins, name, data_dir, path)
+
+
+# Records per chunk of a RecordStream: small enough that the first chunk
+# arrives at once, big enough not to flush after every line.
+STREAM_CHUNK_RECORDS = 256
+
+
+def rounded_coordinate(value):
+    return round(float(value), COORDINATE_PLACES)
+
+
+class RecordStream:
+    """
+    All of one of the Boston bikes CSVs as newline-delimited JSON, one
+    object per row holding `fields`, in the same form as Dataset.columns.
+    Rows passing `first` come before the rest, so a client can draw the
+    ones it cares about most before the download finishes.
+
+    The file is read twice, a row at a time, rather than sorted in memory.
+    """
+
+    def __init__(self, source, first, fields):
+        self.source = source
+        self.first = first
+        self.fields = fields
+
+    def source_path(self, data_dir):
+        return os.path.join(data_dir, self.source)
+
+    def rows(self, data_dir):
+        with open(self.source_path(data_dir), newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+
+    def records(self, data_dir):
+        for wanted in (True, False):
+            for row in self.rows(data_dir):
+                if bool(self.first(row)) != wanted:
+                    continue
+                try:
+                    yield {field: convert(row[column]) for field, (column, convert) in self.fields.items()}
+                except ValueError:
+                    continue
+
+    def chunks(self, data_dir, size=STREAM_CHUNK_RECORDS):
+        """
+        The NDJSON, encoded, `size` records to a chunk.
+        """
+        lines = []
+        for record in self.records(data_dir):
+            lines.append(json.dumps(record, separators=(",", ":")))
+            if len(lines) == size:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                lines = []
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+RECORD_STREAMS = {
+    "crashes": RecordStream(
+        "crashopendata.csv",
+        first=lambda row: row["mode_type"] == "bike",
+        fields={
+            "lat": ("lat", rounded_coordinate),
+            "long": ("long", rounded_coordinate),
+            "mode_type": ("mode_type", str),
+            "location_type": ("location_type", str),
+            "date": ("dispatch_ts", str),
+        },
+    ),
+    "requests": RecordStream(
+        "Vision_Zero_Entry.csv",
+        first=lambda row: "bike" in row["REQUESTTYPE"],
+        fields={
+            "X": ("X", rounded_coordinate),
+            "Y": ("Y", rounded_coordinate),
+            "request_type": ("REQUESTTYPE", request_type),
+            "user_type": ("USERTYPE", str),
+            "date": ("REQUESTDATE", str),
+        },
+    ),
+}
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache as default_cache
+
+
+class CacheLock:
+    """
+    A lease lock held in the Django cache, so it is shared by every worker
+    that talks to the same cache. It is taken with cache.add(), which only
+    succeeds when the key is missing, and it expires on its own after
+    `lease` seconds in case the holder dies without releasing it.
+
+    The cache has no compare-and-delete, so release() checks the token and
+    then deletes: if the lease ran out between the two, it would delete the
+    lock of whoever took it next. A lock with less than `release_margin`
+    seconds of its lease left is therefore left to expire instead.
+    """
+
+    release_margin = 1
+
+    def __init__(self, key, lease=60, cache=None):
+        self.key = "%s:lock" % key
+        self.lease = lease
+        self.cache = cache or default_cache
+        self.token = None
+        self.acquired_at = None
+
+    def acquire(self):
+        token = uuid.uuid4().hex
+        acquired_at = time.monotonic()
+        if self.cache.add(self.key, token, self.lease):
+            self.token = token
+            self.acquired_at = acquired_at
+            return True
+        return False
+
+    def release(self):
+        # Only drop the lock if the lease hasn't run out and gone to someone else.
+        expires_at = (self.acquired_at or 0) + self.lease
+        if (
+            self.token
+            and time.monotonic() < expires_at - self.release_margin
+            and self.cache.get(self.key) == self.token
+        ):
+            self.cache.delete(self.key)
+        self.token = None
+        self.acquired_at = None
+
+    def locked(self):
+        return self.cache.get(self.key) is not None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        if self.token:
+            self.release()
+
+
+def single_flight(key, compute, timeout, lease=60, wait=5, poll_interval=0.05, stale=None, cache=None):
+    """
+    Return the cached value for `key`, calling compute() to fill it if it's
+    missing. Only one caller across all workers computes at a time; the rest
+    poll the cache for up to `wait` seconds, then return `stale` if given or
+    compute it themselves.
+
+    compute() must not return None, since None reads as a cache miss.
+    """
+    cache = cache or default_cache
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock = CacheLock(key, lease=lease, cache=cache)
+    if lock.acquire():
+        try:
+            # Someone may have filled it between our get and our add.
+            value = cache.get(key)
+            if value is None:
+                value = compute()
+                cache.set(key, value, timeout)
+            return value
+        finally:
+            lock.release()
+
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        time.sleep(poll_interval)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if not lock.locked():
+            break
+
+    if stale is not None:
+        logging.debug(" ---> Gave up waiting on %s, serving stale." % key)
+        return stale
+
+    logging.debug(" ---> Gave up waiting on %s, computing it ourselves." % key)
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
+
+
+async def aget(key, default=None, cache=None):
+    """
+    cache.get() for async code. Django 3.2's caches have no async methods
+    (4.0 adds them, done the same way): the call runs in the thread Django
+    keeps for sync code, where the DatabaseCache's connection lives.
+    """
+    return await sync_to_async((cache or default_cache).get)(key, default)
+
+
+async def aset(key, value, timeout, cache=None):
+    await sync_to_async((cache or default_cache).set)(key, value, timeout)
+
+
+async def asingle_flight(key, compute, timeout, lease=60, wait=5, poll_interval=0.05, stale=None, cache=None):
+    """
+    single_flight() for async code, where compute is a coroutine function.
+    Callers waiting on another's compute() sleep without holding a thread.
+    """
+    cache = cache or default_cache
+    value = await aget(key, cache=cache)
+    if value is not None:
+        return value
+
+    lock = CacheLock(key, lease=lease, cache=cache)
+    if await sync_to_async(lock.acquire)():
+        try:
+            value = await aget(key, cache=cache)
+            if value is None:
+                value = await compute()
+                await aset(key, value, timeout, cache=cache)
+            return value
+        finally:
+            await sync_to_async(lock.release)()
+
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        await asyncio.sleep(poll_interval)
+        value = await aget(key, cache=cache)
+        if value is not None:
+            return value
+        if not await sync_to_async(lock.locked)():
+            break
+
+    if stale is not None:
+        logging.debug(" ---> Gave up waiting on %s, serving stale." % key)
+        return stale
+
+    logging.debug(" ---> Gave up waiting on %s, computing it ourselves." % key)
+    value = await compute()
+    await aset(key, value, timeout, cache=cache)
+    return value
@@ -0,0 +1,352 @@
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from com import timing
+from com.cache_stats import CacheStats
+
+# One local tier per process, shared by the per-thread backend instances
+# that django.core.cache.caches hands out.
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+_any_generation = object()
+
+
+class LocalTier:
+    """
+    A size-bounded LRU of pickled values with per-entry expiry times.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.generation = None
+        self.checked_at = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, pickled = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return pickled
+
+    def set(self, key, pickled, expires_at, generation=_any_generation):
+        """
+        Store `pickled` under `key`. With a `generation`, only if the tier is
+        still on it: a value read from the shared cache before a write in
+        another thread mustn't replace what that write left here.
+        """
+        if len(pickled) > self.max_entry_bytes:
+            self.delete(key)
+            return
+        with self.lock:
+            if generation is not _any_generation and generation != self.generation:
+                return
+            self._pop(key)
+            self.entries[key] = (expires_at, pickled)
+            self.size += len(pickled)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class TwoTierCache(BaseCache):
+    """
+    Puts a per-process LRU in front of another configured cache, so repeated
+    reads skip the shared backend (and, for the DatabaseCache, a SQL query).
+
+    LOCATION names the cache alias to wrap. Local entries live for at most
+    LOCAL_TIMEOUT seconds. Every write through any worker bumps a generation
+    key in the shared cache; each process checks it at most once every
+    CHECK_INTERVAL seconds and drops its local tier when it has moved.
+
+        CACHES = {
+            "default": {
+                "BACKEND": "com.cache_backends.TwoTierCache",
+                "LOCATION": "shared",
+                "OPTIONS": {"MAX_BYTES": 16 * 1024 * 1024},
+            },
+            "shared": {...},
+        }
+    """
+
+    generation_key = "twotier:generation"
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    # Keys that skip the local tier: CacheLock's leases are taken and
+    # released on every fill, and each write here would otherwise empty
+    # every worker's local tier.
+    shared_only_suffixes = (":lock",)
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.shared_alias = location
+        self.local_timeout = options.get("LOCAL_TIMEOUT", 60)
+        self.check_interval = options.get("CHECK_INTERVAL", 1)
+        max_bytes = options.get("MAX_BYTES", 16 * 1024 * 1024)
+        max_entry_bytes = options.get("MAX_ENTRY_BYTES", max_bytes // 8)
+        with _local_tiers_lock:
+            if location not in _local_tiers:
+                _local_tiers[location] = LocalTier(max_bytes, max_entry_bytes)
+            self.local = _local_tiers[location]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _local_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _local_expiry(self, timeout=None):
+        """
+        Local entries never outlive LOCAL_TIMEOUT, nor the shared entry's own
+        timeout when we know it.
+        """
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.shared.default_timeout
+        if timeout is None:
+            timeout = self.local_timeout
+        return time.time() + min(timeout, self.local_timeout)
+
+    def _shared_only(self, key):
+        return key.endswith(self.shared_only_suffixes)
+
+    def _sync(self, force=False):
+        """
+        Drop the local tier if another worker has written to the shared cache
+        since we last looked.
+        """
+        now = time.time()
+        if not force and now - self.local.checked_at < self.check_interval:
+            return
+        generation = self.shared.get(self.generation_key)
+        if generation != self.local.generation:
+            self.local.generation = generation
+            self.local.clear()
+        self.local.checked_at = now
+
+    def _invalidate(self, local_key):
+        # Catch up with other workers' writes before moving on to our own
+        # generation, or our copies of what they wrote would look current.
+        self._sync(force=True)
+        generation = uuid.uuid4().hex
+        self.shared.set(self.generation_key, generation, None)
+        # Move the generation on before deleting, so a get() that read the
+        # old value either sees the new generation or has its copy deleted.
+        self.local.generation = generation
+        self.local.delete(local_key)
+        return generation
+
+    def get(self, key, default=None, version=None):
+        value, _ = self.get_with_size(key, version=version)
+        return default if value is None else value
+
+    def get_with_size(self, key, version=None):
+        """
+        get(), along with the size of the value pickled, which the local tier
+        has anyway (0 on a miss, or for a key that skips the local tier).
+        InstrumentedCache counts the bytes read with it.
+        """
+        if self._shared_only(key):
+            return self.shared.get(key, version=version), 0
+        local_key = self._local_key(key, version)
+        self._sync()
+        pickled = self.local.get(local_key)
+        if pickled is not None:
+            return pickle.loads(pickled), len(pickled)
+
+        generation = self.local.generation
+        value = self.shared.get(key, version=version)
+        if value is None:
+            return None, 0
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        self.local.set(local_key, pickled, self._local_expiry(), generation)
+        return value, len(pickled)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_with_size(key, value, timeout, version=version)
+
+    def set_with_size(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        set(), returning the size of the value pickled for the local tier
+        (0 for a key that skips it), as get_with_size() does for reads.
+        """
+        if self._shared_only(key):
+            self.shared.set(key, value, timeout, version=version)
+            return 0
+        local_key = self._local_key(key, version)
+        self.shared.set(key, value, timeout, version=version)
+        generation = self._invalidate(local_key)
+        if timeout is not None and timeout is not DEFAULT_TIMEOUT and timeout <= 0:
+            return 0
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        self.local.set(local_key, pickled, self._local_expiry(timeout), generation)
+        return len(pickled)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._shared_only(key):
+            return self.shared.add(key, value, timeout, version=version)
+        local_key = self._local_key(key, version)
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._invalidate(local_key)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        self.local.delete(local_key)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        if self._shared_only(key):
+            return self.shared.delete(key, version=version)
+        local_key = self._local_key(key, version)
+        deleted = self.shared.delete(key, version=version)
+        self._invalidate(local_key)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self._local_key(key, version)
+        value = self.shared.incr(key, delta, version=version)
+        self._invalidate(local_key)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+        self.local.checked_at = 0
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+_process_stats = {}
+_process_stats_lock = threading.Lock()
+
+
+def _reset_process_stats():
+    for stats in _process_stats.values():
+        stats.reset()
+
+
+# gunicorn's preload_app forks workers from a master that has already used
+# the cache; each worker counts for itself, under its own pid.
+os.register_at_fork(after_in_child=_reset_process_stats)
+
+
+class InstrumentedCache(BaseCache):
+    """
+    Counts hits, misses, sets, bytes and latency per key prefix for whatever
+    cache alias LOCATION names, and otherwise passes every call through.
+    Bytes are only counted when the wrapped cache reports them, as
+    TwoTierCache's get_with_size() and set_with_size() do: pickling every
+    value once more just to measure it would cost as much as the call.
+
+    Each process flushes its counters to STATS_LOCATION (an alias, defaulting
+    to LOCATION) every FLUSH_INTERVAL seconds, where `manage.py cache_stats`
+    and the cache stats view read them back.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.wrapped_alias = location
+        self.stats_alias = options.get("STATS_LOCATION", location)
+        with _process_stats_lock:
+            if location not in _process_stats:
+                _process_stats[location] = CacheStats(options.get("FLUSH_INTERVAL", 10))
+            self.stats = _process_stats[location]
+
+    @property
+    def wrapped(self):
+        return caches[self.wrapped_alias]
+
+    @property
+    def stats_cache(self):
+        return caches[self.stats_alias]
+
+    def _record(self, op, key, started, hit=None, nbytes=0):
+        seconds = time.perf_counter() - started
+        timing.record("cache-%s" % op, seconds)
+        self.stats.record(op, key, seconds, hit=hit, nbytes=nbytes)
+        self.stats.maybe_flush(self.stats_cache)
+
+    def get(self, key, default=None, version=None):
+        started = time.perf_counter()
+        wrapped = self.wrapped
+        if hasattr(wrapped, "get_with_size"):
+            value, nbytes = wrapped.get_with_size(key, version=version)
+        else:
+            value, nbytes = wrapped.get(key, version=version), 0
+        self._record("get", key, started, hit=value is not None, nbytes=nbytes)
+        return default if value is None else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        wrapped = self.wrapped
+        if hasattr(wrapped, "set_with_size"):
+            nbytes = wrapped.set_with_size(key, value, timeout, version=version)
+        else:
+            wrapped.set(key, value, timeout, version=version)
+            nbytes = 0
+        self._record("set", key, started, nbytes=nbytes)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        added = self.wrapped.add(key, value, timeout, version=version)
+        self._record("add", key, started)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.wrapped.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        started = time.perf_counter()
+        deleted = self.wrapped.delete(key, version=version)
+        self._record("delete", key, started)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        return self.wrapped.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        return self.wrapped.has_key(key, version=version)
+
+    def clear(self):
+        self.wrapped.clear()
+
+    def close(self, **kwargs):
+        self.wrapped.close(**kwargs)
@@ -0,0 +1,169 @@
+import os
+import socket
+import threading
+import time
+
+# Upper bounds, in milliseconds, of the latency histogram buckets. The last
+# bucket catches everything slower.
+LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, float("inf"))
+
+STATS_INDEX_KEY = "cache_stats:processes"
+STATS_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def key_prefix(key):
+    """
+    Group keys by the part before the first colon, so "blog_entries" and
+    "blog_entries:lock" are reported together.
+    """
+    return str(key).split(":", 1)[0]
+
+
+def empty_prefix_stats():
+    return {
+        "hits": 0,
+        "misses": 0,
+        "sets": 0,
+        "deletes": 0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+        "latency": {},
+    }
+
+
+class CacheStats:
+    """
+    Per-process counters for one instrumented cache, grouped by key prefix.
+    Snapshots are written to a shared cache every `flush_interval` seconds
+    so any process can read the totals for every worker.
+    """
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+        self.reset()
+
+    def reset(self):
+        """
+        Start counting afresh, as this process: a process forked from
+        another starts with its parent's counters and key.
+        """
+        self.prefixes = {}
+        self.started_at = time.time()
+        self.flushed_at = 0
+        self.lock = threading.Lock()
+        self.process_key = "cache_stats:%s:%s" % (socket.gethostname(), os.getpid())
+
+    def discard(self, cache):
+        """
+        Forget this process's counters, and the snapshot of them already
+        flushed to `cache`.
+        """
+        cache.delete(self.process_key)
+        self.reset()
+
+    def record(self, op, key, seconds, hit=None, nbytes=0):
+        ms = seconds * 1000
+        bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS) if ms <= bound)
+        with self.lock:
+            stats = self.prefixes.setdefault(key_prefix(key), empty_prefix_stats())
+            histogram = stats["latency"].setdefault(op, [0] * len(LATENCY_BUCKETS))
+            histogram[bucket] += 1
+            if op == "get":
+                stats["hits" if hit else "misses"] += 1
+                stats["bytes_read"] += nbytes
+            elif op in ("set", "add"):
+                stats["sets"] += 1
+                stats["bytes_written"] += nbytes
+            elif op == "delete":
+                stats["deletes"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "process": self.process_key,
+                "started_at": self.started_at,
+                "updated_at": time.time(),
+                "prefixes": {
+                    prefix: dict(stats, latency={op: list(h) for op, h in stats["latency"].items()})
+                    for prefix, stats in self.prefixes.items()
+                },
+            }
+
+    def maybe_flush(self, cache):
+        if time.time() - self.flushed_at < self.flush_interval:
+            return
+        self.flush(cache)
+
+    def flush(self, cache):
+        self.flushed_at = time.time()
+        cache.set(self.process_key, self.snapshot(), STATS_TIMEOUT)
+        processes = cache.get(STATS_INDEX_KEY) or []
+        if self.process_key not in processes:
+            # Forget processes whose snapshots have expired while we're here.
+            processes = list(cache.get_many(processes)) + [self.process_key]
+            cache.set(STATS_INDEX_KEY, processes, STATS_TIMEOUT)
+
+
+def load_stats(cache):
+    """
+    Merge the latest snapshot from every process into one report.
+    """
+    processes = cache.get(STATS_INDEX_KEY) or []
+    snapshots = cache.get_many(processes)
+    merged = {}
+    for snapshot in snapshots.values():
+        for prefix, stats in snapshot["prefixes"].items():
+            total = merged.setdefault(prefix, empty_prefix_stats())
+            for field in ("hits", "misses", "sets", "deletes", "bytes_read", "bytes_written"):
+                total[field] += stats[field]
+            for op, histogram in stats["latency"].items():
+                total_histogram = total["latency"].setdefault(op, [0] * len(LATENCY_BUCKETS))
+                for i, count in enumerate(histogram):
+                    total_histogram[i] += count
+
+    for stats in merged.values():
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else None
+        stats["latency_ms"] = {op: summarize_histogram(h) for op, h in stats["latency"].items()}
+
+    return {
+        "processes": sorted(snapshots),
+        "buckets_ms": [str(bound) for bound in LATENCY_BUCKETS],
+        "prefixes": merged,
+    }
+
+
+def clear_stats(cache):
+    cache.delete_many(cache.get(STATS_INDEX_KEY) or [])
+    cache.delete(STATS_INDEX_KEY)
+
+
+def summarize_histogram(histogram):
+    """
+    Approximate percentiles as the upper bound of the bucket they land in.
+    """
+    count = sum(histogram)
+    summary = {"count": count}
+    for name, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        summary[name] = None
+        if not count:
+            continue
+        running = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, histogram):
+            running += bucket_count
+            if running >= quantile * count:
+                summary[name] = bound if bound != float("inf") else ">%s" % LATENCY_BUCKETS[-2]
+                break
+    return summary
+
+
+def stats_report(backend):
+    """
+    Return the merged report for an InstrumentedCache, after flushing this
+    process's own counters, or None if the backend isn't instrumented.
+    """
+    stats = getattr(backend, "stats", None)
+    if not isinstance(stats, CacheStats):
+        return None
+    stats.flush(backend.stats_cache)
+    return load_stats(backend.stats_cache)
@@ -0,0 +1,382 @@
+"""
+GeoJSON to TopoJSON, simplified for one zoom level.
+
+Coordinates are quantized to a grid, lines and rings are cut wherever they
+meet another one differently (the junctions) so that shared borders become
+a single arc stored once, and each arc is simplified with Douglas-Peucker
+so neighbouring polygons keep meeting exactly.
+"""
+
+import json
+
+import numpy as np
+
+
+def load_geojson(path):
+    """
+    Read a GeoJSON file, including the ones wrapped in a script for a
+    <script> tag (`var neighborhoods_json = {...};`).
+    """
+    with open(path) as f:
+        text = f.read()
+    return json.loads(text[text.index("{") : text.rindex("}") + 1])
+
+
+def geometry_parts(geometry):
+    """
+    Split a geometry into (type, nested lists of coordinate lists). Points
+    are a list of positions, lines a list of lines, polygons a list of
+    polygons of rings.
+    """
+    kind, coordinates = geometry["type"], geometry["coordinates"]
+    if kind == "Point":
+        return "point", [coordinates]
+    if kind == "MultiPoint":
+        return "point", coordinates
+    if kind == "LineString":
+        return "line", [coordinates]
+    if kind == "MultiLineString":
+        return "line", coordinates
+    if kind == "Polygon":
+        return "polygon", [coordinates]
+    if kind == "MultiPolygon":
+        return "polygon", coordinates
+    raise ValueError("Unsupported geometry type: %s" % kind)
+
+
+def dedupe_consecutive(points):
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    return points[keep]
+
+
+def segment_distances(points, a, b):
+    """
+    Distance from each of `points` to the segment a-b.
+    """
+    points = points.astype(np.float64)
+    a, b = a.astype(np.float64), b.astype(np.float64)
+    ab = b - a
+    length = ab @ ab
+    if length == 0:
+        return np.hypot(*(points - a).T)
+    t = np.clip(((points - a) @ ab) / length, 0, 1)
+    return np.hypot(*(points - (a + t[:, None] * ab)).T)
+
+
+def simplify(points, tolerance):
+    """
+    Douglas-Peucker: keep the endpoints, then recursively the point farthest
+    from each kept segment while it's more than `tolerance` away.
+    """
+    if len(points) <= 2 or tolerance <= 0:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = segment_distances(points[start + 1 : end], points[start], points[end])
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            farthest += start + 1
+            keep[farthest] = True
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    return points[keep]
+
+
+def signed_area(points):
+    """
+    Shoelace area of a closed ring, positive when it winds anticlockwise.
+    """
+    x, y = points[:, 0].astype(np.float64), points[:, 1].astype(np.float64)
+    return (np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2
+
+
+def feature_bounds(features):
+    """
+    (west, south, east, north) of each feature, as an n x 4 array. Features
+    without a geometry get bounds no query will ever match.
+    """
+    bounds = np.full((len(features), 4), np.nan)
+    for i, feature in enumerate(features):
+        if not feature.get("geometry"):
+            continue
+        _, parts = geometry_parts(feature["geometry"])
+        coordinates = np.array(list(flatten_positions(parts)), dtype=np.float64)[:, :2]
+        bounds[i, :2] = coordinates.min(axis=0)
+        bounds[i, 2:] = coordinates.max(axis=0)
+    return bounds
+
+
+def flatten_positions(parts):
+    if isinstance(parts[0], (int, float)):
+        yield parts
+        return
+    for part in parts:
+        yield from flatten_positions(part)
+
+
+class GridIndex:
+    """
+    A uniform grid over feature bounding boxes. Each cell lists the features
+    whose bounds overlap it, so a bounding box query only tests the features
+    in the cells it covers.
+    """
+
+    def __init__(self, bounds, cell_size):
+        self.bounds = bounds
+        self.cell_size = cell_size
+        valid = ~np.isnan(bounds).any(axis=1)
+        self.origin = bounds[valid, :2].min(axis=0) if valid.any() else np.zeros(2)
+        cells = {}
+        first, last = self._cells(bounds[valid, :2]), self._cells(bounds[valid, 2:])
+        for i, (x0, y0), (x1, y1) in zip(np.flatnonzero(valid), first, last):
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    cells.setdefault((x, y), []).append(i)
+        self.cells = {cell: np.array(ids) for cell, ids in cells.items()}
+        self.extent = last.max(axis=0) if len(last) else np.zeros(2, dtype=np.int64)
+
+    def _cells(self, positions):
+        return np.floor((positions - self.origin) / self.cell_size).astype(np.int64)
+
+    def query(self, west, south, east, north):
+        """
+        Indexes of the features whose bounds intersect the box, in order.
+        """
+        # Clamped to the grid, so a query of the whole world isn't a loop over
+        # millions of empty cells.
+        (x0, y0), (x1, y1) = np.clip(self._cells(np.array([[west, south], [east, north]])), 0, self.extent)
+        candidates = [
+            self.cells[x, y] for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in self.cells
+        ]
+        if not candidates:
+            return np.array([], dtype=np.int64)
+        candidates = np.unique(np.concatenate(candidates))
+        bounds = self.bounds[candidates]
+        hits = (
+            (bounds[:, 0] <= east)
+            & (bounds[:, 2] >= west)
+            & (bounds[:, 1] <= north)
+            & (bounds[:, 3] >= south)
+        )
+        return candidates[hits]
+
+
+class TopologyBuilder:
+    """
+    Turns one layer of GeoJSON features into a quantized TopoJSON topology.
+
+    `step` is the quantization grid size and `tolerance` the simplification
+    tolerance, both in degrees. Rings smaller than `min_area` square degrees
+    after simplification are dropped, as are rings simplification turned
+    inside out (d3 would fill everything outside them), and with them any
+    polygon left without an outer ring.
+    """
+
+    def __init__(self, step, tolerance, min_area=0):
+        self.step = step
+        self.tolerance = tolerance / step
+        self.min_area = min_area / step / step
+
+    def build(self, name, features):
+        """
+        Features keep their "id", if they have one, and lose their
+        properties.
+        """
+        shapes = []
+        lines = []
+        points = []
+        for feature in features:
+            if not feature.get("geometry"):
+                continue
+            kind, parts = geometry_parts(feature["geometry"])
+            if kind == "point":
+                points.append(np.asarray(parts, dtype=np.float64)[:, :2])
+                parts = len(points) - 1
+            elif kind == "line":
+                parts = [self._add(lines, part, closed=False) for part in parts]
+            else:
+                parts = [[self._add(lines, ring, closed=True) for ring in polygon] for polygon in parts]
+            shapes.append((feature, kind, parts))
+        if not lines and not points:
+            return self._topology(name, [0, 0], [], [])
+
+        translate = self._quantize(lines, points)
+        windings = [closed and line is not None and np.sign(signed_area(line)) for line, closed in lines]
+        arcs, line_arcs = self._cut(lines)
+        arcs = [simplify(arc, self.tolerance) for arc in arcs]
+
+        geometries = []
+        for feature, kind, parts in shapes:
+            if kind == "point":
+                geometry = {"type": "MultiPoint", "coordinates": points[parts].tolist()}
+            elif kind == "line":
+                geometry = {"type": "MultiLineString", "arcs": [line_arcs[i] for i in parts if line_arcs[i]]}
+            else:
+                polygons = []
+                for polygon in parts:
+                    rings = [i for i in polygon if self._ring_visible(arcs, line_arcs[i], windings[i])]
+                    # A polygon whose outer ring is gone goes with it.
+                    if rings and rings[0] == polygon[0]:
+                        polygons.append([line_arcs[i] for i in rings])
+                geometry = {"type": "MultiPolygon", "arcs": polygons}
+
+            parts = geometry.get("arcs", geometry.get("coordinates"))
+            if not parts:
+                continue
+            if len(parts) == 1:
+                geometry["type"] = geometry["type"][len("Multi") :]
+                geometry["arcs" if "arcs" in geometry else "coordinates"] = parts[0]
+            if "id" in feature:
+                geometry["id"] = feature["id"]
+            geometries.append(geometry)
+
+        return self._topology(name, translate, *self._prune(arcs, geometries))
+
+    def _add(self, lines, coordinates, closed):
+        lines.append((np.asarray(coordinates, dtype=np.float64)[:, :2], closed))
+        return len(lines) - 1
+
+    def _quantize(self, lines, points):
+        """
+        Snap every line and point to the grid, in place, and return the
+        grid's origin.
+        """
+        coordinates = np.concatenate([line for line, _ in lines] + points)
+        origin = coordinates.min(axis=0)
+        quantized = np.rint((coordinates - origin) / self.step).astype(np.int64)
+        offsets = np.cumsum([len(line) for line, _ in lines] + [len(position) for position in points])[:-1]
+        quantized = np.split(quantized, offsets)
+        points[:] = quantized[len(lines) :]
+        for i, (line, (_, closed)) in enumerate(zip(quantized, lines)):
+            line = dedupe_consecutive(line)
+            if closed and len(line) > 1 and np.any(line[0] != line[-1]):
+                line = np.vstack([line, line[:1]])
+            if len(line) < (4 if closed else 2):
+                line = None
+            lines[i] = (line, closed)
+        return origin.tolist()
+
+    def _junctions(self, lines, width):
+        """
+        Keys (x * width + y) of the points where lines meet: the ends of open
+        lines, and any point reached from different neighbours in different
+        places. A border two polygons share has the same neighbours in both.
+        """
+        keys, pairs, ends = [], [], []
+        for points, closed in lines:
+            if points is None:
+                continue
+            point_keys = points[:, 0] * width + points[:, 1]
+            if closed:
+                point_keys = point_keys[:-1]
+                previous, following = np.roll(point_keys, 1), np.roll(point_keys, -1)
+            else:
+                ends.append(point_keys[[0, -1]])
+                previous = np.concatenate([[-1], point_keys[:-1]])
+                following = np.concatenate([point_keys[1:], [-1]])
+            keys.append(point_keys)
+            pairs.append(np.stack([np.minimum(previous, following), np.maximum(previous, following)], axis=1))
+
+        keys = np.concatenate(keys)
+        neighbourhoods = np.unique(np.column_stack([keys, np.concatenate(pairs)]), axis=0)
+        points, counts = np.unique(neighbourhoods[:, 0], return_counts=True)
+        junctions = points[counts > 1]
+        if ends:
+            junctions = np.union1d(junctions, np.concatenate(ends))
+        return junctions
+
+    def _cut(self, lines):
+        """
+        Cut lines at junctions into arcs, storing each arc once. Returns the
+        arcs and, for each line, its arc indexes (~i for arc i reversed).
+        """
+        present = [points for points, _ in lines if points is not None]
+        if not present:
+            return [], [None] * len(lines)
+        width = max(points[:, 1].max() for points in present) + 1
+        junctions = self._junctions(lines, width)
+
+        # Look up every point at once rather than line by line.
+        keys = np.concatenate([points[:, 0] * width + points[:, 1] for points in present])
+        offsets = np.cumsum([len(points) for points in present])[:-1]
+        is_junction = iter(np.split(np.isin(keys, junctions), offsets))
+
+        arcs, index, line_arcs = [], {}, []
+        for points, closed in lines:
+            if points is None:
+                line_arcs.append(None)
+                continue
+            point_junctions = next(is_junction)
+            if closed:
+                unique_keys = points[:-1, 0] * width + points[:-1, 1]
+                cuts = np.flatnonzero(point_junctions[:-1])
+                # Start rings at a junction, or if they have none at their
+                # smallest point, so identical rings produce identical arcs.
+                start = cuts[0] if len(cuts) else int(unique_keys.argmin())
+                points = np.roll(points[:-1], -start, axis=0)
+                points = np.vstack([points, points[:1]])
+                cuts = np.append((cuts - start) % len(unique_keys), len(unique_keys))
+                cuts = np.unique(np.append(cuts, 0))
+            else:
+                cuts = np.flatnonzero(point_junctions)
+                cuts = np.unique(np.concatenate([[0], cuts, [len(points) - 1]]))
+
+            refs = []
+            for start, end in zip(cuts[:-1], cuts[1:]):
+                arc = points[start : end + 1]
+                forward, backward = arc.tobytes(), arc[::-1].tobytes()
+                if forward in index:
+                    refs.append(index[forward])
+                elif backward in index:
+                    refs.append(~index[backward])
+                else:
+                    index[forward] = len(arcs)
+                    refs.append(len(arcs))
+                    arcs.append(arc)
+            line_arcs.append(refs)
+        return arcs, line_arcs
+
+    def _ring_visible(self, arcs, refs, winding):
+        if not refs:
+            return False
+        ring = np.concatenate([arcs[i] if i >= 0 else arcs[~i][::-1] for i in refs])
+        area = signed_area(ring)
+        return len(dedupe_consecutive(ring)) >= 4 and np.sign(area) == winding and abs(area) >= self.min_area
+
+    def _prune(self, arcs, geometries):
+        """
+        Drop arcs no remaining geometry uses and renumber the rest.
+        """
+        used = {}
+
+        def renumber(refs):
+            if isinstance(refs, list):
+                return [renumber(ref) for ref in refs]
+            arc = refs if refs >= 0 else ~refs
+            if arc not in used:
+                used[arc] = len(used)
+            return used[arc] if refs >= 0 else ~used[arc]
+
+        for geometry in geometries:
+            if "arcs" in geometry:
+                geometry["arcs"] = renumber(geometry["arcs"])
+        return [arcs[arc] for arc in used], geometries
+
+    def _topology(self, name, translate, arcs, geometries):
+        return {
+            "type": "Topology",
+            "transform": {"scale": [self.step, self.step], "translate": translate},
+            "objects": {name: {"type": "GeometryCollection", "geometries": geometries}},
+            # Delta-encoded: each point after the first is relative to the last.
+            "arcs": [np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist() for arc in arcs],
+        }
+
+
+def dumps(topology):
+    return json.dumps(topology, separators=(",", ":"))
@@ -0,0 +1,56 @@
+"""
+The Django request handler asgi.py serves, named there the way gunicorn.py
+names com/workers.py.
+"""
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler as DjangoASGIHandler
+from django.core.handlers.asgi import ASGIRequest as DjangoASGIRequest
+
+
+class ASGIRequest(DjangoASGIRequest):
+    # Resolved against asgi_urls.py, with the async homepage, instead of
+    # settings.ROOT_URLCONF: Django's handler honours request.urlconf.
+    urlconf = "asgi_urls"
+
+
+class ASGIHandler(DjangoASGIHandler):
+    """
+    Django's ASGI handler, except that requests resolve against
+    asgi_urls.py and streaming responses are iterated in a thread, a part
+    at a time, the way ASGIStaticFiles reads files. Django 3.2 iterates
+    them on the event loop, where every read from disk would hold up every
+    other request.
+    """
+
+    request_class = ASGIRequest
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        headers = [(header.encode("ascii"), value.encode("latin1")) for header, value in response.items()]
+        for cookie in response.cookies.values():
+            headers.append((b"Set-Cookie", cookie.output(header="").encode("ascii").strip()))
+        await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+
+        parts = iter(response)
+        try:
+            while True:
+                part = await sync_to_async(next, thread_sensitive=False)(parts, None)
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body"})
+        finally:
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """
+    django.core.asgi.get_asgi_application(), with ASGIHandler.
+    """
+    django.setup(set_prefix=False)
+    return ASGIHandler()
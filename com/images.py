@@ -0,0 +1,114 @@
+import os
+
+from com.manifest import file_digest
+
+# Derivative widths, in pixels. Only widths narrower than the original are
+# made, plus one at the original width (capped at the widest of these).
+DERIVATIVE_WIDTHS = (320, 640, 960, 1280, 1920)
+
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+QUALITY = {"jpg": 82, "png": None, "webp": 80, "avif": 55}
+
+
+def available_formats():
+    """
+    WebP always, AVIF when this Pillow can write it (natively from 11.2, or
+    through the pillow-avif-plugin package).
+    """
+    from PIL import features
+
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+
+    formats = ["webp"]
+    try:
+        if features.check("avif"):
+            formats.insert(0, "avif")
+    except ValueError:
+        pass
+    return formats
+
+
+def fallback_format(path):
+    return "png" if path.lower().endswith(".png") else "jpg"
+
+
+def derivative_widths(width):
+    widths = [w for w in DERIVATIVE_WIDTHS if w < width]
+    widths.append(min(width, DERIVATIVE_WIDTHS[-1]))
+    return widths
+
+
+def derivative_name(base, width, image_format):
+    return "%s-%sw.%s" % (base, width, image_format)
+
+
+def render_derivatives(source, out_base, formats):
+    """
+    Write every derivative of `source` to `out_base`-<width>w.<format> and
+    return the manifest entry describing them. Runs in a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        os.makedirs(os.path.dirname(out_base), exist_ok=True)
+        sources = {}
+        for image_format in formats + [fallback_format(source)]:
+            sources[image_format] = []
+            for target_width in derivative_widths(width):
+                target_height = max(1, round(height * target_width / width))
+                resized = (
+                    image
+                    if target_width == width
+                    else image.resize((target_width, target_height), Image.LANCZOS)
+                )
+                if image_format == "jpg" and resized.mode != "RGB":
+                    resized = resized.convert("RGB")
+                path = derivative_name(out_base, target_width, image_format)
+                save_options = {"optimize": True}
+                if image_format == "jpg":
+                    save_options["progressive"] = True
+                if QUALITY[image_format]:
+                    save_options["quality"] = QUALITY[image_format]
+                resized.save(
+                    path, format="JPEG" if image_format == "jpg" else image_format.upper(), **save_options
+                )
+                sources[image_format].append((target_width, path))
+
+    stat = os.stat(source)
+    return {
+        "width": width,
+        "height": height,
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "hash": file_digest(source),
+        "sources": sources,
+    }
+
+
+def is_up_to_date(entry, source, root, formats):
+    """
+    Whether manifest `entry` still describes `source`, with derivatives in
+    all of `formats` on disk under `root`. A changed mtime alone isn't
+    enough to redo the work, only a changed hash is.
+    """
+    if not entry or not set(formats) <= set(entry["sources"]):
+        return False
+    for paths in entry["sources"].values():
+        if not all(os.path.exists(os.path.join(root, path)) for _, path in paths):
+            return False
+    stat = os.stat(source)
+    if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+        return True
+    if file_digest(source) == entry["hash"]:
+        entry.update(mtime=stat.st_mtime, size=stat.st_size)
+        return True
+    return False
@@ -0,0 +1,60 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from com.bike_data import (
+    DATASETS,
+    MAP_LAYERS,
+    MAP_ZOOMS,
+    build_map_layer,
+    dataset_filename,
+    map_layer_filename,
+    map_layer_source_path,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the filtered, column-pruned crash and request CSVs and the per-zoom TopoJSON map layers "
+        "the Boston bikes page loads."
+    )
+
+    def handle(self, *args, **options):
+        data_dir = settings.BIKES_DATA_DIR
+        for name, dataset in sorted(DATASETS.items()):
+            body = dataset.build(data_dir)
+            self.write(
+                dataset_filename(name),
+                body,
+                dataset.source_path(data_dir),
+                "%s rows" % (body.count("\n") - 1),
+            )
+        for name in sorted(MAP_LAYERS):
+            for zoom in sorted(MAP_ZOOMS):
+                self.write(
+                    map_layer_filename(name, zoom),
+                    build_map_layer(name, zoom, data_dir),
+                    map_layer_source_path(name, data_dir),
+                    "zoom %s" % zoom,
+                )
+
+    def write(self, filename, text, source_path, description):
+        body = text.encode("utf-8")
+        path = os.path.join(settings.BIKES_DATA_DIR, filename)
+        tmp_path = "%s.tmp" % path
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        self.stdout.write(
+            " ---> %s: %s, %s bytes (%s gzipped) from %s bytes of %s"
+            % (
+                filename,
+                description,
+                len(body),
+                len(gzip.compress(body)),
+                os.path.getsize(source_path),
+                os.path.basename(source_path),
+            )
+        )
@@ -0,0 +1,93 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from com.images import SOURCE_EXTENSIONS, available_formats, is_up_to_date, render_derivatives
+from com.manifest import write_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        "Write resized WebP/AVIF/original-format derivatives of RESPONSIVE_IMAGE_DIRS "
+        "for {% responsive_img %}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Size of the process pool.")
+        parser.add_argument("--force", action="store_true", help="Rebuild images that are up to date.")
+
+    def handle(self, *args, **options):
+        try:
+            formats = available_formats()
+        except ImportError:
+            raise CommandError("Pillow is required to build image derivatives: pip install Pillow")
+
+        root = settings.IMAGE_DERIVATIVES_ROOT
+        manifest_path = os.path.join(root, "manifest.json")
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+        jobs, seen = {}, set()
+        for prefix, source_root in settings.RESPONSIVE_IMAGE_DIRS.items():
+            for dirpath, dirnames, filenames in os.walk(source_root):
+                for filename in filenames:
+                    if not filename.lower().endswith(SOURCE_EXTENSIONS):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    relative = os.path.relpath(path, source_root).replace(os.sep, "/")
+                    url = prefix + relative
+                    seen.add(url)
+                    if not options["force"] and is_up_to_date(manifest.get(url), path, root, formats):
+                        continue
+                    out_base = os.path.join(root, prefix.strip("/"), os.path.splitext(relative)[0])
+                    jobs[url] = (path, out_base)
+
+        self.stdout.write(
+            "%s images to build, %s up to date, formats: %s"
+            % (len(jobs), len(seen) - len(jobs), ", ".join(formats))
+        )
+
+        os.makedirs(root, exist_ok=True)
+        original_bytes = derivative_bytes = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {
+                pool.submit(render_derivatives, path, out_base, formats): url
+                for url, (path, out_base) in jobs.items()
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    self.stderr.write(" ---> %s: %s" % (url, e))
+                    continue
+                for image_format, paths in entry["sources"].items():
+                    entry["sources"][image_format] = [
+                        (width, os.path.relpath(path, root).replace(os.sep, "/")) for width, path in paths
+                    ]
+                manifest[url] = entry
+                # Save as we go, so an interrupted build picks up where it stopped.
+                write_manifest(manifest_path, manifest)
+                original_bytes += entry["size"]
+                smallest = min(entry["sources"].values(), key=lambda paths: self.size(root, paths[-1][1]))
+                derivative_bytes += self.size(root, smallest[-1][1])
+                self.stdout.write(" ---> %s" % url)
+
+        for url in set(manifest) - seen:
+            del manifest[url]
+
+        write_manifest(manifest_path, manifest)
+        if original_bytes:
+            self.stdout.write(
+                "Full-width derivatives in the smallest format are %.1f MB against %.1f MB of originals."
+                % (derivative_bytes / 1024 / 1024, original_bytes / 1024 / 1024)
+            )
+
+    def size(self, root, path):
+        return os.path.getsize(os.path.join(root, path))
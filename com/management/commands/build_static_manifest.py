@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from com.manifest import build_manifest, write_manifest
+
+
+class Command(BaseCommand):
+    help = "Hash every file under STATIC_MOUNTS and write the {% asset %} manifest."
+
+    def handle(self, *args, **options):
+        urls = build_manifest(settings.STATIC_MOUNTS)
+        write_manifest(settings.STATIC_MANIFEST, urls)
+        self.stdout.write("Wrote %s hashed URLs to %s." % (len(urls), settings.STATIC_MANIFEST))
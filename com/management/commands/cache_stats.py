@@ -0,0 +1,55 @@
+import json
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from com.cache_stats import clear_stats, stats_report
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss, byte and latency stats for an InstrumentedCache, per key prefix."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--alias", default="default", help="Cache alias to report on.")
+        parser.add_argument("--json", action="store_true", help="Print the raw report as JSON.")
+        parser.add_argument("--clear", action="store_true", help="Forget the stats collected so far.")
+
+    def handle(self, *args, **options):
+        backend = caches[options["alias"]]
+        report = stats_report(backend)
+        if report is None:
+            raise CommandError(
+                "The %r cache isn't a com.cache_backends.InstrumentedCache." % options["alias"]
+            )
+
+        if options["clear"]:
+            clear_stats(backend.stats_cache)
+            self.stdout.write("Cleared stats for %s processes." % len(report["processes"]))
+            return
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write("Stats from %s processes\n" % len(report["processes"]))
+        self.stdout.write(
+            "%-24s %8s %8s %6s %8s %12s %12s %10s %10s"
+            % ("prefix", "hits", "misses", "ratio", "sets", "bytes read", "bytes set", "get p50", "get p95")
+        )
+        for prefix, stats in sorted(report["prefixes"].items()):
+            ratio = "-" if stats["hit_ratio"] is None else "%.0f%%" % (stats["hit_ratio"] * 100)
+            get_latency = stats["latency_ms"].get("get", {})
+            self.stdout.write(
+                "%-24s %8d %8d %6s %8d %12d %12d %10s %10s"
+                % (
+                    prefix,
+                    stats["hits"],
+                    stats["misses"],
+                    ratio,
+                    stats["sets"],
+                    stats["bytes_read"],
+                    stats["bytes_written"],
+                    "<%sms" % get_latency["p50"] if get_latency.get("p50") else "-",
+                    "<%sms" % get_latency["p95"] if get_latency.get("p95") else "-",
+                )
+            )
@@ -0,0 +1,68 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css",
+    ".csv",
+    ".geojson",
+    ".html",
+    ".js",
+    ".json",
+    ".map",
+    ".otf",
+    ".svg",
+    ".txt",
+    ".xml",
+)
+MIN_SIZE = 1024
+
+
+class Command(BaseCommand):
+    help = "Write .gz (and .br, if brotli is installed) siblings for text files under STATIC_MOUNTS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Recompress files that are up to date.")
+
+    def handle(self, *args, **options):
+        encoders = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append((".br", lambda data: brotli.compress(data, quality=11)))
+        else:
+            self.stdout.write("brotli isn't installed, only writing .gz files.")
+
+        written = saved = 0
+        for root in sorted(set(settings.STATIC_MOUNTS.values())):
+            for dirpath, dirnames, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if not filename.endswith(COMPRESSIBLE_EXTENSIONS) or os.path.getsize(path) < MIN_SIZE:
+                        continue
+                    data = None
+                    for suffix, encode in encoders:
+                        target = path + suffix
+                        if (
+                            not options["force"]
+                            and os.path.exists(target)
+                            and os.path.getmtime(target) >= os.path.getmtime(path)
+                        ):
+                            continue
+                        if data is None:
+                            with open(path, "rb") as f:
+                                data = f.read()
+                        compressed = encode(data)
+                        if len(compressed) > len(data) * 0.95:
+                            continue
+                        with open(target, "wb") as f:
+                            f.write(compressed)
+                        written += 1
+                        saved += len(data) - len(compressed)
+
+        self.stdout.write("Wrote %s compressed files, saving %.1f MB." % (written, saved / 1024 / 1024))
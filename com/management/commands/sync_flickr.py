@@ -1,15 +1,63 @@
-import os
-import logging
 import datetime
 import errno
+import logging
+import os
 from optparse import make_option
-from django.core.management.base import BaseCommand
+
 from django.conf import settings
+from django.core.management.base import BaseCommand
+
 from syncr.app.flickr import FlickrSyncr
+from syncr.flickr.slug import create_indexes, create_tables
+
 
 class Command(BaseCommand):
+    help = (
+        "Sync samuelclay's flickr photos uploaded since the last sync, fetching only new and changed ones. "
+        "This used to save placeholders for the last 2365 days of uploads; --minimal still does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Photos to fetch from flickr at once.")
+        parser.add_argument(
+            "--calls-per-second",
+            type=float,
+            help="Most flickr API calls a second, across workers. Flickr allows 1.",
+        )
+        parser.add_argument(
+            "--days", type=int, help="Sync uploads from this many days back, not since the last sync."
+        )
+        parser.add_argument(
+            "--updated",
+            action="store_true",
+            help="Sync edits too. Needs flickrapi authenticated as samuelclay.",
+        )
+        parser.add_argument(
+            "--listing-only",
+            action="store_true",
+            help="Fill photos in from the search results alone: one API call a page, but no comments.",
+        )
+        parser.add_argument(
+            "--minimal",
+            action="store_true",
+            help="Only save placeholders for photos not yet saved, from --days back (default 2365).",
+        )
 
     def handle(self, *args, **options):
-        
-        f = FlickrSyncr(settings.API_KEY, settings.API_SECRET)
-        f.syncMinimal('samuelclay', days=2365)
+        for model in create_tables():
+            self.stdout.write("Created table %s." % model._meta.db_table)
+        for index in create_indexes():
+            self.stdout.write("Created index %s." % index.name)
+
+        f = FlickrSyncr(
+            settings.API_KEY,
+            settings.API_SECRET,
+            workers=options["workers"],
+            calls_per_second=options["calls_per_second"],
+        )
+        if options["minimal"]:
+            f.syncMinimal("samuelclay", days=options["days"] or 2365)
+        elif options["updated"]:
+            f.syncUpdated("samuelclay", hydrate=not options["listing_only"])
+        else:
+            f.syncRecentPhotos("samuelclay", days=options["days"], hydrate=not options["listing_only"])
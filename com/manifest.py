@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+
+_manifests = {}
+
+
+def hashed_name(url, digest):
+    """
+    /static/styles/global.css -> /static/styles/global.<digest>.css
+    """
+    directory, _, filename = url.rpartition("/")
+    name, dot, extension = filename.rpartition(".")
+    if not name:
+        return "%s/%s.%s" % (directory, filename, digest)
+    return "%s/%s.%s.%s" % (directory, name, digest, extension)
+
+
+def file_digest(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()[:12]
+
+
+def build_manifest(mounts):
+    """
+    Map the URL of every file under `mounts` (URL prefix -> directory) to a
+    URL with the file's content hash in its name.
+    """
+    urls = {}
+    for prefix, root in sorted(mounts.items()):
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                base, extension = os.path.splitext(path)
+                if filename.startswith(".") or extension in (".br", ".gz") and os.path.isfile(base):
+                    continue
+                url = prefix + os.path.relpath(path, root).replace(os.sep, "/")
+                urls[url] = hashed_name(url, file_digest(path))
+    return urls
+
+
+def write_manifest(path, urls):
+    tmp_path = "%s.tmp" % path
+    with open(tmp_path, "w") as f:
+        json.dump(urls, f, indent=0, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path, reload=False):
+    """
+    Return the JSON manifest at `path`, or an empty one if it hasn't been
+    built. It's read once, then again only if `reload` is set and the file
+    has changed.
+    """
+    manifest = _manifests.get(path)
+    if manifest is not None and not reload:
+        return manifest["urls"]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        _manifests[path] = {"mtime": None, "urls": {}}
+        return _manifests[path]["urls"]
+    if manifest is None or manifest["mtime"] != mtime:
+        with open(path) as f:
+            _manifests[path] = {"mtime": mtime, "urls": json.load(f)}
+    return _manifests[path]["urls"]
+
+
+def manifest_mtime(path, reload=False):
+    """
+    The mtime of the manifest load_manifest() is serving for `path`, or None
+    if it hasn't been built.
+    """
+    load_manifest(path, reload=reload)
+    return _manifests[path]["mtime"]
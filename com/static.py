@@ -0,0 +1,345 @@
+import mimetypes
+import os
+import threading
+from email.utils import formatdate
+
+from asgiref.sync import sync_to_async
+from django.utils.http import parse_etags
+
+from com.manifest import file_digest, hashed_name
+
+mimetypes.add_type("application/geo+json", ".geojson")
+
+# Files at least this big are handed to wsgi.file_wrapper, which gunicorn
+# sends with os.sendfile(). Smaller ones are read once and kept in memory.
+SENDFILE_THRESHOLD = 64 * 1024
+MAX_MEMORY_BYTES = 32 * 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+
+COMPRESSED_SIBLINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Content-hashed URLs never change, so browsers can keep them for good.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StaticFile:
+    """
+    What we know about one file on disk, plus any precompressed siblings.
+    """
+
+    def __init__(self, path, stat=None):
+        stat = stat or os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        content_type, encoding = mimetypes.guess_type(path)
+        if encoding:
+            # Serve foo.tar.gz as a gzip file, don't let the browser unpack it.
+            content_type = "application/%s" % encoding
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.body = None
+        self.digest = None
+        self.encodings = {}
+        for encoding, suffix in COMPRESSED_SIBLINGS:
+            sibling = path + suffix
+            if os.path.isfile(sibling):
+                sibling_stat = os.stat(sibling)
+                if sibling_stat.st_mtime >= stat.st_mtime:
+                    self.encodings[encoding] = (sibling, sibling_stat.st_size)
+
+    def content_digest(self):
+        """
+        The file's digest as build_manifest() takes it, read once on first
+        use.
+        """
+        if self.digest is None:
+            self.digest = file_digest(self.path)
+        return self.digest
+
+    def is_stale(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+
+class StaticFiles:
+    """
+    WSGI middleware that serves files from a set of directories before the
+    request ever reaches Django's URL resolver or middleware.
+
+    `mounts` maps URL prefixes to directories. The directories are walked
+    once at startup into an in-memory index, so lookups never touch the
+    filesystem with user input. Anything not in the index, and anything
+    other than GET or HEAD, is passed on to `application` unchanged.
+
+    Supports If-None-Match/If-Modified-Since, single byte ranges, and
+    precompressed .br/.gz siblings (see `manage.py compress_static`).
+
+    `manifest` maps URLs to their content-hashed names (see
+    `manage.py build_static_manifest`). Hashed names serve the same file
+    with a year-long immutable Cache-Control, as long as it still has that
+    hash: a file changed since the manifest was built is served under its
+    old hashed name like any other.
+    """
+
+    def __init__(self, application, mounts, manifest=None, check_mtime=False):
+        self.application = application
+        self.mounts = mounts
+        self.check_mtime = check_mtime
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.files = self.build_index()
+        self.hashed = {}
+        for url, hashed_url in (manifest or {}).items():
+            if url in self.files:
+                self.files[hashed_url] = self.files[url]
+                self.hashed[hashed_url] = url
+
+    def build_index(self):
+        files = {}
+        for prefix, root in self.mounts.items():
+            root = os.path.abspath(root)
+            for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    base, extension = os.path.splitext(path)
+                    if filename.startswith("."):
+                        continue
+                    if extension in (".br", ".gz") and os.path.isfile(base):
+                        # A precompressed sibling, served through its original.
+                        continue
+                    relative = os.path.relpath(path, root).replace(os.sep, "/")
+                    try:
+                        files[prefix + relative] = StaticFile(path)
+                    except OSError:
+                        continue
+        return files
+
+    def __call__(self, environ, start_response):
+        if environ["REQUEST_METHOD"] not in ("GET", "HEAD"):
+            return self.application(environ, start_response)
+
+        try:
+            path = environ.get("PATH_INFO", "").encode("latin-1").decode("utf-8")
+        except UnicodeError:
+            return self.application(environ, start_response)
+
+        static_file = self.files.get(path)
+        if static_file is not None and self.check_mtime and static_file.is_stale():
+            static_file = self.refresh(path, static_file)
+        if static_file is None:
+            return self.application(environ, start_response)
+
+        return self.serve(
+            environ, start_response, static_file, immutable=self.is_immutable(path, static_file)
+        )
+
+    def is_immutable(self, path, static_file):
+        """
+        Whether `path` is a hashed name whose hash is still `static_file`'s.
+        """
+        url = self.hashed.get(path)
+        return url is not None and hashed_name(url, static_file.content_digest()) == path
+
+    def refresh(self, path, static_file):
+        try:
+            self.files[path] = StaticFile(static_file.path)
+        except OSError:
+            self.files.pop(path, None)
+        return self.files.get(path)
+
+    def serve(self, environ, start_response, static_file, immutable=False):
+        range_header = environ.get("HTTP_RANGE")
+        encoding = None
+        if not range_header:
+            accept_encoding = environ.get("HTTP_ACCEPT_ENCODING", "")
+            encoding = next((e for e in static_file.encodings if e in accept_encoding), None)
+
+        etag = static_file.etag
+        if encoding:
+            etag = '%s-%s"' % (etag[:-1], encoding)
+
+        headers = [
+            ("ETag", etag),
+            ("Last-Modified", static_file.last_modified),
+            ("Accept-Ranges", "bytes"),
+        ]
+        if static_file.encodings:
+            headers.append(("Vary", "Accept-Encoding"))
+        if immutable:
+            headers.append(("Cache-Control", IMMUTABLE_CACHE_CONTROL))
+
+        if self.not_modified(environ, static_file, etag):
+            start_response("304 Not Modified", headers)
+            return []
+
+        headers.append(("Content-Type", static_file.content_type))
+        if encoding:
+            path, size = static_file.encodings[encoding]
+            headers.append(("Content-Encoding", encoding))
+        else:
+            path, size = static_file.path, static_file.size
+
+        status = "200 OK"
+        start, length = 0, size
+        if range_header and environ.get("HTTP_IF_RANGE", etag) in (etag, static_file.last_modified):
+            byte_range = parse_range(range_header, size)
+            if byte_range is False:
+                headers.append(("Content-Range", "bytes */%s" % size))
+                headers.append(("Content-Length", "0"))
+                start_response("416 Range Not Satisfiable", headers)
+                return []
+            if byte_range is not None:
+                start, end = byte_range
+                length = end - start + 1
+                status = "206 Partial Content"
+                headers.append(("Content-Range", "bytes %s-%s/%s" % (start, end, size)))
+
+        headers.append(("Content-Length", str(length)))
+        start_response(status, headers)
+        if environ["REQUEST_METHOD"] == "HEAD":
+            return []
+
+        if not encoding and size < SENDFILE_THRESHOLD:
+            body = self.small_body(static_file)
+            return [body[start : start + length]]
+
+        f = open(path, "rb")
+        f.seek(start)
+        if length == size - start and "wsgi.file_wrapper" in environ:
+            return environ["wsgi.file_wrapper"](f, BLOCK_SIZE)
+        return read_range(f, length)
+
+    def not_modified(self, environ, static_file, etag):
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return "*" in etags or etag in etags
+        return environ.get("HTTP_IF_MODIFIED_SINCE") == static_file.last_modified
+
+    def preload(self):
+        """
+        Read the files small_body() would keep into memory now, rather than
+        on their first request.
+        """
+        for static_file in {id(f): f for f in self.files.values()}.values():
+            if not static_file.encodings and static_file.size < SENDFILE_THRESHOLD:
+                self.small_body(static_file)
+
+    def small_body(self, static_file):
+        body = static_file.body
+        if body is not None:
+            return body
+        with open(static_file.path, "rb") as f:
+            body = f.read()
+        with self.lock:
+            if self.memory_bytes + len(body) <= MAX_MEMORY_BYTES:
+                static_file.body = body
+                self.memory_bytes += len(body)
+        return body
+
+
+class ASGIStaticFiles(StaticFiles):
+    """
+    StaticFiles in front of an ASGI application instead: the same index
+    and responses, sent as ASGI messages. Files too big to keep in memory
+    are read in a thread, a block at a time.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.application(scope, receive, send)
+
+        path = scope["path"]
+        static_file = self.files.get(path)
+        if static_file is not None and self.check_mtime and static_file.is_stale():
+            static_file = self.refresh(path, static_file)
+        if static_file is None:
+            return await self.application(scope, receive, send)
+
+        response = {}
+
+        def start_response(status, headers):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers
+            ]
+
+        body = self.serve(
+            wsgi_environ(scope), start_response, static_file, immutable=self.is_immutable(path, static_file)
+        )
+        await send(
+            {"type": "http.response.start", "status": response["status"], "headers": response["headers"]}
+        )
+        if isinstance(body, list):
+            await send({"type": "http.response.body", "body": b"".join(body)})
+            return
+
+        chunks = iter(body)
+        try:
+            while True:
+                chunk = await sync_to_async(next, thread_sensitive=False)(chunks, None)
+                if chunk is None:
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            body.close()
+
+
+def wsgi_environ(scope):
+    """
+    The parts of a WSGI environ StaticFiles.serve() reads, from an ASGI
+    HTTP scope.
+    """
+    environ = {"REQUEST_METHOD": scope["method"], "PATH_INFO": scope["path"]}
+    for name, value in scope["headers"]:
+        environ["HTTP_%s" % name.decode("latin-1").upper().replace("-", "_")] = value.decode("latin-1")
+    return environ
+
+
+def parse_range(header, size):
+    """
+    Parse a single "bytes=" range into inclusive (start, end) offsets.
+    Returns None to ignore the header (malformed, or several ranges, which
+    we answer with the whole file) and False if it can't be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def read_range(f, length):
+    try:
+        while length > 0:
+            chunk = f.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
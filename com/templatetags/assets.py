@@ -0,0 +1,80 @@
+import os
+
+from django import template
+from django.conf import settings
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from com.manifest import load_manifest, manifest_mtime
+
+register = template.Library()
+
+MODERN_FORMATS = (("avif", "image/avif"), ("webp", "image/webp"))
+
+
+def derivatives_manifest_path():
+    return os.path.join(settings.IMAGE_DERIVATIVES_ROOT, "manifest.json")
+
+
+def assets_version():
+    """
+    Changes whenever {% asset %} or {% responsive_img %} could start
+    returning something else.
+    """
+    return (
+        manifest_mtime(settings.STATIC_MANIFEST, reload=settings.DEBUG),
+        manifest_mtime(derivatives_manifest_path(), reload=settings.DEBUG),
+    )
+
+
+@register.simple_tag
+def asset(url):
+    """
+    Resolve a /static/... (or other STATIC_MOUNTS) URL to its content-hashed
+    name from the manifest written by `manage.py build_static_manifest`.
+    Falls back to the plain URL if the file isn't in the manifest.
+
+        <link rel="stylesheet" href="{% asset "/static/styles/global.css" %}" />
+    """
+    return load_manifest(settings.STATIC_MANIFEST, reload=settings.DEBUG).get(url, url)
+
+
+@register.simple_tag
+def responsive_img(url, sizes="100vw", **attrs):
+    """
+    An <img> for `url` with a srcset of the resized derivatives written by
+    `manage.py build_image_derivatives`, wrapped in a <picture> offering the
+    AVIF and WebP versions first. Without derivatives it's a plain <img>.
+
+        {% responsive_img "/static/images/glider.png" sizes="62px" alt="Glider" loading="lazy" %}
+    """
+    entry = load_manifest(derivatives_manifest_path(), reload=settings.DEBUG).get(url)
+    attrs.setdefault("alt", "")
+    if not entry:
+        return format_html("<img{}>", flatatt(dict(attrs, src=asset(url))))
+
+    def srcset(image_format):
+        return ", ".join(
+            "%s %sw" % (asset(settings.IMAGE_DERIVATIVES_URL + path), width)
+            for width, path in entry["sources"][image_format]
+        )
+
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (content_type, srcset(image_format), sizes)
+            for image_format, content_type in MODERN_FORMATS
+            if image_format in entry["sources"]
+        ),
+    )
+    fallback = next(f for f in entry["sources"] if f not in dict(MODERN_FORMATS))
+    img_attrs = dict(
+        attrs,
+        src=asset(url),
+        srcset=srcset(fallback),
+        sizes=sizes,
+        width=entry["width"],
+        height=entry["height"],
+    )
+    return format_html("<picture>{}<img{}></picture>", sources, flatatt(img_attrs))
@@ -0,0 +1,82 @@
+import os
+import threading
+
+from django import template
+from django.conf import settings
+
+from com.templatetags.assets import assets_version
+
+register = template.Library()
+
+# Per process: (template path, fragment name) -> (version, {vary_on: html}).
+_fragments = {}
+_fragments_lock = threading.Lock()
+
+
+def template_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        # Template.from_string(), with no file behind it.
+        return None
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on, path):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+        self.path = path
+        # Outside DEBUG the cached loader keeps this node until the process
+        # restarts, so the template file it was compiled from is the one
+        # that counts.
+        self.mtime = template_mtime(path)
+
+    def render(self, context):
+        slot = (self.path, self.name.resolve(context))
+        mtime = template_mtime(self.path) if settings.DEBUG else self.mtime
+        version = (mtime, assets_version())
+        vary_on = tuple(str(variable.resolve(context)) for variable in self.vary_on)
+
+        cached_version, rendered = _fragments.get(slot, (None, {}))
+        if cached_version == version and vary_on in rendered:
+            return rendered[vary_on]
+
+        html = self.nodelist.render(context)
+        with _fragments_lock:
+            cached_version, rendered = _fragments.get(slot, (None, {}))
+            if cached_version != version:
+                rendered = {}
+                _fragments[slot] = (version, rendered)
+            rendered[vary_on] = html
+        return html
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    Render the enclosed template once per process and version of the
+    template file, then reuse the HTML. It's rendered again for each
+    combination of the variables after the name, so those should be all
+    that the fragment depends on.
+
+        {% fragment "projects" year %}
+            ... {{ year }} ...
+        {% endfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("%r tag requires a fragment name." % bits[0])
+    nodelist = parser.parse(("endfragment",))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+        parser.origin.name,
+    )
+
+
+def clear_fragments():
+    with _fragments_lock:
+        _fragments.clear()
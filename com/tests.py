@@ -5,7 +5,55 @@ unittest). These will both pass when you run "manage.py test".
 Replace these with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import gzip
+import json
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
+from wsgiref.util import setup_testing_defaults
+
+import requests
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import close_old_connections, connection
+from django.http import StreamingHttpResponse
+from django.template import Context, Engine, Template
+from django.test import TestCase, TransactionTestCase, modify_settings, override_settings
+
+from com import bike_data, timing, views, warmup
+from com.bike_data import DATASETS, RECORD_STREAMS, crash_bins, tile_bounds, tile_index
+from com.binning import aggregate, hex_cells, hex_centers
+from com.cache import CacheLock, single_flight
+from com.cache_backends import TwoTierCache
+from com.cache_stats import CacheStats, stats_report
+from com.geo import GridIndex, TopologyBuilder, feature_bounds, simplify
+from com.handlers import ASGIHandler
+from com.manifest import build_manifest, write_manifest
+from com.static import ASGIStaticFiles, StaticFiles
+from com.templatetags.fragments import clear_fragments
+
+try:
+    import flickrapi
+except ImportError:
+    flickrapi = None
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,6 +62,7 @@ class SimpleTest(TestCase):
         """
         self.failUnlessEqual(1 + 1, 2)
 
+
 __test__ = {"doctest": """
 Another way to test that 1 + 1 is equal to 2.
 
@@ -21,3 +70,1536 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BlogCacheTest(TestCase):
+    entries = [{"link": "http://www.ofbrooklyn.com/new/", "title": "New", "date": None}]
+    stale = [{"link": "http://www.ofbrooklyn.com/old/", "title": "Old", "date": None}]
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch_returning(self, entries):
+        return mock.patch.object(
+            views,
+            "_fetch_blog_cache_value",
+            side_effect=lambda previous=None: {"entries": entries, "fetched_at": time.time()},
+        )
+
+    def test_cold_cache_fetches_inline(self):
+        with self.fetch_returning(self.entries) as fetch:
+            self.assertEqual(views._get_blog_entries(), self.entries)
+            self.assertEqual(views._get_blog_entries(), self.entries)
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_stale_entries_are_served_while_refreshing(self):
+        fetched_at = time.time() - views.BLOG_SOFT_TTL - 1
+        cache.set(views.BLOG_CACHE_KEY, {"entries": self.stale, "fetched_at": fetched_at})
+
+        with mock.patch.object(views, "_refresh_blog_in_background") as refresh:
+            self.assertEqual(views._get_blog_entries(), self.stale)
+        refresh.assert_called_once_with(cache.get(views.BLOG_CACHE_KEY))
+
+        with self.fetch_returning(self.entries):
+            views._refresh_blog_in_background({}).join()
+        self.assertEqual(views._get_blog_entries(), self.entries)
+        self.assertFalse(CacheLock(views.BLOG_CACHE_KEY).locked())
+
+    def test_warming_up_leaves_a_stale_blog_to_the_workers(self):
+        fetched_at = time.time() - views.BLOG_SOFT_TTL - 1
+        cache.set(views.BLOG_CACHE_KEY, {"entries": self.stale, "fetched_at": fetched_at})
+
+        with mock.patch.object(views, "_refresh_blog_in_background") as refresh:
+            warmup.render_homepage()
+        refresh.assert_not_called()
+
+    def test_one_background_refresh_at_a_time(self):
+        self.assertTrue(CacheLock(views.BLOG_CACHE_KEY).acquire())
+        self.assertIsNone(views._refresh_blog_in_background({}))
+
+    def test_empty_refresh_keeps_stale_entries(self):
+        cache.set(views.BLOG_CACHE_KEY, {"entries": self.stale, "fetched_at": 0})
+        with self.fetch_returning([]):
+            views._refresh_blog_in_background({}).join()
+        self.assertEqual(cache.get(views.BLOG_CACHE_KEY)["entries"], self.stale)
+
+    def test_unreachable_feed_is_retried_in_background(self):
+        with mock.patch.object(views.requests, "get", side_effect=requests.ConnectionError) as get:
+            self.assertEqual(views._get_blog_entries(), [])
+        self.assertEqual(get.call_count, 1)
+
+        with mock.patch.object(views, "_refresh_blog_in_background") as refresh:
+            self.assertEqual(views._get_blog_entries(), [])
+        refresh.assert_called_once_with({"entries": [], "fetched_at": 0})
+
+    def test_requests_waiting_on_a_fetch_go_without(self):
+        self.assertTrue(CacheLock(views.BLOG_CACHE_KEY).acquire())
+        with mock.patch.object(views, "BLOG_FILL_WAIT", 0.1), self.fetch_returning(self.entries) as fetch:
+            self.assertEqual(views._get_blog_entries(), [])
+        fetch.assert_not_called()
+
+
+class StandInFeedHandler(BaseHTTPRequestHandler):
+    """
+    Serves a one-entry Atom feed with validators, answering 304 when the
+    client sends them back.
+    """
+
+    etag = '"ofbrooklyn-1"'
+    last_modified = "Mon, 05 Jan 2026 12:00:00 GMT"
+    feed = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>ofbrooklyn</title>
+  <entry>
+    <title>Stand-in post</title>
+    <link href="http://www.ofbrooklyn.com/2026/1/5/stand-in/"/>
+    <id>http://www.ofbrooklyn.com/2026/1/5/stand-in/</id>
+    <updated>2026-01-05T12:00:00Z</updated>
+  </entry>
+</feed>"""
+    requests = []
+    delay = 0
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        time.sleep(self.delay)
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/atom+xml")
+        self.send_header("ETag", self.etag)
+        self.send_header("Last-Modified", self.last_modified)
+        self.send_header("Content-Length", str(len(self.feed)))
+        self.end_headers()
+        try:
+            self.wfile.write(self.feed)
+        except BrokenPipeError:
+            # The client timed out waiting.
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInFeedMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.feed_server = ThreadingHTTPServer(("127.0.0.1", 0), StandInFeedHandler)
+        threading.Thread(target=cls.feed_server.serve_forever, daemon=True).start()
+        cls.feed_url = "http://127.0.0.1:%s/feeds/all/" % cls.feed_server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.feed_server.shutdown()
+        cls.feed_server.server_close()
+        super().tearDownClass()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ROOT_URLCONF="asgi_urls", SERVER_TIMING_SAMPLE_RATE=1)
+class AsyncHomepageTest(TestCase):
+    entries = [{"link": "http://www.ofbrooklyn.com/new/", "title": "New post", "date": None}]
+
+    def setUp(self):
+        cache.clear()
+        views._homepage_pool.clear()
+
+    async def test_cold_cache_is_fetched_off_the_event_loop(self):
+        threads = []
+
+        def fetch(previous=None):
+            threads.append(threading.current_thread())
+            with timing.span("http"):
+                return {"entries": self.entries, "fetched_at": time.time()}
+
+        with mock.patch.object(views, "_fetch_blog_cache_value", side_effect=fetch):
+            response = await self.async_client.get("/")
+            await self.async_client.get("/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"New post", response.content)
+        self.assertIn("http;dur=", response["Server-Timing"])
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    async def test_renders_off_the_event_loop(self):
+        threads = []
+        render = views._homepage_response
+
+        def homepage_response(request, blog_entries):
+            threads.append(threading.current_thread())
+            return render(request, blog_entries)
+
+        with mock.patch.object(views, "_aget_blog_entries", return_value=self.entries), mock.patch.object(
+            views, "_homepage_response", side_effect=homepage_response
+        ):
+            response = await self.async_client.get("/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"New post", response.content)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    async def test_requests_waiting_on_a_fetch_go_without(self):
+        self.assertTrue(CacheLock(views.BLOG_CACHE_KEY).acquire())
+        with mock.patch.object(views, "BLOG_FILL_WAIT", 0.1), mock.patch.object(
+            views, "_fetch_blog_cache_value"
+        ) as fetch:
+            self.assertEqual(await views._aget_blog_entries(), [])
+        fetch.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ASGIHandlerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        views._homepage_pool.clear()
+        # As the test client does, so the test's transaction survives.
+        request_started.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+
+    async def request(self, path):
+        scope = {"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        await ASGIHandler()(scope, receive, send)
+        return messages
+
+    async def test_homepage_is_the_async_view(self):
+        with mock.patch.object(views, "_aget_blog_entries", return_value=[]) as entries:
+            messages = await self.request("/")
+        self.assertEqual(messages[0]["status"], 200)
+        entries.assert_called_once_with()
+        self.assertEqual(settings.ROOT_URLCONF, "urls")
+
+    async def test_streams_off_the_event_loop(self):
+        threads = []
+
+        def parts():
+            for part in (b"one\n", b"two\n"):
+                threads.append(threading.current_thread())
+                yield part
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await ASGIHandler().send_response(StreamingHttpResponse(parts()), send)
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(b"".join(m.get("body", b"") for m in messages[1:]), b"one\ntwo\n")
+        self.assertFalse(messages[-1].get("more_body", False))
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalFeedTest(StandInFeedMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        StandInFeedHandler.requests = []
+        patcher = mock.patch.object(views, "BLOG_FEED_URL", self.feed_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_validators_are_saved_and_sent_back(self):
+        first = views._fetch_blog_cache_value()
+        self.assertEqual([e["title"] for e in first["entries"]], ["Stand-in post"])
+        self.assertEqual(first["etag"], StandInFeedHandler.etag)
+        self.assertEqual(first["modified"], StandInFeedHandler.last_modified)
+
+        with mock.patch.object(views, "_parse_blog_entries") as parse:
+            second = views._fetch_blog_cache_value(first)
+        parse.assert_not_called()
+
+        self.assertEqual(StandInFeedHandler.requests[1]["If-None-Match"], StandInFeedHandler.etag)
+        self.assertEqual(
+            StandInFeedHandler.requests[1]["If-Modified-Since"], StandInFeedHandler.last_modified
+        )
+        self.assertEqual(second["entries"], first["entries"])
+        self.assertGreaterEqual(second["fetched_at"], first["fetched_at"])
+
+    def test_slow_feed_times_out(self):
+        with mock.patch.object(StandInFeedHandler, "delay", 0.5), mock.patch.object(
+            views, "BLOG_FETCH_TIMEOUT", (1, 0.1)
+        ):
+            with self.assertRaises(requests.Timeout):
+                views._fetch_blog_cache_value()
+
+    def test_not_modified_refresh_extends_cached_entries(self):
+        first = views._fetch_blog_cache_value()
+        first["fetched_at"] = 0
+        cache.set(views.BLOG_CACHE_KEY, first)
+
+        views._refresh_blog_in_background(first).join()
+
+        cached = cache.get(views.BLOG_CACHE_KEY)
+        self.assertEqual(cached["entries"], first["entries"])
+        self.assertGreater(cached["fetched_at"], 0)
+        self.assertEqual(len(StandInFeedHandler.requests), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight("expensive", compute, 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 5)
+
+    def test_waiter_gets_stale_value(self):
+        lock = CacheLock("expensive")
+        self.assertTrue(lock.acquire())
+        compute = mock.Mock(return_value="fresh")
+        self.assertEqual(single_flight("expensive", compute, 60, wait=0.1, stale="stale"), "stale")
+        compute.assert_not_called()
+
+    def test_waiter_computes_after_holder_gives_up(self):
+        lock = CacheLock("expensive")
+        self.assertTrue(lock.acquire())
+        threading.Timer(0.05, lock.release).start()
+        self.assertEqual(single_flight("expensive", lambda: "fresh", 60, wait=1), "fresh")
+
+    def test_release_leaves_a_lock_taken_over_after_lease(self):
+        lock = CacheLock("expensive")
+        self.assertTrue(lock.acquire())
+        cache.set(lock.key, "someone else")
+        lock.release()
+        self.assertTrue(lock.locked())
+
+    def test_release_leaves_a_lock_whose_lease_is_running_out(self):
+        # Past or close to the lease's end, the key could expire and be taken
+        # by someone else between release()'s get and its delete.
+        for elapsed in (9.5, 11):
+            lock = CacheLock("expensive", lease=10)
+            self.assertTrue(lock.acquire())
+            with mock.patch("com.cache.time.monotonic", return_value=lock.acquired_at + elapsed):
+                lock.release()
+            self.assertTrue(lock.locked())
+            self.assertIsNone(lock.token)
+            cache.delete(lock.key)
+
+    def test_release_drops_its_own_lock(self):
+        lock = CacheLock("expensive", lease=10)
+        self.assertTrue(lock.acquire())
+        lock.release()
+        self.assertFalse(lock.locked())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HomepageVariantTest(TestCase):
+    entries = [{"link": "http://www.ofbrooklyn.com/post/", "title": "Post", "date": None}]
+
+    def setUp(self):
+        views._homepage_pool.clear()
+        patcher = mock.patch.object(views, "_get_blog_entries", return_value=self.entries)
+        self.get_blog_entries = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_homepage_is_gzipped_with_strong_etag(self):
+        response = self.client.get("/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertIn(b"Post", gzip.decompress(response.content))
+
+    def test_any_variant_etag_gets_304(self):
+        response = self.client.get("/")
+        for _ in range(5):
+            cached = self.client.get("/", HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(cached.status_code, 304)
+
+    def test_pool_is_rerendered_when_blog_changes(self):
+        with mock.patch.object(views, "render_to_string", wraps=views.render_to_string) as render:
+            self.client.get("/")
+            self.client.get("/")
+            self.assertEqual(render.call_count, len(views._is_a_quotes()))
+
+            old_etag = self.client.get("/")["ETag"]
+            self.get_blog_entries.return_value = [
+                {"link": "http://www.ofbrooklyn.com/new/", "title": "New", "date": None}
+            ]
+            response = self.client.get("/", HTTP_IF_NONE_MATCH=old_etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(render.call_count, 2 * len(views._is_a_quotes()))
+
+
+TWO_TIER_CACHES = {
+    "default": {
+        "BACKEND": "com.cache_backends.TwoTierCache",
+        "LOCATION": "two-tier-shared",
+        "OPTIONS": {"MAX_BYTES": 4096, "CHECK_INTERVAL": 0},
+    },
+    "two-tier-shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "two-tier"},
+}
+
+
+@override_settings(CACHES=TWO_TIER_CACHES)
+class TwoTierCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shared = caches["two-tier-shared"]
+
+    def test_hits_are_served_locally(self):
+        cache.set("blog_entries", ["entry"])
+        with mock.patch.object(self.shared, "get", wraps=self.shared.get) as shared_get:
+            for _ in range(3):
+                self.assertEqual(cache.get("blog_entries"), ["entry"])
+        # Only the generation check reaches the shared cache.
+        self.assertEqual([c.args[0] for c in shared_get.call_args_list], [TwoTierCache.generation_key] * 3)
+
+    def test_write_from_another_worker_invalidates(self):
+        cache.set("blog_entries", ["old"])
+        self.assertEqual(cache.get("blog_entries"), ["old"])
+
+        # What another process's TwoTierCache.set() does to the shared cache.
+        self.shared.set("blog_entries", ["new"])
+        self.shared.set(TwoTierCache.generation_key, "another-worker")
+
+        self.assertEqual(cache.get("blog_entries"), ["new"])
+
+    def test_read_racing_a_write_doesnt_undo_it(self):
+        cache.set("blog_entries", ["old"])
+        cache.local.clear()
+        shared_get = self.shared.get
+
+        def get_then_write(key, *args, **kwargs):
+            value = shared_get(key, *args, **kwargs)
+            if key == "blog_entries":
+                # Another thread writes between our read and our local copy.
+                cache.set("blog_entries", ["new"])
+            return value
+
+        with mock.patch.object(self.shared, "get", side_effect=get_then_write):
+            self.assertEqual(cache.get("blog_entries"), ["old"])
+        self.assertEqual(cache.get("blog_entries"), ["new"])
+
+    def test_own_write_doesnt_hide_another_workers(self):
+        cache.check_interval = 60
+        self.addCleanup(setattr, cache, "check_interval", 0)
+        cache.set("blog_entries", ["old"])
+        cache.get("blog_entries")
+
+        self.shared.set("blog_entries", ["new"])
+        self.shared.set(TwoTierCache.generation_key, "another-worker")
+        cache.set("homepage", "page")
+
+        self.assertEqual(cache.get("blog_entries"), ["new"])
+
+    def test_locks_dont_invalidate(self):
+        cache.set("blog_entries", ["entry"])
+        generation = self.shared.get(TwoTierCache.generation_key)
+
+        lock = CacheLock("blog_entries")
+        self.assertTrue(lock.acquire())
+        self.assertFalse(CacheLock("blog_entries").acquire())
+        self.assertTrue(lock.locked())
+        lock.release()
+        self.assertFalse(lock.locked())
+
+        self.assertEqual(self.shared.get(TwoTierCache.generation_key), generation)
+        self.assertIsNotNone(cache.local.get(cache.make_key("blog_entries")))
+
+    def test_local_entries_respect_timeouts(self):
+        cache.set("short", "value", 0.05)
+        time.sleep(0.1)
+        with mock.patch.object(self.shared, "get", return_value=None):
+            self.assertIsNone(cache.get("short"))
+
+    def test_local_tier_is_bounded_in_bytes(self):
+        for i in range(20):
+            cache.set("key-%s" % i, "x" * 256)
+        self.assertLessEqual(cache.local.size, 4096)
+        self.assertEqual(cache.get("key-0"), "x" * 256)
+
+
+INSTRUMENTED_CACHES = {
+    "default": {
+        "BACKEND": "com.cache_backends.InstrumentedCache",
+        "LOCATION": "instrumented-two-tier",
+        "OPTIONS": {"FLUSH_INTERVAL": 3600, "STATS_LOCATION": "instrumented-shared"},
+    },
+    "instrumented-two-tier": {
+        "BACKEND": "com.cache_backends.TwoTierCache",
+        "LOCATION": "instrumented-shared",
+    },
+    "instrumented-shared": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "instrumented",
+    },
+}
+
+
+@override_settings(CACHES=INSTRUMENTED_CACHES)
+class InstrumentedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache.stats.prefixes = {}
+
+    def test_counts_per_prefix(self):
+        cache.get("blog_entries")
+        cache.set("blog_entries", ["entry"])
+        cache.get("blog_entries")
+        cache.add("blog_entries:lock", "token")
+        cache.delete("blog_entries:lock")
+        cache.get("homepage")
+
+        report = stats_report(cache)
+        blog = report["prefixes"]["blog_entries"]
+        self.assertEqual((blog["hits"], blog["misses"], blog["sets"], blog["deletes"]), (1, 1, 2, 1))
+        self.assertEqual(blog["hit_ratio"], 0.5)
+        self.assertGreater(blog["bytes_read"], 0)
+        self.assertEqual(blog["latency_ms"]["get"]["count"], 2)
+        self.assertEqual(report["prefixes"]["homepage"]["misses"], 1)
+
+    def test_reads_arent_pickled_to_be_measured(self):
+        cache.set("blog_entries", ["entry"])
+        with mock.patch("com.cache_backends.pickle.dumps", wraps=pickle.dumps) as dumps:
+            cache.get("blog_entries")
+        dumps.assert_not_called()
+
+        blog = stats_report(cache)["prefixes"]["blog_entries"]
+        self.assertEqual(blog["bytes_read"], len(pickle.dumps(["entry"], pickle.HIGHEST_PROTOCOL)))
+
+    def test_writes_are_pickled_once(self):
+        with mock.patch("com.cache_backends.pickle.dumps", wraps=pickle.dumps) as dumps:
+            cache.wrapped.set("blog_entries", ["entry"])
+            cache.wrapped.add("blog_entries:lock", "token")
+        uninstrumented = dumps.call_count
+        cache.clear()
+        with mock.patch("com.cache_backends.pickle.dumps", wraps=pickle.dumps) as dumps:
+            cache.set("blog_entries", ["entry"])
+            cache.add("blog_entries:lock", "token")
+        self.assertEqual(dumps.call_count, uninstrumented)
+
+        blog = stats_report(cache)["prefixes"]["blog_entries"]
+        self.assertEqual(blog["bytes_written"], len(pickle.dumps(["entry"], pickle.HIGHEST_PROTOCOL)))
+
+    def test_forked_workers_count_for_themselves(self):
+        cache.get("blog_entries")
+        read, write = os.pipe()
+        pid = os.fork()
+        if not pid:
+            # As a gunicorn worker forked from a preloaded master.
+            os.close(read)
+            os.write(write, json.dumps([cache.stats.process_key, list(cache.stats.prefixes)]).encode())
+            os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as f:
+            process_key, prefixes = json.loads(f.read())
+        os.waitpid(pid, 0)
+        self.assertEqual(process_key, "cache_stats:%s:%s" % (socket.gethostname(), pid))
+        self.assertEqual(prefixes, [])
+
+    def test_merges_every_process(self):
+        cache.get("blog_entries")
+        other = CacheStats()
+        other.process_key = "cache_stats:elsewhere:1"
+        other.record("get", "blog_entries", 0.001, hit=True, nbytes=10)
+        other.flush(cache.stats_cache)
+
+        report = stats_report(cache)
+        self.assertEqual(len(report["processes"]), 2)
+        self.assertEqual(report["prefixes"]["blog_entries"]["hits"], 1)
+        self.assertEqual(report["prefixes"]["blog_entries"]["misses"], 1)
+
+    def test_view_is_staff_only(self):
+        self.assertEqual(self.client.get("/cache-stats/").status_code, 302)
+
+        User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.login(username="staff", password="password")
+        response = self.client.get("/cache-stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("prefixes", response.json())
+
+    def test_command(self):
+        cache.get("blog_entries")
+        out = StringIO()
+        call_command("cache_stats", stdout=out)
+        self.assertIn("blog_entries", out.getvalue())
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.data = b"".join(b"%05d," % i for i in range(20000))
+        with open(os.path.join(self.root, "crashes.csv"), "wb") as f:
+            f.write(self.data)
+        with open(os.path.join(self.root, "crashes.csv.gz"), "wb") as f:
+            f.write(gzip.compress(self.data))
+        with open(os.path.join(self.root, "styles.css"), "wb") as f:
+            f.write(b"body { color: black; }")
+        self.django = mock.Mock(return_value=[b"django"])
+        self.app = StaticFiles(self.django, {"/boston-bikes/": self.root})
+
+    def request(self, path, method="GET", **headers):
+        environ = {"REQUEST_METHOD": method, "PATH_INFO": path}
+        environ.update(("HTTP_" + k.upper(), v) for k, v in headers.items())
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, headers):
+            response["status"] = int(status.split()[0])
+            response["headers"] = dict(headers)
+
+        response["body"] = b"".join(self.app(environ, start_response))
+        return response
+
+    def test_serves_indexed_files_without_django(self):
+        response = self.request("/boston-bikes/styles.css")
+        self.assertEqual(response["status"], 200)
+        self.assertEqual(response["body"], b"body { color: black; }")
+        self.assertEqual(response["headers"]["Content-Type"], "text/css; charset=utf-8")
+        self.django.assert_not_called()
+
+    def test_preload(self):
+        self.app.preload()
+        self.assertEqual(self.app.files["/boston-bikes/styles.css"].body, b"body { color: black; }")
+        # Big enough to be sent with sendfile, and precompressed besides.
+        self.assertIsNone(self.app.files["/boston-bikes/crashes.csv"].body)
+
+    async def test_asgi(self):
+        async def django(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"django"})
+
+        app = ASGIStaticFiles(django, {"/boston-bikes/": self.root})
+
+        async def request(path, **headers):
+            scope = {"type": "http", "method": "GET", "path": path}
+            scope["headers"] = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            await app(scope, None, send)
+            body = b"".join(m["body"] for m in messages[1:])
+            return messages[0]["status"], dict(messages[0]["headers"]), body
+
+        status, headers, body = await request("/boston-bikes/styles.css")
+        self.assertEqual((status, body), (200, b"body { color: black; }"))
+        self.assertEqual(headers[b"content-type"], b"text/css; charset=utf-8")
+        # Read from disk in blocks, in a thread.
+        self.assertEqual((await request("/boston-bikes/crashes.csv"))[2], self.data)
+        self.assertEqual((await request("/boston-bikes/crashes.csv", range="bytes=6-11"))[2], b"00001,")
+        status, _, _ = await request("/boston-bikes/styles.css", if_none_match=headers[b"etag"].decode())
+        self.assertEqual(status, 304)
+        self.assertEqual((await request("/boston-bikes/missing.css"))[2], b"django")
+
+    def test_unknown_paths_and_posts_fall_through(self):
+        self.assertEqual(self.request("/boston-bikes/missing.css")["body"], b"django")
+        self.assertEqual(self.request("/boston-bikes/../settings.py")["body"], b"django")
+        self.assertEqual(self.request("/boston-bikes/styles.css", method="POST")["body"], b"django")
+
+    def test_etag_revalidation(self):
+        etag = self.request("/boston-bikes/styles.css")["headers"]["ETag"]
+        response = self.request("/boston-bikes/styles.css", if_none_match=etag)
+        self.assertEqual(response["status"], 304)
+        self.assertEqual(response["body"], b"")
+
+    def test_precompressed_sibling(self):
+        response = self.request("/boston-bikes/crashes.csv", accept_encoding="gzip, deflate")
+        self.assertEqual(response["headers"]["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response["body"]), self.data)
+        self.assertEqual(self.request("/boston-bikes/crashes.csv.gz")["body"], b"django")
+
+    def test_ranges(self):
+        response = self.request("/boston-bikes/crashes.csv", range="bytes=6-11")
+        self.assertEqual(response["status"], 206)
+        self.assertEqual(response["body"], b"00001,")
+        self.assertEqual(response["headers"]["Content-Range"], "bytes 6-11/%s" % len(self.data))
+
+        response = self.request("/boston-bikes/crashes.csv", range="bytes=-6")
+        self.assertEqual(response["body"], b"19999,")
+
+        response = self.request("/boston-bikes/crashes.csv", range="bytes=%s-" % len(self.data))
+        self.assertEqual(response["status"], 416)
+
+        response = self.request("/boston-bikes/crashes.csv", range="bytes=0-1", if_range='"outdated"')
+        self.assertEqual(response["status"], 200)
+        self.assertEqual(response["body"], self.data)
+
+    def test_hashed_urls_are_immutable(self):
+        manifest = build_manifest({"/boston-bikes/": self.root})
+        self.assertNotIn("/boston-bikes/crashes.csv.gz", manifest)
+        hashed_url = manifest["/boston-bikes/styles.css"]
+        self.assertRegex(hashed_url, r"^/boston-bikes/styles\.[0-9a-f]{12}\.css$")
+
+        self.app = StaticFiles(self.django, {"/boston-bikes/": self.root}, manifest=manifest)
+        response = self.request(hashed_url)
+        self.assertEqual(response["body"], b"body { color: black; }")
+        self.assertEqual(response["headers"]["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertNotIn("Cache-Control", self.request("/boston-bikes/styles.css")["headers"])
+
+    def test_changed_files_lose_their_immutable_hashed_urls(self):
+        manifest = build_manifest({"/boston-bikes/": self.root})
+        hashed_url = manifest["/boston-bikes/styles.css"]
+        # Edited since the manifest was built, and not rebuilt.
+        with open(os.path.join(self.root, "styles.css"), "wb") as f:
+            f.write(b"body { color: red; }")
+
+        self.app = StaticFiles(self.django, {"/boston-bikes/": self.root}, manifest=manifest)
+        response = self.request(hashed_url)
+        self.assertEqual(response["body"], b"body { color: red; }")
+        self.assertNotIn("Cache-Control", response["headers"])
+        self.assertEqual(
+            self.request(manifest["/boston-bikes/crashes.csv"])["headers"]["Cache-Control"],
+            "public, max-age=31536000, immutable",
+        )
+
+        # And when it's edited while being served, with check_mtime.
+        self.app = StaticFiles(
+            self.django, {"/boston-bikes/": self.root}, manifest=manifest, check_mtime=True
+        )
+        stat = os.stat(os.path.join(self.root, "crashes.csv"))
+        with open(os.path.join(self.root, "crashes.csv"), "ab") as f:
+            f.write(b"20000,")
+        os.utime(os.path.join(self.root, "crashes.csv"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertNotIn("Cache-Control", self.request(manifest["/boston-bikes/crashes.csv"])["headers"])
+
+
+class AssetTagTest(TestCase):
+    template = Template('{% load assets %}<link href="{% asset "/static/styles/global.css" %}" />')
+
+    def test_resolves_hashed_url(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            write_manifest(f.name, {"/static/styles/global.css": "/static/styles/global.0123456789ab.css"})
+            with override_settings(STATIC_MANIFEST=f.name):
+                html = self.template.render(Context())
+        self.assertEqual(html, '<link href="/static/styles/global.0123456789ab.css" />')
+
+    def test_falls_back_without_manifest(self):
+        with override_settings(STATIC_MANIFEST="/nonexistent/static-manifest.json"):
+            html = self.template.render(Context())
+        self.assertEqual(html, '<link href="/static/styles/global.css" />')
+
+
+class ResponsiveImageTest(TestCase):
+    template = Template(
+        '{% load assets %}{% responsive_img "/static/images/glider.png" sizes="62px" alt="Glider" %}'
+    )
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_plain_img_without_derivatives(self):
+        with override_settings(IMAGE_DERIVATIVES_ROOT=self.root):
+            html = self.template.render(Context())
+        self.assertEqual(html, '<img alt="Glider" src="/static/images/glider.png">')
+
+    def test_picture_with_derivatives(self):
+        entry = {
+            "width": 800,
+            "height": 400,
+            "sources": {
+                "webp": [[320, "static/images/glider-320w.webp"], [800, "static/images/glider-800w.webp"]],
+                "png": [[320, "static/images/glider-320w.png"], [800, "static/images/glider-800w.png"]],
+            },
+        }
+        write_manifest(os.path.join(self.root, "manifest.json"), {"/static/images/glider.png": entry})
+        with override_settings(IMAGE_DERIVATIVES_ROOT=self.root):
+            html = self.template.render(Context())
+        self.assertTrue(html.startswith('<picture><source type="image/webp" '))
+        self.assertIn(
+            'srcset="/static/derivatives/static/images/glider-320w.webp 320w, '
+            '/static/derivatives/static/images/glider-800w.webp 800w"',
+            html,
+        )
+        self.assertNotIn("image/avif", html)
+        self.assertIn('srcset="/static/derivatives/static/images/glider-320w.png 320w, ', html)
+        self.assertIn(' width="800"', html)
+        self.assertIn(' height="400"', html)
+        self.assertTrue(html.endswith("></picture>"))
+
+    def test_portfolio_serves_derivatives(self):
+        entry = {"width": 800, "height": 400, "sources": {"jpg": [[320, "portfolio/grove-flower-320w.jpg"]]}}
+        write_manifest(os.path.join(self.root, "manifest.json"), {"/portfolio/grove-flower.jpg": entry})
+        with override_settings(IMAGE_DERIVATIVES_ROOT=self.root):
+            response = self.client.get("/portfolio/")
+        self.assertContains(response, 'srcset="/static/derivatives/portfolio/grove-flower-320w.jpg 320w"')
+        self.assertNotContains(response, '<img src="')
+
+    def test_render_derivatives(self):
+        from PIL import Image
+
+        from com.images import is_up_to_date, render_derivatives
+
+        source = os.path.join(self.root, "photo.jpg")
+        Image.new("RGB", (700, 350), "red").save(source)
+        entry = render_derivatives(source, os.path.join(self.root, "out", "photo"), ["webp"])
+        self.assertEqual((entry["width"], entry["height"]), (700, 350))
+        self.assertEqual([width for width, _ in entry["sources"]["webp"]], [320, 640, 700])
+        with Image.open(entry["sources"]["jpg"][0][1]) as small:
+            self.assertEqual(small.size, (320, 160))
+
+        self.assertTrue(is_up_to_date(entry, source, self.root, ["webp"]))
+        self.assertFalse(is_up_to_date(entry, source, self.root, ["avif", "webp"]))
+        os.utime(source, (0, 0))
+        self.assertTrue(is_up_to_date(entry, source, self.root, ["webp"]))
+        self.assertEqual(entry["mtime"], 0)
+
+
+def square_feature(x, y, size=1):
+    return {
+        "type": "Feature",
+        "properties": {},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]],
+        },
+    }
+
+
+class BikeDataTest(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        with open(os.path.join(self.data_dir, "crashopendata.csv"), "w") as f:
+            f.write(
+                '"dispatch_ts","mode_type","location_type","lat","long"\r\n'
+                "2015-01-01 00:24:27,mv,Intersection,42.2897498978,-71.0525153263\r\n"
+                "2015-01-01 18:23:57,bike,Intersection,42.3054125462,-71.0691630271\r\n"
+                "2015-01-02 08:00:00,bike,Street,,\r\n"
+                "2015-01-03 09:12:00,bike,Street,42.3,-71.1\r\n"
+            )
+        with open(os.path.join(self.data_dir, "Vision_Zero_Entry.csv"), "w", encoding="utf-8-sig") as f:
+            f.write(
+                "X,Y,REQUESTTYPE,REQUESTDATE,COMMENTS,USERTYPE\n"
+                "-71.054143788609025,42.354167552594276,"
+                "of something that is not listed here,2016-01-20,,walks\n"
+                "-71.058698179725866,42.343488869715976,"
+                'bike facilities don\'t exist,2016-01-19,"Wide, fast",bikes\n'
+            )
+
+    def test_filters_and_prunes(self):
+        self.assertEqual(
+            DATASETS["bike-crashes"].build(self.data_dir),
+            "lat,long\n42.30541,-71.06916\n42.3,-71.1\n",
+        )
+        self.assertEqual(DATASETS["bike-requests"].build(self.data_dir), "X,Y\n-71.0587,42.34349\n")
+
+    def test_endpoint(self):
+        with override_settings(BIKES_DATA_DIR=self.data_dir):
+            response = self.client.get("/boston-bikes/data/bike-crashes.csv")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+            self.assertEqual(response["Cache-Control"], views.BIKE_DATA_CACHE_CONTROL)
+            self.assertEqual(response.content, b"lat,long\n42.30541,-71.06916\n42.3,-71.1\n")
+
+            response = self.client.get(
+                "/boston-bikes/data/bike-crashes.csv", HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_map_layer_endpoint(self):
+        with open(os.path.join(self.data_dir, "neighborhoods.js"), "w") as f:
+            layer = {"type": "FeatureCollection", "features": [square_feature(-71.1, 42.3, 0.01)]}
+            f.write("var neighborhoods_json = %s;" % json.dumps(layer))
+        with override_settings(BIKES_DATA_DIR=self.data_dir):
+            response = self.client.get("/boston-bikes/data/neighborhoods-z1.json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["type"], "Topology")
+            self.assertEqual(len(response.json()["objects"]["neighborhoods"]["geometries"]), 1)
+            self.assertEqual(self.client.get("/boston-bikes/data/neighborhoods-z2.json").status_code, 404)
+            self.assertEqual(self.client.get("/boston-bikes/data/open-space-z1.json").status_code, 404)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_tiles(self):
+        west, south, east, north = tile_bounds(13, 2478, 3031)
+        self.assertTrue(west < -71.1 < east and south < 42.3 < north)
+        with override_settings(BIKES_DATA_DIR=self.data_dir):
+            topology = self.client.get("/boston-bikes/tiles/bike-crashes/13/2478/3031.json").json()
+            self.assertEqual(
+                [geometry["id"] for geometry in topology["objects"]["bike-crashes"]["geometries"]], [0, 1]
+            )
+            index = tile_index("bike-crashes", self.data_dir)
+            self.assertIn((13, 2478, 3031), index.rendered)
+            with mock.patch.object(index, "tile") as tile:
+                self.client.get("/boston-bikes/tiles/bike-crashes/13/2478/3031.json")
+            tile.assert_not_called()
+            self.assertFalse(cache.has_key("bike_tile:bike-crashes:%d:13:2478:3031" % index.generation))
+            topology = self.client.get("/boston-bikes/tiles/bike-crashes/13/2479/3031.json").json()
+            self.assertEqual(topology["objects"]["bike-crashes"]["geometries"], [])
+
+            self.assertEqual(self.client.get("/boston-bikes/tiles/bike-crashes/3/1/1.json").status_code, 404)
+            self.assertEqual(
+                self.client.get("/boston-bikes/tiles/bike-crashes/13/9000/1.json").status_code, 404
+            )
+            self.assertEqual(
+                self.client.get("/boston-bikes/tiles/bike-racks/13/2478/3030.json").status_code, 404
+            )
+
+    def test_bins(self):
+        with override_settings(BIKES_DATA_DIR=self.data_dir):
+            response = self.client.get("/boston-bikes/bins/crashes/hex-z1.json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Cache-Control"], views.BIKE_DATA_CACHE_CONTROL)
+            bins = response.json()
+            self.assertEqual((bins["kind"], bins["zoom"], bins["filters"]), ("hex", 1, {}))
+            self.assertEqual(sorted(bins["bins"]["count"]), [1, 1, 1])
+            self.assertEqual(bins["breakdowns"]["year"]["labels"], ["2015"])
+            self.assertEqual(bins["breakdowns"]["mode_type"]["labels"], ["bike", "mv"])
+
+            bins = self.client.get("/boston-bikes/bins/crashes/grid-z4.json?mode_type=bike").json()
+            self.assertEqual(bins["filters"], {"mode_type": "bike"})
+            self.assertEqual(sorted(bins["bins"]["count"]), [1, 1])
+            self.assertEqual(bins["breakdowns"]["mode_type"]["counts"], [[1, 0], [1, 0]])
+
+            self.assertEqual(
+                self.client.get("/boston-bikes/bins/crashes/hex-z1.json?mode_type=car").status_code, 404
+            )
+            bins = self.client.get(
+                "/boston-bikes/bins/crashes/grid-z4.json?mode_type=bike&utm_source=x"
+            ).json()
+            self.assertEqual(bins["filters"], {"mode_type": "bike"})
+            self.assertEqual(self.client.get("/boston-bikes/bins/crashes/hex-z2.json").status_code, 404)
+
+            crashes = crash_bins("crashes", self.data_dir)
+            with mock.patch.object(bike_data, "TILE_CACHE_SIZE", 2):
+                for query in ("year=2015", "mode_type=bike", "mode_type=mv"):
+                    self.client.get("/boston-bikes/bins/crashes/hex-z1.json?" + query)
+            self.assertEqual(
+                list(crashes.rendered),
+                [("hex", 1, (("mode_type", "bike"),)), ("hex", 1, (("mode_type", "mv"),))],
+            )
+
+    def test_stream(self):
+        with override_settings(BIKES_DATA_DIR=self.data_dir):
+            response = self.client.get("/boston-bikes/stream/crashes.ndjson", HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            records = [
+                json.loads(line)
+                for line in gzip.decompress(b"".join(response.streaming_content)).splitlines()
+            ]
+            self.assertEqual([record["mode_type"] for record in records], ["bike", "bike", "mv"])
+            self.assertEqual(
+                records[0],
+                {
+                    "lat": 42.30541,
+                    "long": -71.06916,
+                    "mode_type": "bike",
+                    "location_type": "Intersection",
+                    "date": "2015-01-01 18:23:57",
+                },
+            )
+
+            response = self.client.get("/boston-bikes/stream/requests.ndjson")
+            records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+            self.assertEqual([record["user_type"] for record in records], ["bikes", "walks"])
+            self.assertEqual(self.client.get("/boston-bikes/stream/racks.ndjson").status_code, 404)
+
+    def test_stream_chunks(self):
+        chunks = list(RECORD_STREAMS["crashes"].chunks(self.data_dir, size=2))
+        self.assertEqual([chunk.count(b"\n") for chunk in chunks], [2, 1])
+
+
+class BinningTest(TestCase):
+    def test_hex_cells_are_nearest_centre(self):
+        import numpy as np
+
+        x, y = np.random.RandomState(0).uniform(-10, 10, (2, 1000))
+        columns, rows = hex_cells(x, y, 1)
+        centre_x, centre_y = hex_centers(columns, rows, 1)
+        distance = np.hypot(x - centre_x, y - centre_y)
+        # No neighbouring centre is any closer.
+        for dx, dy in [(np.sqrt(3), 0), (np.sqrt(3) / 2, 1.5), (-np.sqrt(3) / 2, 1.5)]:
+            for sign in (1, -1):
+                self.assertTrue(
+                    (distance <= np.hypot(x - centre_x - sign * dx, y - centre_y - sign * dy) + 1e-9).all()
+                )
+
+    def test_aggregate(self):
+        import numpy as np
+
+        longitudes = np.array([0.01, 0.02, 0.51, 0.52, 0.53])
+        latitudes = np.zeros(5)
+        dimensions = {"mode": (["bike", "car"], np.array([0, 1, 1, 1, 0]))}
+        result = aggregate(longitudes, latitudes, "grid", 0.5, dimensions)
+        self.assertEqual(
+            result["bins"], {"longitude": [0.25, 0.75], "latitude": [0.25, 0.25], "count": [2, 3]}
+        )
+        self.assertEqual(
+            result["breakdowns"]["mode"], {"labels": ["bike", "car"], "counts": [[1, 1], [1, 2]]}
+        )
+
+
+class TopologyTest(TestCase):
+    def decode(self, topology, refs):
+        arcs = []
+        for arc in topology["arcs"]:
+            points, x, y = [], 0, 0
+            for dx, dy in arc:
+                x, y = x + dx, y + dy
+                points.append((x, y))
+            arcs.append(points)
+        points = []
+        for ref in refs:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            points.extend(arc[1:] if points else arc)
+        return points
+
+    def test_shared_border_is_one_arc(self):
+        builder = TopologyBuilder(step=0.5, tolerance=0.1)
+        topology = builder.build("squares", [square_feature(0, 0), square_feature(1, 0)])
+        left, right = topology["objects"]["squares"]["geometries"]
+        self.assertEqual(left["type"], "Polygon")
+        self.assertEqual(len(topology["arcs"]), 3)
+        shared = set(left["arcs"][0]) & {~ref for ref in right["arcs"][0]}
+        self.assertEqual(len(shared), 1)
+        self.assertEqual(self.decode(topology, left["arcs"][0]), [(2, 0), (2, 2), (0, 2), (0, 0), (2, 0)])
+
+    def test_drops_polygons_smaller_than_a_pixel(self):
+        builder = TopologyBuilder(step=0.01, tolerance=0.05, min_area=1)
+        topology = builder.build("parks", [square_feature(0, 0, 10), square_feature(20, 20, 0.5)])
+        self.assertEqual(len(topology["objects"]["parks"]["geometries"]), 1)
+        self.assertEqual(len(topology["arcs"]), 1)
+
+    def test_points(self):
+        builder = TopologyBuilder(step=0.5, tolerance=0.1)
+        features = [
+            dict(square_feature(0, 0), id=7),
+            {"id": 8, "geometry": {"type": "Point", "coordinates": [3, 1]}},
+        ]
+        topology = builder.build("mixed", features)
+        polygon, point = topology["objects"]["mixed"]["geometries"]
+        self.assertEqual((polygon["id"], point["id"]), (7, 8))
+        self.assertEqual(point, {"type": "Point", "coordinates": [6, 2], "id": 8})
+
+    def test_grid_index(self):
+        features = [
+            square_feature(0, 0),
+            square_feature(0.5, 0.5, 2),
+            square_feature(5, 5),
+            {"geometry": None},
+        ]
+        index = GridIndex(feature_bounds(features), cell_size=1)
+        self.assertEqual(index.query(0.1, 0.1, 0.2, 0.2).tolist(), [0])
+        self.assertEqual(index.query(0.9, 0.9, 1.1, 1.1).tolist(), [0, 1])
+        self.assertEqual(index.query(-180, -90, 180, 90).tolist(), [0, 1, 2])
+        self.assertEqual(index.query(3.1, 3.1, 4.9, 4.9).tolist(), [])
+
+    def test_simplify(self):
+        import numpy as np
+
+        line = np.array([[0, 0], [1, 0], [2, 1], [3, 0], [4, 0]])
+        self.assertEqual(simplify(line, 0.5).tolist(), [[0, 0], [2, 1], [4, 0]])
+        self.assertEqual(simplify(line, 2).tolist(), [[0, 0], [4, 0]])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        with self.assertLogs("com.timing", "INFO") as logs:
+            response = self.client.get("/portfolio/")
+        metrics = [metric.split(";")[0] for metric in response["Server-Timing"].split(", ")]
+        self.assertEqual(metrics, ["render", "total"])
+        logged = json.loads(logs.records[0].getMessage())
+        self.assertEqual((logged["path"], logged["status"]), ("/portfolio/", 200))
+        self.assertEqual(logged["spans"]["render"]["count"], 1)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request(self):
+        self.assertNotIn("Server-Timing", self.client.get("/portfolio/"))
+
+    def test_spans(self):
+        # Nothing to record into outside a sampled request.
+        with timing.span("http"):
+            pass
+        timing.record("sql", 1)
+
+        timings = timing.Timings()
+        token = timing._current.set(timings)
+        try:
+            with timing.span("http"):
+                pass
+            timing.record("sql", 0.002)
+            timing.record("sql", 0.001)
+        finally:
+            timing._current.reset(token)
+        self.assertEqual(set(timings.spans), {"http", "sql"})
+        self.assertEqual(timings.spans["sql"][1], 2)
+        self.assertTrue(timings.header(0.01).endswith('sql;dur=3.0;desc="2 calls", total;dur=10.0'))
+
+
+class FragmentTest(TestCase):
+    def setUp(self):
+        self.template_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.template_dir)
+        self.addCleanup(clear_fragments)
+        self.path = os.path.join(self.template_dir, "page.html")
+        with open(self.path, "w") as f:
+            f.write(
+                "{% load fragments %}{{ live }} "
+                '{% fragment "static" year %}{{ live }} {{ year }}{% endfragment %}'
+            )
+        self.engine = Engine(dirs=[self.template_dir], libraries={"fragments": "com.templatetags.fragments"})
+
+    def render(self, **context):
+        return self.engine.get_template("page.html").render(Context(context))
+
+    def test_reused_until_template_changes(self):
+        self.assertEqual(self.render(live=1, year=2025), "1 1 2025")
+        self.assertEqual(self.render(live=2, year=2025), "2 1 2025")
+        self.assertEqual(self.render(live=3, year=2026), "3 3 2026")
+
+        # As a deploy does: a new process compiles the changed template.
+        os.utime(self.path, (time.time() + 10, time.time() + 10))
+        self.engine.template_loaders[0].reset()
+        self.assertEqual(self.render(live=4, year=2025), "4 4 2025")
+
+    def test_renders_dont_stat_the_template(self):
+        self.render(live=1, year=2025)
+        with mock.patch("com.templatetags.fragments.os.path.getmtime") as getmtime:
+            self.assertEqual(self.render(live=2, year=2025), "2 1 2025")
+        getmtime.assert_not_called()
+
+    @override_settings(DEBUG=True)
+    def test_debug_picks_up_template_changes(self):
+        self.assertEqual(self.render(live=1, year=2025), "1 1 2025")
+        os.utime(self.path, (time.time() + 10, time.time() + 10))
+        self.assertEqual(self.render(live=2, year=2025), "2 2 2025")
+
+
+# Has a com.workers.ThreadWorker that's on its way out serve a connection
+# it accepted but hadn't read from yet, the way its run() loop would after
+# a last select(). Run from outside the project, where gunicorn.py doesn't
+# shadow gunicorn.
+RETIRING_WORKER = """
+import selectors, socket, sys
+from concurrent import futures
+from threading import RLock
+
+sys.path.append(sys.argv[1])
+from gunicorn.config import Config
+from gunicorn.glogging import Logger
+from com.workers import ThreadWorker
+
+def app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"served"]
+
+cfg = Config()
+worker = ThreadWorker(0, 0, [], None, 30, cfg, Logger(cfg))
+worker.wsgi = app
+worker.tpool = worker.get_thread_pool()
+worker.poller = selectors.DefaultSelector()
+worker._lock = RLock()
+listener = socket.create_server(("127.0.0.1", 0))
+client = socket.create_connection(listener.getsockname())
+client.sendall(b"GET / HTTP/1.1\\r\\nHost: test\\r\\n\\r\\n")
+worker.accept(listener.getsockname(), listener)
+worker.alive = False
+worker.murder_keepalived()
+futures.wait(worker.futures, timeout=5)
+client.settimeout(5)
+sys.stdout.write(client.recv(4096).decode("latin-1"))
+"""
+
+
+class ThreadWorkerTest(TestCase):
+    def test_retiring_worker_serves_accepted_connections(self):
+        # ThreadWorker leans on the internals of gunicorn's gthread worker,
+        # which requirements.txt pins to 21.2.x. This fails if they move.
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, "-c", RETIRING_WORKER, root],
+            cwd=tempfile.gettempdir(),
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertTrue(result.stdout.startswith("HTTP/1.1 200 OK"), result.stdout)
+        self.assertIn("served", result.stdout)
+
+
+class FlickrAppMixin:
+    """
+    Installs syncr.flickr, which settings.py leaves to local_settings, with
+    its tables, for a TestCase.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.flickr_app = modify_settings(INSTALLED_APPS={"append": "syncr.flickr"})
+        cls.flickr_app.enable()
+        # Before TestCase's transaction: SQLite won't alter tables in one.
+        with connection.schema_editor() as editor:
+            for model in apps.get_app_config("flickr").get_models():
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in apps.get_app_config("flickr").get_models():
+                editor.delete_model(model)
+        cls.flickr_app.disable()
+
+
+class StandInNode(dict):
+    """
+    Enough of flickrapi's XMLNode: attributes by key, text, and child
+    elements as lists.
+    """
+
+    def __init__(self, attributes=None, text="", **children):
+        super().__init__(attributes or {})
+        self.text = text
+        self.__dict__.update(children)
+
+
+def listed_photo(flickr_id, title="Photo", lastupdate=1600000000, datetaken="2020-01-01 12:00:00", **extras):
+    """
+    A photo from a page of search results, asked for with PHOTO_EXTRAS.
+    """
+    attributes = {
+        "id": str(flickr_id),
+        "owner": "1@N00",
+        "ownername": "samuelclay",
+        "title": title,
+        "datetaken": datetaken,
+        "dateupload": "1500000000",
+        "lastupdate": str(lastupdate),
+        "farm": "1",
+        "server": "2",
+        "secret": "abc",
+        "license": "0",
+        "media": "photo",
+        "tags": "",
+        "width_t": "100",
+        "height_t": "75",
+        "width_s": "240",
+        "height_s": "180",
+        "width_m": "500",
+        "height_m": "375",
+        "o_width": "4000",
+        "o_height": "3000",
+    }
+    attributes.update(extras)
+    return StandInNode(attributes, description=[StandInNode(text="A description")])
+
+
+def photo_comment(flickr_id, comment="Great shot!"):
+    return {
+        "flickr_id": flickr_id,
+        "author_nsid": "2@N00",
+        "author": "friend",
+        "pub_date": datetime(2020, 1, 2),
+        "permanent_url": "http://www.flickr.com/photos/samuelclay/1/#comment%s" % flickr_id,
+        "comment": comment,
+    }
+
+
+class StandInFlickrAPI:
+    """
+    Answers a sync's flickr calls with canned pages of listed photos, and
+    remembers the calls.
+    """
+
+    def __init__(self, *pages):
+        self.pages = pages
+        self.calls = []
+
+    def people_findByUsername(self, username):
+        return StandInNode(user=[StandInNode({"nsid": "1@N00"})])
+
+    def photos_recentlyUpdated(self, per_page, page=1, **kwargs):
+        self.calls.append((page, kwargs))
+        return StandInNode(photos=[StandInNode({"pages": str(len(self.pages))}, photo=self.pages[page - 1])])
+
+    photos_search = photos_recentlyUpdated
+
+
+@skipUnless(flickrapi, "syncr.app.flickr needs flickrapi")
+class FlickrSyncrTest(FlickrAppMixin, TestCase):
+    def setUp(self):
+        from syncr.app import flickr
+        from syncr.flickr.models import Photo, PhotoComment
+
+        self.flickr = flickr
+        self.Photo, self.PhotoComment = Photo, PhotoComment
+        self.syncr = flickr.FlickrSyncr("key", "secret")
+        # Tagging looks up Photo's ContentType, which another test may have
+        # cached and rolled back.
+        ContentType.objects.clear_cache()
+
+    def fields(self, flickr_id, **attributes):
+        return self.syncr._listedPhotoFields(listed_photo(flickr_id, **attributes))
+
+    def test_listed_photo_fields(self):
+        fields = self.fields(1, title="Brooklyn Bridge", tags="bridge geo:lat=40.7 night", width_l="")
+        self.assertEqual(fields["flickr_id"], 1)
+        self.assertEqual(fields["slug"], "brooklyn-bridge")
+        self.assertEqual(fields["description"], "A description")
+        self.assertEqual(fields["taken_date"], datetime(2020, 1, 1, 12))
+        self.assertEqual(fields["update_date"], datetime.fromtimestamp(1600000000))
+        self.assertEqual(fields["photopage_url"], "http://www.flickr.com/photos/1@N00/1/")
+        self.assertEqual(fields["tags"], "bridge night ")
+        self.assertEqual((fields["medium_width"], fields["original_width"]), (500, 4000))
+        # Sizes flickr didn't list: no large size, and no original for one
+        # that isn't allowed to be downloaded.
+        self.assertIsNone(fields["large_width"])
+        fields = self.syncr._listedPhotoFields(listed_photo(1, o_width="", o_height=""))
+        self.assertEqual((fields["original_width"], fields["original_height"]), (0, 0))
+        self.assertEqual(fields["original_secret"], "")
+
+    def test_new_photos_are_inserted_and_updated_ones_updated(self):
+        self.syncr._savePhotos([(self.fields(1, title="One"), None), (self.fields(2, title="Two"), None)])
+        one = self.Photo.objects.get(flickr_id=1)
+
+        saved = self.syncr._savePhotos(
+            [
+                (self.fields(1, title="One again", lastupdate=1600000001), None),
+                (self.fields(2, title="Two again"), None),
+                (self.fields(3, title="One"), None),
+                (None, None),
+            ]
+        )
+        self.assertEqual([photo and photo.flickr_id for photo in saved], [1, 2, 3, None])
+        self.assertEqual(
+            dict(self.Photo.objects.values_list("flickr_id", "title")),
+            {1: "One again", 2: "Two", 3: "One"},
+        )
+        # Updated in place, keeping the slug in its URL.
+        self.assertEqual(self.Photo.objects.get(flickr_id=1).pk, one.pk)
+        self.assertEqual(self.Photo.objects.get(flickr_id=1).slug, "one")
+        self.assertEqual(self.Photo.objects.get(flickr_id=3).slug, "one-1")
+        self.assertIsNotNone(saved[2].pk)
+
+    def test_tags_are_written_with_the_page(self):
+        from tagging.models import Tag
+
+        def tags(photo):
+            return sorted(tag.name for tag in Tag.objects.get_for_object(photo))
+
+        saved = self.syncr._savePhotos([(self.fields(1, tags="bridge night"), None)])
+        self.assertEqual(tags(saved[0]), ["bridge", "night"])
+        saved = self.syncr._savePhotos([(self.fields(1, tags="bridge day", lastupdate=1600000001), None)])
+        self.assertEqual(tags(saved[0]), ["bridge", "day"])
+
+    def test_comments_are_written_once(self):
+        self.syncr._savePhotos([(self.fields(1), [photo_comment("c1")])])
+        self.syncr._savePhotos(
+            [
+                (
+                    self.fields(1, lastupdate=1600000001),
+                    [photo_comment("c1", "Edited"), photo_comment("c2"), photo_comment("c2")],
+                )
+            ]
+        )
+        self.assertEqual(
+            dict(self.PhotoComment.objects.values_list("flickr_id", "comment")),
+            {"c1": "Great shot!", "c2": "Great shot!"},
+        )
+
+    def test_refresh_replaces_saved_photos(self):
+        self.syncr._savePhotos([(self.fields(1, title="One", lastupdate=1600000001), [photo_comment("c1")])])
+        one = self.Photo.objects.get(flickr_id=1)
+
+        saved = self.syncr._savePhotos([(self.fields(1, title="Refreshed"), None)], refresh=True)
+        self.assertEqual(self.Photo.objects.get().title, "Refreshed")
+        self.assertNotEqual(saved[0].pk, one.pk)
+        self.assertFalse(self.PhotoComment.objects.exists())
+
+    def test_sync_updated_skips_unchanged_photos(self):
+        self.syncr._savePhotos([(self.fields(1, title="One"), None)])
+        self.syncr._local.api = StandInFlickrAPI(
+            [listed_photo(1, title="Not fetched"), listed_photo(2, title="Two", lastupdate=1600000005)],
+            [listed_photo(3, title="Three", lastupdate=1600000003, media="video")],
+        )
+
+        with mock.patch.object(self.syncr, "_savePhotos", wraps=self.syncr._savePhotos) as save:
+            self.syncr.syncUpdated("samuelclay", hydrate=False)
+        self.assertEqual([fields["flickr_id"] for fields, _ in save.call_args_list[0][0][0]], [2])
+        self.assertEqual(save.call_args_list[1][0][0], [(None, None)])
+        self.assertEqual(dict(self.Photo.objects.values_list("flickr_id", "title")), {1: "One", 2: "Two"})
+        self.assertEqual(self.flickr.SyncCursor.objects.get(nsid="1@N00").last_update, 1600000005)
+        self.assertEqual([page for page, _ in self.syncr._local.api.calls], [1, 2])
+
+        self.syncr._local.api = StandInFlickrAPI([])
+        self.syncr.syncUpdated("samuelclay", hydrate=False)
+        self.assertEqual(self.syncr._local.api.calls[0][1]["min_date"], 1600000005)
+
+    def test_one_worker_pool_per_sync(self):
+        syncr = self.flickr.FlickrSyncr("key", "secret", workers=2)
+        syncr._local.api = StandInFlickrAPI([listed_photo(1)], [listed_photo(2)])
+        threads = set()
+
+        def hydrate(photo_id):
+            threads.add(threading.current_thread())
+            return self.fields(int(photo_id)), None
+
+        with mock.patch.object(syncr, "_hydratePhoto", side_effect=hydrate), mock.patch.object(
+            self.flickr, "ThreadPoolExecutor", wraps=self.flickr.ThreadPoolExecutor
+        ) as pool:
+            syncr.syncUpdated("samuelclay")
+        pool.assert_called_once_with(max_workers=2)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertEqual(sorted(self.Photo.objects.values_list("flickr_id", flat=True)), [1, 2])
+        self.assertIsNone(syncr._pool)
+
+    def test_placeholders_are_filled_in(self):
+        # Last updated long before syncMinimal() dates its placeholder.
+        page = [listed_photo(1, title="One", lastupdate=1500000000)]
+        self.syncr._local.api = StandInFlickrAPI(page)
+        self.syncr.syncMinimal("samuelclay")
+        placeholder = self.Photo.objects.get()
+        self.assertEqual((placeholder.slug, placeholder.thumbnail_width), ("", 0))
+
+        self.syncr._local.api = StandInFlickrAPI(page)
+        self.syncr.syncUpdated("samuelclay", hydrate=False)
+        photo = self.Photo.objects.get()
+        self.assertEqual(photo.pk, placeholder.pk)
+        self.assertEqual(photo.slug, "one")
+        self.assertEqual(photo.taken_date, datetime(2020, 1, 1, 12))
+        self.assertEqual((photo.thumbnail_width, photo.original_width), (100, 4000))
+
+    def test_rate_limiter_spaces_calls(self):
+        limiter = self.flickr.RateLimiter(per_second=2)
+        with mock.patch.object(self.flickr.time, "monotonic", return_value=100.0), mock.patch.object(
+            self.flickr.time, "sleep"
+        ) as sleep:
+            for _ in range(3):
+                limiter.wait()
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [0.5, 1.0])
+
+    def test_rate_limited_api_waits_for_every_call(self):
+        api, limiter = mock.Mock(), mock.Mock()
+        calls = []
+        limiter.wait.side_effect = lambda: calls.append("wait")
+        api.photos_getInfo.side_effect = lambda **kwargs: calls.append(("getInfo", kwargs))
+
+        limited = self.flickr.RateLimitedAPI(api, limiter)
+        limited.photos_getInfo(photo_id="1")
+        limited.photos_getInfo(photo_id="2")
+        self.assertEqual(
+            calls, ["wait", ("getInfo", {"photo_id": "1"}), "wait", ("getInfo", {"photo_id": "2"})]
+        )
+
+
+def save_photo(flickr_id, taken_date, slug):
+    from syncr.flickr.models import Photo
+
+    return Photo.objects.create(
+        flickr_id=flickr_id,
+        owner="samuelclay",
+        owner_nsid="1@N00",
+        title=slug,
+        slug=slug,
+        taken_date=taken_date,
+        upload_date=taken_date,
+        update_date=taken_date,
+        photopage_url="http://www.flickr.com/photos/1@N00/%s/" % flickr_id,
+        farm=1,
+        server=2,
+        secret="abc",
+        thumbnail_width=100,
+        thumbnail_height=75,
+        small_width=240,
+        small_height=180,
+        original_width=4000,
+        original_height=3000,
+        license="0",
+    )
+
+
+class PhotoSlugTest(FlickrAppMixin, TestCase):
+    def test_batch_matches_one_by_one(self):
+        from syncr.flickr.slug import get_unique_slug_for_photo, get_unique_slugs_for_photos
+
+        save_photo(1, datetime(2020, 1, 1, 8), "img")
+        save_photo(2, datetime(2020, 1, 1, 9), "img-2")
+        save_photo(3, datetime(2020, 1, 2, 23, 59), "img")
+        photos = [
+            (datetime(2020, 1, 1, 10), "img"),
+            (datetime(2020, 1, 1, 11), "img"),
+            (datetime(2020, 1, 2, 0, 0), "img"),
+            (datetime(2020, 1, 1, 12), "img-1"),
+            (datetime(2020, 1, 3), "img"),
+            (datetime(2020, 1, 1, 23, 59), "img"),
+            (datetime(2020, 1, 3, 1), "img"),
+            (datetime(2020, 1, 2, 12), "sunset"),
+        ]
+
+        batch = get_unique_slugs_for_photos(photos)
+        one_by_one = []
+        for flickr_id, (taken_date, slug) in enumerate(photos, 10):
+            one_by_one.append(get_unique_slug_for_photo(taken_date, slug))
+            save_photo(flickr_id, taken_date, one_by_one[-1])
+        self.assertEqual(batch, one_by_one)
+        self.assertEqual(batch, ["img-1", "img-3", "img-1", "img-1-1", "img", "img-4", "img-1", "sunset"])
+
+
+class PhotoIndexTest(FlickrAppMixin, TransactionTestCase):
+    # A TransactionTestCase: SQLite won't alter a table in TestCase's
+    # transaction.
+
+    def indexed_columns(self):
+        from syncr.flickr.models import Photo
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Photo._meta.db_table)
+        return [c["columns"] for c in constraints.values() if c["index"]]
+
+    def test_creates_missing_indexes(self):
+        from syncr.flickr.models import Photo
+        from syncr.flickr.slug import create_indexes
+
+        # As the table was made before the index was declared.
+        with connection.schema_editor() as editor:
+            editor.remove_index(Photo, Photo._meta.indexes[0])
+        self.assertNotIn(["taken_date", "slug"], self.indexed_columns())
+
+        self.assertEqual(create_indexes(), Photo._meta.indexes)
+        self.assertIn(["taken_date", "slug"], self.indexed_columns())
+        self.assertEqual(create_indexes(), [])
+
+    def test_creates_the_sync_cursor_table(self):
+        from syncr.flickr.models import SyncCursor
+        from syncr.flickr.slug import create_tables
+
+        # As on a database from before SyncCursor.
+        with connection.schema_editor() as editor:
+            editor.delete_model(SyncCursor)
+
+        self.assertEqual(create_tables(), [SyncCursor])
+        self.assertFalse(SyncCursor.objects.exists())
+        self.assertEqual(create_tables(), [])
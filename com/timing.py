@@ -0,0 +1,172 @@
+"""
+Where the time in a request goes, as named spans: cache calls, outbound
+HTTP, template rendering and SQL. ServerTimingMiddleware turns them on for
+a sample of requests and reports them in a Server-Timing header and one
+structured log line per request.
+
+Code under a request wraps the work it wants counted:
+
+    with timing.span("http"):
+        response = requests.get(url, timeout=5)
+
+Outside a sampled request span() and record() do nothing. Spans overlap
+rather than nest: a DatabaseCache get counts under both cache-get and sql.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.template.base import Template
+
+logger = logging.getLogger("com.timing")
+
+_current = contextvars.ContextVar("timing", default=None)
+
+
+class Timings:
+    """
+    Total seconds and number of calls per span name, for one request.
+    """
+
+    def __init__(self):
+        self.spans = {}
+        self.rendering = 0
+
+    def record(self, name, seconds):
+        total, count = self.spans.get(name, (0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+    def header(self, total):
+        """
+        The Server-Timing header value, durations in milliseconds.
+        """
+        metrics = [
+            '%s;dur=%.1f;desc="%s calls"' % (name, seconds * 1000, count)
+            for name, (seconds, count) in self.spans.items()
+        ]
+        metrics.append("total;dur=%.1f" % (total * 1000))
+        return ", ".join(metrics)
+
+    def log_record(self, request, response, total):
+        return {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "spans": {
+                name: {"ms": round(seconds * 1000, 1), "count": count}
+                for name, (seconds, count) in self.spans.items()
+            },
+        }
+
+
+def record(name, seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.record(name, seconds)
+
+
+@contextmanager
+def span(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.record(name, time.perf_counter() - started)
+
+
+def _timed_render(render):
+    def timed_render(self, context):
+        timings = _current.get()
+        # Only the outermost template: includes and extends render inside it.
+        if timings is None or timings.rendering:
+            return render(self, context)
+        timings.rendering += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timings.rendering -= 1
+            timings.record("render", time.perf_counter() - started)
+
+    timed_render.timed = True
+    return timed_render
+
+
+def _timed_sql(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record("sql", time.perf_counter() - started)
+
+
+class ServerTimingMiddleware:
+    """
+    Times SERVER_TIMING_SAMPLE_RATE of requests (all of them with DEBUG on).
+    Put it first in MIDDLEWARE so "total" covers the rest.
+
+    Works in both of Django's modes. Under asgi.py queries run in threads
+    with connections of their own, so async requests get no "sql" span.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # What MiddlewareMixin does, so Django awaits us directly.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        # Django's test runner swaps Template._render out too; wrap whatever
+        # is there, once.
+        if not getattr(Template._render, "timed", False):
+            Template._render = _timed_render(Template._render)
+
+    def sampled(self):
+        return settings.DEBUG or random.random() < getattr(settings, "SERVER_TIMING_SAMPLE_RATE", 0)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timings = Timings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_timed_sql):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timings = Timings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - started)
+
+    def report(self, request, response, timings, total):
+        response["Server-Timing"] = timings.header(total)
+        logger.info(json.dumps(timings.log_record(request, response, total), sort_keys=True))
+        return response
@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import random
+import threading
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+
+class RenderedVariant:
+    """
+    One fully rendered page body, kept alongside its gzipped copy. Each
+    encoding gets its own strong ETag, as the spec requires.
+    """
+
+    def __init__(self, body):
+        self.body = body.encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        digest = hashlib.md5(self.body).hexdigest()
+        self.etag = '"%s"' % digest
+        self.gzip_etag = '"%s-gzip"' % digest
+
+
+class VariantPool:
+    """
+    A per-process pool of pre-rendered variants of one page. The pool is
+    rebuilt whenever the `generation` it was rendered for changes, so callers
+    pass anything that should invalidate it (cached data, the year, ...).
+    """
+
+    def __init__(self):
+        # (generation, variants), replaced as a whole so a thread reading it
+        # never pairs one generation with another's variants.
+        self.built = (None, [])
+        self.lock = threading.Lock()
+
+    def get(self, generation, render):
+        """
+        Return the variants for `generation`, calling render() for a list of
+        page bodies if the pool was built for something else.
+        """
+        built_for, variants = self.built
+        if built_for == generation:
+            return variants
+
+        with self.lock:
+            built_for, variants = self.built
+            if built_for != generation:
+                variants = [RenderedVariant(body) for body in render()]
+                self.built = (generation, variants)
+            return variants
+
+    def clear(self):
+        with self.lock:
+            self.built = (None, [])
+
+
+def variant_response(request, variants, content_type="text/html; charset=utf-8"):
+    """
+    Serve a random variant, gzipped when the client accepts it. Since any
+    variant is an acceptable answer, a client holding any one of them gets
+    a 304.
+    """
+    accepts_gzip = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+    if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+
+    for variant in variants:
+        etag = variant.gzip_etag if accepts_gzip else variant.etag
+        if etag in if_none_match:
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+
+    variant = random.choice(variants)
+    if accepts_gzip:
+        response = HttpResponse(variant.gzip_body, content_type=content_type)
+        response["Content-Encoding"] = "gzip"
+        response["ETag"] = variant.gzip_etag
+    else:
+        response = HttpResponse(variant.body, content_type=content_type)
+        response["ETag"] = variant.etag
+    response["Content-Length"] = len(response.content)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -1,33 +1,73 @@
 import datetime
+import hashlib
 import logging
-import random
+import os
 import socket
+import threading
 import time
+import zlib
 
 # from django.views.decorators.cache import cache_page
 import feedparser
 import requests
+from asgiref.sync import sync_to_async
 from bs4 import BeautifulSoup
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.cache import cache
+from django.db import connection
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+
+from com import timing
+from com.bike_data import (
+    BIN_PIXELS,
+    BIN_SOURCES,
+    BIN_ZOOMS,
+    DATASETS,
+    MAP_LAYERS,
+    MAP_ZOOMS,
+    RECORD_STREAMS,
+    TILE_LAYERS,
+    TILE_ZOOMS,
+    build_map_layer,
+    crash_bins,
+    dataset_filename,
+    map_layer_filename,
+    map_layer_source_path,
+    tile_index,
+)
+from com.cache import CacheLock, aget, asingle_flight, single_flight
+from com.cache_stats import stats_report
+from com.variants import RenderedVariant, VariantPool, variant_response
 from util.dates import relative_timesince
 
 socket.setdefaulttimeout(10)
 
 NUM_PHOTOS_PER_ROW = 7
 
+# Past the soft TTL the cached blog is still served, but refreshed in the
+# background. The hard TTL is how long the cache keeps it at all.
+BLOG_FEED_URL = settings.BLOG_FEED_URL
+BLOG_CACHE_KEY = "blog_entries"
+BLOG_SOFT_TTL = 60 * 60
+BLOG_HARD_TTL = 60 * 60 * 24 * 30
+BLOG_REFRESH_LEASE = 60
+BLOG_FILL_WAIT = 5
+# Connect and read timeouts for the feed, in seconds. A request that finds
+# the cache cold waits this long at most.
+BLOG_FETCH_TIMEOUT = (3, 5)
+
+
+# Rendered once per quote and kept until the blog or the year changes.
+_homepage_pool = VariantPool()
+
 
 # @cache_page(60)
 def index(request):
-    blog_entries = cache.get("blog_entries")
-    if not blog_entries:
-        logging.debug(" ---> Fetching blog...")
-        blog_entries = _fetch_and_parse_blog()
-        cache.set("blog_entries", blog_entries, 60 * 60 * 24)
-    else:
-        logging.debug(" ---> Cached blog.")
+    blog_entries = _get_blog_entries()
 
     # tweets = cache.get('tweets')
     # if tweets is None:
@@ -37,22 +77,43 @@ def index(request):
     # else:
     #     logging.debug(" ---> Cached twitter.")
 
-    isa_quote = _choose_is_a_quote()
-    year = datetime.datetime.now().year
+    return _homepage_response(request, blog_entries)
 
-    return render(
-        request,
-        "index.html",
-        {
-            "blog_entries": blog_entries,
-            # "tweets": tweets,
-            "isa_quote": isa_quote,
-            "year": year,
-        },
-    )
 
+async def async_index(request):
+    """
+    index() for asgi.py. A visitor who finds the blog cache cold waits on
+    the feed without holding a thread, so one process can keep many of
+    them waiting.
+    """
+    blog_entries = await _aget_blog_entries()
+    # Rendering, and the cache it goes through, block.
+    return await sync_to_async(_homepage_response)(request, blog_entries)
 
-def _choose_is_a_quote():
+
+def _homepage_response(request, blog_entries):
+    year = datetime.datetime.now().year
+    generation = (year, _blog_fingerprint(blog_entries))
+
+    def render_variants():
+        logging.debug(" ---> Rendering homepage variants...")
+        return [
+            render_to_string(
+                "index.html",
+                {
+                    "blog_entries": blog_entries,
+                    # "tweets": tweets,
+                    "isa_quote": isa_quote,
+                    "year": year,
+                },
+            )
+            for isa_quote in _is_a_quotes()
+        ]
+
+    return variant_response(request, _homepage_pool.get(generation, render_variants))
+
+
+def _is_a_quotes():
     quotes = [
         # "is up on a hill in San Francisco.",
         # "is going about it all wrong.",
@@ -70,19 +131,157 @@ def _choose_is_a_quote():
         # "is skating into the night.",
     ]
 
-    now = datetime.datetime.now()
-    # grad = datetime.datetime(2020, 5, 28)
+    return quotes
 
-    # if now < grad:
-    #     quotes.append("is %s days away from graduation." % (grad - now).days)
-    # else:
-    #     quotes.append("is %s days past graduation." % (now - grad).days)
 
-    return random.choice(quotes)
+def _blog_fingerprint(blog_entries):
+    return hashlib.md5(repr(blog_entries).encode("utf-8")).hexdigest()
 
 
-def _fetch_and_parse_blog():
-    blog = feedparser.parse("http://www.ofbrooklyn.com/feeds/all/")
+def _get_blog_entries(refresh=True):
+    """
+    Return the cached blog entries. Once they are older than BLOG_SOFT_TTL the
+    stale list is returned and a single background refresh is started, so
+    only a cold cache makes the visitor wait on the feed. With `refresh`
+    false, stale entries are returned without starting one.
+    """
+    cached = cache.get(BLOG_CACHE_KEY)
+    if not cached:
+        logging.debug(" ---> Fetching blog...")
+        # Requests that find someone else fetching give up after
+        # BLOG_FILL_WAIT and go without, rather than fetch it again.
+        cached = single_flight(
+            BLOG_CACHE_KEY,
+            _fetch_blog_or_retry_later,
+            BLOG_HARD_TTL,
+            lease=BLOG_REFRESH_LEASE,
+            wait=BLOG_FILL_WAIT,
+            stale={"entries": [], "fetched_at": 0},
+        )
+        return cached["entries"]
+
+    if isinstance(cached, list):
+        # Entries cached before soft TTLs existed: serve them, but refresh.
+        cached = {"entries": cached, "fetched_at": 0}
+
+    if refresh and time.time() - cached["fetched_at"] > BLOG_SOFT_TTL:
+        logging.debug(" ---> Stale blog, refreshing in background...")
+        _refresh_blog_in_background(cached)
+    else:
+        logging.debug(" ---> Cached blog.")
+
+    return cached["entries"]
+
+
+async def _aget_blog_entries():
+    """
+    _get_blog_entries() for async views. The feed is fetched and parsed in
+    a thread of its own, so neither the event loop nor the thread Django
+    runs sync code in waits on it.
+    """
+    cached = await aget(BLOG_CACHE_KEY)
+    if not cached:
+        logging.debug(" ---> Fetching blog...")
+        cached = await asingle_flight(
+            BLOG_CACHE_KEY,
+            sync_to_async(_fetch_blog_or_retry_later, thread_sensitive=False),
+            BLOG_HARD_TTL,
+            lease=BLOG_REFRESH_LEASE,
+            wait=BLOG_FILL_WAIT,
+            stale={"entries": [], "fetched_at": 0},
+        )
+        return cached["entries"]
+
+    if isinstance(cached, list):
+        cached = {"entries": cached, "fetched_at": 0}
+
+    if time.time() - cached["fetched_at"] > BLOG_SOFT_TTL:
+        logging.debug(" ---> Stale blog, refreshing in background...")
+        await sync_to_async(_refresh_blog_in_background)(cached)
+    else:
+        logging.debug(" ---> Cached blog.")
+
+    return cached["entries"]
+
+
+def _fetch_blog_cache_value(previous=None):
+    """
+    Fetch the blog feed, sending the ETag and Last-Modified validators saved
+    with the `previous` cache value. A 304 reuses the previous entries
+    without parsing anything, so it only pushes back fetched_at. Raises
+    requests.RequestException if the feed can't be fetched within
+    BLOG_FETCH_TIMEOUT.
+    """
+    previous = previous or {}
+    headers = {}
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("modified"):
+        headers["If-Modified-Since"] = previous["modified"]
+    with timing.span("http"):
+        response = requests.get(BLOG_FEED_URL, headers=headers, timeout=BLOG_FETCH_TIMEOUT)
+
+    if response.status_code == 304 and previous.get("entries") is not None:
+        logging.debug(" ---> Blog not modified.")
+        entries = previous["entries"]
+    else:
+        response.raise_for_status()
+        entries = _parse_blog_entries(feedparser.parse(response.content))
+
+    return {
+        "entries": entries,
+        "fetched_at": time.time(),
+        "etag": response.headers.get("ETag") or previous.get("etag"),
+        "modified": response.headers.get("Last-Modified") or previous.get("modified"),
+    }
+
+
+def _fetch_blog_or_retry_later(previous=None):
+    """
+    _fetch_blog_cache_value(), except that a feed that's down or too slow
+    gives no entries, cached as already stale: the homepage renders without
+    them and the next visitor starts a background refresh.
+    """
+    try:
+        return _fetch_blog_cache_value(previous)
+    except requests.RequestException:
+        logging.warning(" ---> Couldn't fetch the blog, trying again in the background.", exc_info=True)
+        return {"entries": [], "fetched_at": 0}
+
+
+def _refresh_blog_in_background(previous):
+    """
+    Start a background refresh unless the blog is already being fetched by
+    any worker. The lock is a cache lease, so a crashed refresh is retried
+    once BLOG_REFRESH_LEASE runs out.
+    """
+    lock = CacheLock(BLOG_CACHE_KEY, lease=BLOG_REFRESH_LEASE)
+    if not lock.acquire():
+        return None
+
+    thread = threading.Thread(
+        target=_background_blog_refresh, args=(lock, previous), name="blog-refresh", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _background_blog_refresh(lock, previous):
+    try:
+        value = _fetch_blog_cache_value(previous)
+        if value["entries"]:
+            cache.set(BLOG_CACHE_KEY, value, BLOG_HARD_TTL)
+        else:
+            logging.warning(" ---> Blog feed came back empty, keeping stale entries.")
+    except Exception:
+        logging.exception(" ---> Background blog refresh failed.")
+    finally:
+        lock.release()
+        # The DatabaseCache opened a connection for this thread.
+        connection.close()
+
+
+def _parse_blog_entries(blog):
     entries = []
 
     for entry in blog["entries"]:
@@ -185,9 +384,143 @@ def chunks(l, n):
     return new_l
 
 
+@staff_member_required
+def cache_stats(request):
+    report = stats_report(cache)
+    if report is None:
+        raise Http404("The default cache isn't instrumented.")
+    return JsonResponse(report)
+
+
 def portfolio(request):
     return render(request, "portfolio.html", {})
 
 
 def bikes(request):
     return render(request, settings.MEDIA_ROOT + "/../bikes/index.html", {})
+
+
+BIKE_DATA_CACHE_CONTROL = "public, max-age=86400"
+
+# Built once per process and version of the source file, by output filename.
+_bike_data_pools = {dataset_filename(name): VariantPool() for name in DATASETS}
+_bike_data_pools.update(
+    (map_layer_filename(name, zoom), VariantPool()) for name in MAP_LAYERS for zoom in MAP_ZOOMS
+)
+
+
+def _bike_data_response(request, filename, source_path, build, content_type):
+    try:
+        generation = os.path.getmtime(source_path)
+    except OSError:
+        raise Http404
+    variants = _bike_data_pools[filename].get(generation, lambda: [build()])
+    response = variant_response(request, variants, content_type=content_type)
+    response["Cache-Control"] = BIKE_DATA_CACHE_CONTROL
+    return response
+
+
+def bike_data(request, name):
+    """
+    The trimmed crash and request CSVs for the Boston bikes page. Once
+    `manage.py build_bike_data` has written them to disk they're served as
+    static files and never get here.
+    """
+    dataset = DATASETS[name]
+    return _bike_data_response(
+        request,
+        dataset_filename(name),
+        dataset.source_path(settings.BIKES_DATA_DIR),
+        lambda: dataset.build(settings.BIKES_DATA_DIR),
+        "text/csv; charset=utf-8",
+    )
+
+
+def bike_map_layer(request, name, zoom):
+    """
+    A map layer for the Boston bikes page as TopoJSON, simplified for one
+    zoom level. Like bike_data, only until it's been built to disk.
+    """
+    zoom = int(zoom)
+    if name not in MAP_LAYERS or zoom not in MAP_ZOOMS:
+        raise Http404
+    return _bike_data_response(
+        request,
+        map_layer_filename(name, zoom),
+        map_layer_source_path(name, settings.BIKES_DATA_DIR),
+        lambda: build_map_layer(name, zoom, settings.BIKES_DATA_DIR),
+        "application/json",
+    )
+
+
+def bike_tile(request, name, z, x, y):
+    """
+    The features of one bikes map layer inside Web Mercator tile z/x/y, as
+    TopoJSON. Tiles are cut from a per-process spatial index of the layer,
+    which also keeps the most recently used ones, already gzipped.
+    """
+    z, x, y = int(z), int(x), int(y)
+    if name not in TILE_LAYERS or z not in TILE_ZOOMS or not (0 <= x < 2**z and 0 <= y < 2**z):
+        raise Http404
+    try:
+        index = tile_index(name, settings.BIKES_DATA_DIR)
+    except OSError:
+        raise Http404
+
+    variant = index.rendered_tile(z, x, y, RenderedVariant)
+    response = variant_response(request, [variant], content_type="application/json")
+    response["Cache-Control"] = BIKE_DATA_CACHE_CONTROL
+    return response
+
+
+def bike_bins(request, name, kind, zoom):
+    """
+    Crashes or requests counted into hexagons or squares sized for one zoom
+    level, so the page draws hundreds of bins rather than thousands of
+    points. Query parameters narrow the count down by any of the breakdowns,
+    as in ?mode_type=bike.
+    """
+    zoom = int(zoom)
+    if name not in BIN_SOURCES or kind not in BIN_PIXELS or zoom not in BIN_ZOOMS:
+        raise Http404
+    try:
+        variant = crash_bins(name, settings.BIKES_DATA_DIR).variant(kind, zoom, request.GET.dict())
+    except (OSError, KeyError):
+        raise Http404
+    response = variant_response(request, [variant], content_type="application/json")
+    response["Cache-Control"] = BIKE_DATA_CACHE_CONTROL
+    return response
+
+
+def _gzip_chunks(chunks):
+    """
+    Gzip a stream of byte chunks, flushing after each so the client can
+    decode every chunk as soon as it arrives.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def bike_stream(request, name):
+    """
+    Every crash or request as newline-delimited JSON, streamed straight
+    from the source CSV with the bike ones first, so the page can start
+    drawing before the rest has downloaded.
+    """
+    if name not in RECORD_STREAMS:
+        raise Http404
+    stream = RECORD_STREAMS[name]
+    if not os.path.exists(stream.source_path(settings.BIKES_DATA_DIR)):
+        raise Http404
+
+    chunks = stream.chunks(settings.BIKES_DATA_DIR)
+    if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+        response = StreamingHttpResponse(_gzip_chunks(chunks), content_type="application/x-ndjson")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = StreamingHttpResponse(chunks, content_type="application/x-ndjson")
+    patch_vary_headers(response, ("Accept-Encoding",))
+    response["Cache-Control"] = BIKE_DATA_CACHE_CONTROL
+    return response
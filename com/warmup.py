@@ -0,0 +1,99 @@
+"""
+Work a worker would otherwise do on its first requests, done up front.
+
+wsgi.py calls warm() once the app is built. Under gunicorn's preload_app
+that happens in the master, before any worker is forked, so every worker
+starts with it done and shares the memory it used; see gunicorn.py.
+"""
+
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template import TemplateSyntaxError
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.urls import get_resolver
+
+from com.bike_data import BIN_SOURCES, TILE_LAYERS, crash_bins, tile_index
+from com.cache_stats import CacheStats
+
+
+def template_names():
+    """
+    Every .html file under the template DIRS, by the name it's loaded as.
+    """
+    names = []
+    for template_dir in settings.TEMPLATES[0]["DIRS"]:
+        for dirpath, dirnames, filenames in os.walk(template_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                if filename.endswith(".html"):
+                    names.append(
+                        os.path.relpath(os.path.join(dirpath, filename), template_dir).replace(os.sep, "/")
+                    )
+    return names
+
+
+def compile_templates():
+    for name in template_names():
+        try:
+            get_template(name)
+        except TemplateSyntaxError:
+            # Plain HTML that happens to be in a template dir.
+            logging.debug(" ---> Not a template: %s" % name)
+
+
+def render_homepage():
+    # Fetches the blog if the cache is cold, then renders every quote. A
+    # stale blog is left for a worker to refresh: under preload_app this is
+    # the master, which mustn't fork with the refresh thread running.
+    from com import views
+
+    views._homepage_response(RequestFactory().get("/"), views._get_blog_entries(refresh=False))
+
+
+def index_bikes_data():
+    for name in TILE_LAYERS:
+        tile_index(name, settings.BIKES_DATA_DIR)
+    for name in BIN_SOURCES:
+        crash_bins(name, settings.BIKES_DATA_DIR)
+
+
+def discard_cache_stats():
+    # Warming up isn't traffic worth reporting.
+    backend = caches["default"]
+    if isinstance(getattr(backend, "stats", None), CacheStats):
+        backend.stats.discard(backend.stats_cache)
+
+
+def warm(application, urlconf=None):
+    """
+    Import the URLconf (`urlconf`, or else settings.ROOT_URLCONF, and with
+    it admin.autodiscover()), parse every template, render the homepage,
+    read small static files into memory and index the bikes data, then
+    forget the cache stats all that ran up. A step that fails is logged and
+    skipped: the request that needs it will do it instead.
+    """
+    steps = [
+        ("urls", lambda: get_resolver(urlconf).url_patterns),
+        ("templates", compile_templates),
+        ("homepage", render_homepage),
+        ("static files", application.preload),
+        ("bikes data", index_bikes_data),
+        ("cache stats", discard_cache_stats),
+    ]
+    timings = []
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logging.exception(" ---> Warming %s failed." % name)
+        timings.append("%s %.0fms" % (name, (time.perf_counter() - started) * 1000))
+    # Connections opened here mustn't be shared with forked workers.
+    connections.close_all()
+    logging.info(" ---> Warmed up: %s" % ", ".join(timings))
@@ -0,0 +1,34 @@
+"""
+gunicorn worker classes, named by dotted path in gunicorn.py.
+"""
+
+from gunicorn.workers.gthread import ThreadWorker as GunicornThreadWorker
+
+
+class ThreadWorker(GunicornThreadWorker):
+    """
+    gunicorn's gthread worker, except that a worker on its way out (after
+    max_requests, or a graceful restart) answers the connections it has
+    accepted but not yet read a request from. gunicorn 21 closes them
+    unanswered, which their clients see as a reset. This leans on the
+    gthread worker's internals, so requirements.txt pins gunicorn to 21.2.x
+    and ThreadWorkerTest checks them.
+    """
+
+    def murder_keepalived(self):
+        super().murder_keepalived()
+        if not self.alive:
+            self.serve_accepted()
+
+    def serve_accepted(self):
+        # Called from the main loop after its last select(), so nothing else
+        # is touching the poller. run() then waits for these like any other
+        # request before the worker exits. Idle keepalive connections are
+        # left to be closed: there's no telling when they'd send anything.
+        for key in list(self.poller.get_map().values()):
+            callback = key.data
+            if (
+                getattr(callback, "func", None) == self.on_client_socket_readable
+                and not callback.args[0].initialized
+            ):
+                callback(key.fileobj)
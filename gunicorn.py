@@ -1,3 +1,5 @@
+import gc
+
 bind = "0.0.0.0:3000"
 pidfile = "/srv/samuelclay/logs/gunicorn.pid"
 logfile = "/srv/samuelclay/logs/production.log"
@@ -11,4 +13,26 @@ x_forwarded_for_header = "X-FORWARDED-FOR"
 forwarded_allow_ips = "*"
 limit_request_line = 16000
 limit_request_fields = 1000
-workers = 2
\ No newline at end of file
+workers = 2
+# Each worker serves from a pool of threads, so a request stuck on
+# something slow (the blog feed on a cold cache) ties up one thread, not
+# half the site. Everything a worker keeps per process is locked for it.
+# gunicorn's gthread worker, fixed up in com/workers.py (which is why
+# requirements.txt pins gunicorn to 21.2.x).
+worker_class = "com.workers.ThreadWorker"
+threads = 8
+
+# Load and warm the app (see com/warmup.py) once in the master, and fork
+# workers from it: a recycled worker is serving straight away instead of
+# spending seconds importing and warming. Code changes need a restart,
+# not a HUP, to load.
+preload_app = True
+# So the workers don't all recycle at the same moment.
+max_requests_jitter = 100
+
+
+def when_ready(server):
+    # Move everything the preloaded app allocated out of the collector's
+    # reach, so collections in the workers don't write to (and copy) the
+    # pages they share with the master.
+    gc.freeze()
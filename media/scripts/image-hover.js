@@ -22,14 +22,17 @@ document.addEventListener('DOMContentLoaded', () => {
         // Find all thumbnails in this gallery
         const thumbnails = gallery.querySelectorAll('.screenshot-thumb');
 
-        // Preload all images for instant display
-        thumbnails.forEach(thumb => {
-            const fullSrc = thumb.dataset.fullSrc;
-            if (fullSrc) {
-                const preloadImg = new Image();
-                preloadImg.src = fullSrc;
-            }
-        });
+        // Preload the full-size images the first time the gallery is
+        // hovered, rather than on every page load
+        gallery.addEventListener('mouseenter', () => {
+            thumbnails.forEach(thumb => {
+                const fullSrc = thumb.dataset.fullSrc;
+                if (fullSrc) {
+                    const preloadImg = new Image();
+                    preloadImg.src = fullSrc;
+                }
+            });
+        }, { once: true });
 
         thumbnails.forEach(thumb => {
             // On hover, show the overlay with the full-size image
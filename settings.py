@@ -44,9 +44,24 @@ CACHE_BACKEND = "db://cache"
 
 CACHES = {
     "default": {
+        "BACKEND": "com.cache_backends.InstrumentedCache",
+        "LOCATION": "two_tier",
+        "OPTIONS": {
+            "STATS_LOCATION": "shared",
+        },
+    },
+    "two_tier": {
+        "BACKEND": "com.cache_backends.TwoTierCache",
+        "LOCATION": "shared",
+        "OPTIONS": {
+            "MAX_BYTES": 16 * 1024 * 1024,
+            "LOCAL_TIMEOUT": 60,
+        },
+    },
+    "shared": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "cache",
-    }
+    },
 }
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
@@ -79,6 +94,42 @@ STATICFILES_DIRS = [
     MEDIA_ROOT,
 ]
 
+# Directories served straight from disk by com.static.StaticFiles, ahead of
+# Django's URL resolution. The serve() routes in urls.py stay as a fallback
+# for files added after startup.
+STATIC_MOUNTS = {
+    "/static/": MEDIA_ROOT,
+    "/raphael/": here("raphael"),
+    "/schedulerjones/": here("schedulerjones"),
+    "/caselife/": here("caselife"),
+    "/sunraylab/": here("sunraylab"),
+    "/boston-bikes/": here("bikes"),
+    "/kickpoint/": here("kickpoint"),
+    "/newyorkfieldguide/": here("newyorkfieldguide"),
+    "/podlife/": here("podlife"),
+    "/portfolio/": here("portfolio"),
+}
+
+# Written by `manage.py build_static_manifest`, read by the {% asset %} tag.
+STATIC_MANIFEST = here("static-manifest.json")
+
+# Images `manage.py build_image_derivatives` resizes for {% responsive_img %},
+# by URL prefix, and where the derivatives go. Build these before the static
+# manifest so the derivatives get hashed names too.
+RESPONSIVE_IMAGE_DIRS = {
+    "/static/images/": here("media/images"),
+    "/portfolio/": here("portfolio"),
+}
+IMAGE_DERIVATIVES_ROOT = here("media/derivatives")
+IMAGE_DERIVATIVES_URL = "/static/derivatives/"
+
+# Source CSVs for the Boston bikes page, and where `manage.py build_bike_data`
+# writes the trimmed copies bike_crashes.js loads.
+BIKES_DATA_DIR = here("bikes/data")
+
+# The blog whose latest posts are listed on the homepage.
+BLOG_FEED_URL = "http://www.ofbrooklyn.com/feeds/all/"
+
 # URL prefix for admin media -- CSS, JavaScript and images. Make sure to use a
 # trailing slash.
 # Examples: "http://foo.com/media/", "/media/".
@@ -96,6 +147,7 @@ TEMPLATE_LOADERS = [
 ]
 
 MIDDLEWARE = (
+    "com.timing.ServerTimingMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -110,8 +162,14 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 
 CACHE_MIDDLEWARE_SECONDS = 600
 
+# Share of requests com.timing.ServerTimingMiddleware times, when not DEBUG.
+SERVER_TIMING_SAMPLE_RATE = 0.05
+
 ROOT_URLCONF = "urls"
 
+WSGI_APPLICATION = "wsgi.application"
+ASGI_APPLICATION = "asgi.application"
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -120,8 +178,18 @@ TEMPLATES = [
             here("portfolio"),
             here("bikes"),
         ],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Parsed once per process, even with DEBUG on. runserver's
+            # autoreloader still resets them when a template changes.
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -1,15 +1,75 @@
 import calendar
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import flickrapi
+import logging
 import math
+import threading
+import time
 from time import strptime
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.template import defaultfilters
 from django.utils.encoding import smart_str
+from tagging.models import Tag
 
 from syncr.flickr.models import *
-from syncr.flickr.slug import get_unique_slug_for_photo
+from syncr.flickr.slug import get_unique_slugs_for_photos
+
+# What an update from flickr may change. The slug and taken_date are in the
+# photo's URL, so they stay as they were first saved.
+PHOTO_UPDATE_FIELDS = (
+    'owner', 'owner_nsid', 'title', 'description', 'upload_date', 'update_date', 'photopage_url', 'farm',
+    'server', 'secret', 'original_secret', 'thumbnail_width', 'thumbnail_height', 'small_width',
+    'small_height', 'medium_width', 'medium_height', 'large_width', 'large_height', 'original_width',
+    'original_height', 'tags', 'license',
+)
+
+# Everything _listedPhotoFields() needs, asked for with every page of photos.
+PHOTO_EXTRAS = ('description,owner_name,date_upload,date_taken,last_update,tags,license,original_format,'
+                'media,o_dims,url_t,url_s,url_m,url_l')
+
+def isPlaceholder(photo):
+    """
+    Whether a saved Photo is one of syncMinimal()'s placeholders, dated when
+    it was saved and without sizes, for the other syncs to fill in. Every
+    photo flickr lists has a thumbnail, if not always an original.
+    """
+    return photo.thumbnail_width == 0
+
+class RateLimiter:
+    """
+    Spaces calls out to at most `per_second` a second, across every thread
+    that shares it.
+    """
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second
+        self.lock = threading.Lock()
+        self.next_call = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+class RateLimitedAPI:
+    """
+    A FlickrAPI whose method calls each wait their turn with a RateLimiter.
+    """
+    def __init__(self, api, limiter):
+        self.api = api
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        method = getattr(self.api, name)
+        def call(*args, **kwargs):
+            self.limiter.wait()
+            return method(*args, **kwargs)
+        return call
 
 class FlickrSyncr:
     """
@@ -23,15 +83,57 @@ class FlickrSyncr:
     This app requires Beej's flickrapi library. Available at:
     http://flickrapi.sourceforge.net/
     """
-    def __init__(self, flickr_key, flickr_secret):
+    def __init__(self, flickr_key, flickr_secret, workers=1, calls_per_second=None):
         """
         Construct a new FlickrSyncr object.
 
         Required arguments
           flickr_key: a Flickr API key string
           flickr_secret: a Flickr secret key as a string
+        Optional arguments
+          workers: how many photos to fetch from flickr at once, defaults
+                   to 1 (one after another)
+          calls_per_second: the most API calls to make a second, across
+                            all workers, defaults to no limit. Flickr
+                            allows 3600 an hour per key.
+        """
+        self.flickr_key = flickr_key
+        self.flickr_secret = flickr_secret
+        self.workers = workers
+        self.limiter = calls_per_second and RateLimiter(calls_per_second)
+        self._local = threading.local()
+        self._pool = None
+
+    @property
+    def flickr(self):
         """
-        self.flickr = flickrapi.FlickrAPI(flickr_key, flickr_secret, format='xmlnode')
+        This thread's FlickrAPI: each keeps an HTTP session of its own.
+        """
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = flickrapi.FlickrAPI(self.flickr_key, self.flickr_secret, format='xmlnode')
+            if self.limiter:
+                api = RateLimitedAPI(api, self.limiter)
+            self._local.api = api
+        return api
+
+    @contextmanager
+    def _workerPool(self):
+        """
+        Give a sync one pool of self.workers threads for all of its pages,
+        so each thread keeps its FlickrAPI session from page to page. Syncs
+        nested in another, and syncrs with one worker, get no pool of their
+        own.
+        """
+        if self.workers <= 1 or self._pool is not None:
+            yield
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            self._pool = pool
+            try:
+                yield
+            finally:
+                self._pool = None
 
     def user2nsid(self, username):
         """
@@ -182,67 +284,75 @@ class FlickrSyncr:
         except KeyError:
             return ''
 
-    def _syncPhoto(self, photo_xml, refresh=False):
+    def _hydratePhoto(self, photo_id):
         """
-        Synchronize a flickr photo with the Django backend.
+        Fetch a photo's info, sizes and comments from flickr, and return
+        its Photo fields and comments for _savePhotos(), or (None, None)
+        for media like videos. Doesn't touch the database, so any thread
+        can run it.
 
         Required Arguments
-          photo_xml: A flickr photos in Flickrapi's REST XMLNode format
+          photo_id: A flickr photo_id
         """
+        photo_xml = self.flickr.photos_getInfo(photo_id = photo_id)
         if photo_xml.photo[0]['media'] != 'photo': # Ignore media like videos
-            return None
-        photo_id = photo_xml.photo[0]['id']
+            return None, None
+        return self._photoFields(photo_xml, self.getPhotoSizes(photo_id)), self.getPhotoComments(photo_id)
 
-        # if we're refreshing this data, then delete the Photo first...
-        if refresh:
-            try:
-                p = Photo.objects.get(flickr_id = photo_id)
-                p.delete()
-            except ObjectDoesNotExist:
-                pass
+    def _trimTags(self, tags):
+        """
+        Space-separated tags, without geo-tags, cut to fit in 255 chars.
+        """
+        trimmed, count = '', 0
+        for tag in [(t, len(t) + 1) for t in tags.split()]:
+            if 255 <= (count + tag[1] - 1):
+                trimmed = trimmed[:-1]
+                break
+            if not tag[0].startswith('geo:'): # Exclude ugly geo-tags
+                trimmed += u'%s ' % tag[0]
+                count += tag[1]
+        return trimmed
+
+    def _photoFields(self, photo_xml, sizes):
+        """
+        The Photo fields for a flickr photo, with its title slugified but
+        not yet made unique.
 
-        sizes = self.getPhotoSizes(photo_id)
+        Required Arguments
+          photo_xml: A flickr photos in Flickrapi's REST XMLNode format
+          sizes: The photo's sizes, from getPhotoSizes()
+        """
+        photo = photo_xml.photo[0]
         # Removed urls = self.getPhotoSizeURLs(photo_id)
         # exif_data = self.getExifInfo(photo_id)
         # geo_data = self.getGeoLocation(photo_id)
 
-        taken_date = datetime(*strptime(photo_xml.photo[0].dates[0]['taken'], "%Y-%m-%d %H:%M:%S")[:7])
-        upload_date = datetime.fromtimestamp(int(photo_xml.photo[0].dates[0]['posted']))
-        update_date = datetime.fromtimestamp(int(photo_xml.photo[0].dates[0]['lastupdate']))
+        taken_date = datetime(*strptime(photo.dates[0]['taken'], "%Y-%m-%d %H:%M:%S")[:6])
+        upload_date = datetime.fromtimestamp(int(photo.dates[0]['posted']))
+        update_date = datetime.fromtimestamp(int(photo.dates[0]['lastupdate']))
 
-        proposed_slug = defaultfilters.slugify(photo_xml.photo[0].title[0].text.lower())
-        slug = get_unique_slug_for_photo(taken_date, proposed_slug)
-
-        # Ignore tags if there are more chars than 255
-        tags, count = '', 0
-        for tag in [(t, len(t) + 1) for t in self._getXMLNodeTag(photo_xml).split()]:
-            if 255 <= (count + tag[1] - 1):
-                tags = tags[:-1]
-                break
-            if not tag[0].startswith('geo:'): # Exclude ugly geo-tags
-                tags += u'%s ' % tag[0]
-                count += tag[1]
+        tags = self._trimTags(self._getXMLNodeTag(photo_xml))
 
         try:
-            original_secret = photo_xml.photo[0]['originalsecret']
+            original_secret = photo['originalsecret']
         except KeyError:
             original_secret = ''
 
 
         default_dict = {
-            'flickr_id': photo_xml.photo[0]['id'],
-            'owner': photo_xml.photo[0].owner[0]['username'],
-            'owner_nsid': photo_xml.photo[0].owner[0]['nsid'],
-            'title': photo_xml.photo[0].title[0].text, # TODO: Typography
-            'slug': slug,
-            'description': photo_xml.photo[0].description[0].text,
+            'flickr_id': int(photo['id']),
+            'owner': photo.owner[0]['username'],
+            'owner_nsid': photo.owner[0]['nsid'],
+            'title': photo.title[0].text, # TODO: Typography
+            'slug': defaultfilters.slugify(photo.title[0].text.lower()),
+            'description': photo.description[0].text,
             'taken_date': taken_date,
             'upload_date': upload_date,
             'update_date': update_date,
-            'photopage_url': photo_xml.photo[0].urls[0].url[0].text,
-            'farm': photo_xml.photo[0]['farm'],
-            'server': photo_xml.photo[0]['server'],
-            'secret': photo_xml.photo[0]['secret'],
+            'photopage_url': photo.urls[0].url[0].text,
+            'farm': photo['farm'],
+            'server': photo['server'],
+            'secret': photo['secret'],
             'original_secret': original_secret,
             'thumbnail_width': sizes['Thumbnail']['width'],
             'thumbnail_height': sizes['Thumbnail']['height'],
@@ -259,7 +369,7 @@ class FlickrSyncr:
             # Removed 'medium_url': urls['Medium'],
             # Removed 'thumbnail_url': urls['Thumbnail'],
             'tags': tags,
-            'license': photo_xml.photo[0]['license'],
+            'license': photo['license'],
             # 'geo_latitude': geo_data['latitude'],
             # 'geo_longitude': geo_data['longitude'],
             # 'geo_accuracy': geo_data['accuracy'],
@@ -279,42 +389,155 @@ class FlickrSyncr:
             # 'exif_focal_length': self.getExifKey(exif_data, 'Focal Length'),
             # 'exif_color_space': self.getExifKey(exif_data, 'Color Space'),
         }
+        return default_dict
 
-        obj, created = Photo.objects.get_or_create(
-            flickr_id = photo_xml.photo[0]['id'], defaults=default_dict)
+    def _listedPhotoFields(self, photo):
+        """
+        The Photo fields for a photo from a page of search results asked
+        for with PHOTO_EXTRAS, like those from _photoFields() but without
+        any more API calls.
 
-        # update if something changed
-        if obj.update_date < update_date:
-            # Never overwrite URL-relevant attributes
-            default_dict['slug'] = obj.slug
-            default_dict['taken_date'] = obj.taken_date
+        Required Arguments
+          photo: A photo from a list in Flickrapi's REST XMLNode format.
+        """
+        def attribute(name, default=None):
+            try:
+                return photo[name]
+            except KeyError:
+                return default
+
+        def dimension(name, default=None):
+            value = attribute(name)
+            return int(value) if value else default
+
+        return {
+            'flickr_id': int(photo['id']),
+            'owner': photo['ownername'],
+            'owner_nsid': photo['owner'],
+            'title': photo['title'],
+            'slug': defaultfilters.slugify(photo['title'].lower()),
+            'description': photo.description[0].text,
+            'taken_date': datetime(*strptime(photo['datetaken'], "%Y-%m-%d %H:%M:%S")[:6]),
+            'upload_date': datetime.fromtimestamp(int(photo['dateupload'])),
+            'update_date': datetime.fromtimestamp(int(photo['lastupdate'])),
+            'photopage_url': 'http://www.flickr.com/photos/%s/%s/' % (photo['owner'], photo['id']),
+            'farm': photo['farm'],
+            'server': photo['server'],
+            'secret': photo['secret'],
+            'original_secret': attribute('originalsecret', ''),
+            'thumbnail_width': dimension('width_t', 0),
+            'thumbnail_height': dimension('height_t', 0),
+            'small_width': dimension('width_s', 0),
+            'small_height': dimension('height_s', 0),
+            'medium_width': dimension('width_m'),
+            'medium_height': dimension('height_m'),
+            'large_width': dimension('width_l'),
+            'large_height': dimension('height_l'),
+            'original_width': dimension('o_width', 0),
+            'original_height': dimension('o_height', 0),
+            'tags': self._trimTags(attribute('tags', '')),
+            'license': photo['license'],
+        }
 
-            updated_obj = Photo(pk=obj.pk, **default_dict)
-            updated_obj.save()
+    def _savePhotos(self, photos, refresh=False):
+        """
+        Synchronize a page of flickr photos, and their comments, with the
+        Django backend in one transaction.
 
-        # Comments
-        comments = self.getPhotoComments(obj.flickr_id)
-        if comments is not None:
-            for c in comments:
-                c['photo'] = obj
-                comment, created = PhotoComment.objects.get_or_create(
-                                        flickr_id=c['flickr_id'], defaults=c)
-        return obj
+        The page's photos already in the database are read in one query.
+        New ones are inserted with bulk_create() and ones flickr has
+        updated since with bulk_update(); the rest are left alone. Comments
+        never change, so only new ones are written. Returns the Photo for
+        each photo, or None for other media like videos, in order.
 
-    def _syncPhotoXMLList(self, photos_xml):
+        Required Arguments
+          photos: A list of (fields, comments), like from _hydratePhoto()
+        Optional Arguments
+          refresh: delete the photos first if they're already saved
+        """
+        started = time.perf_counter()
+        flickr_ids = [fields['flickr_id'] for fields, _ in photos if fields]
+        with transaction.atomic():
+            if refresh:
+                Photo.objects.filter(flickr_id__in=flickr_ids).delete()
+            existing = Photo.objects.in_bulk(flickr_ids, field_name='flickr_id')
+            new, changed, filled = [], [], []
+            for fields, _ in photos:
+                if fields is None:
+                    continue
+                obj = existing.get(fields['flickr_id'])
+                if obj is None:
+                    obj = existing[fields['flickr_id']] = Photo(**fields)
+                    new.append(obj)
+                elif isPlaceholder(obj):
+                    # Its URL was never real, so it gets a slug and
+                    # taken_date like a new photo.
+                    for name, value in fields.items():
+                        setattr(obj, name, value)
+                    filled.append(obj)
+                elif obj.update_date < fields['update_date']:
+                    # Never overwrite URL-relevant attributes
+                    for name in PHOTO_UPDATE_FIELDS:
+                        setattr(obj, name, fields[name])
+                    changed.append(obj)
+
+            slugs = get_unique_slugs_for_photos([(obj.taken_date, obj.slug) for obj in new + filled])
+            for obj, slug in zip(new + filled, slugs):
+                obj.slug = slug
+
+            Photo.objects.bulk_create(new)
+            if new and new[0].pk is None:
+                # Not every database hands back the ids it assigns.
+                existing.update(Photo.objects.in_bulk([p.flickr_id for p in new], field_name='flickr_id'))
+            Photo.objects.bulk_update(changed, PHOTO_UPDATE_FIELDS)
+            Photo.objects.bulk_update(filled, PHOTO_UPDATE_FIELDS + ('slug', 'taken_date'))
+            # Neither sends post_save, where TagField writes the Tags and
+            # TaggedItems that tag lookups go through.
+            for obj in new + changed + filled:
+                photo = existing[obj.flickr_id]
+                Tag.objects.update_tags(photo, photo.tags)
+
+            comments = [dict(c, photo=existing[fields['flickr_id']])
+                        for fields, photo_comments in photos if photo_comments
+                        for c in photo_comments]
+            saved_comments = PhotoComment.objects.in_bulk([c['flickr_id'] for c in comments])
+            new_comments = {c['flickr_id']: PhotoComment(**c)
+                            for c in comments if c['flickr_id'] not in saved_comments}
+            PhotoComment.objects.bulk_create(new_comments.values())
+
+        rows = len(new) + len(changed) + len(filled) + len(new_comments)
+        elapsed = time.perf_counter() - started
+        logging.debug(" ---> Saved %s new and %s updated photos, %s new comments: %.0f rows/s" % (
+            len(new), len(changed) + len(filled), len(new_comments), rows / elapsed if elapsed else 0))
+        return [fields and existing[fields['flickr_id']] for fields, _ in photos]
+
+    def _syncPhotoXMLList(self, photos_xml, hydrate=True):
         """
         Synchronize a list of flickr photos with Django ORM.
 
+        With more than one worker, photos are fetched from flickr by the
+        sync's pool of that many threads. They're all written together on
+        this thread, since SQLite takes one writer at a time.
+
         Required Arguments
           photos_xml: A list of photos in Flickrapi's REST XMLNode format.
+        Optional Arguments
+          hydrate: if false, fill the photos in from the list alone, which
+                   must have been asked for with PHOTO_EXTRAS. That takes
+                   no API calls, but leaves out comments.
         """
-        photo_list = []
-        for photo in photos_xml:
-            print photo
-            photo_result = self.flickr.photos_getInfo(photo_id = photo['id'])
-            photo_list.append(self._syncPhoto(photo_result))
-            print " ---> Photo: %s" % photo_result
-        return photo_list
+        if not hydrate:
+            return self._savePhotos([
+                (self._listedPhotoFields(photo), None) if photo['media'] == 'photo' else (None, None)
+                for photo in photos_xml
+            ])
+        photo_ids = [photo['id'] for photo in photos_xml]
+        with self._workerPool():
+            if self._pool:
+                hydrated = list(self._pool.map(self._hydratePhoto, photo_ids))
+            else:
+                hydrated = [self._hydratePhoto(photo_id) for photo_id in photo_ids]
+        return self._savePhotos(hydrated)
 
     def syncPhoto(self, photo_id, refresh=False):
         """
@@ -325,56 +548,117 @@ class FlickrSyncr:
         Optional Arguments
           refresh: A boolean, if true the Photo will be re-sync'd with flickr
         """
-        photo_result = self.flickr.photos_getInfo(photo_id = photo_id)
-        photo = self._syncPhoto(photo_result, refresh=refresh)
+        photo = self._savePhotos([self._hydratePhoto(photo_id)], refresh=refresh)[0]
         return photo
 
-    def syncAllPublic(self, username):
+    def syncAllPublic(self, username, hydrate=True):
         """
         Synchronize all of a flickr user's photos with Django.
         WARNING: This could take a while!
 
         Required arguments
           username: a flickr username as a string
+        Optional arguments
+          hydrate: as for _syncPhotoXMLList()
         """
         nsid = self.user2nsid(username)
-        count = per_page = int(self.flickr.people_getInfo(
-		user_id=nsid).person[0].photos[0].count[0].text)
-        if count >= 500:
-            per_page = 500
-        pages = count // per_page
-        
-        for page in range(0, pages):
-            result = self.flickr.people_getPublicPhotos(
-		user_id=nsid, per_page=per_page, page=page)
-            self._syncPhotoXMLList(result.photos[0].photo)
+        with self._workerPool():
+            for photos_xml in self._pages(self.flickr.people_getPublicPhotos, user_id=nsid,
+                                          extras=PHOTO_EXTRAS):
+                self._syncPhotoXMLList(self._changedPhotos(photos_xml), hydrate)
+
+    def _pages(self, method, **kwargs):
+        """
+        Yield each page of photos from a paged flickr API call, 500 at a time.
+
+        Required arguments
+          method: the FlickrAPI method, like self.flickr.photos_search
+        """
+        page, pages = 1, 1
+        while page <= pages:
+            result = method(per_page=500, page=page, **kwargs)
+            pages = int(result.photos[0]['pages'])
+            yield result.photos[0].photo
+            page += 1
+
+    def _changedPhotos(self, photos_xml):
+        """
+        The photos from a list that are new, that flickr has updated since
+        they were saved, or that syncMinimal() only saved a placeholder
+        for. The list must have the last_update extra.
+
+        Required Arguments
+          photos_xml: A list of photos in Flickrapi's REST XMLNode format.
+        """
+        saved = Photo.objects.in_bulk([int(photo['id']) for photo in photos_xml], field_name='flickr_id')
+        return [photo for photo in photos_xml
+                if int(photo['id']) not in saved
+                or isPlaceholder(saved[int(photo['id'])])
+                or saved[int(photo['id'])].update_date < datetime.fromtimestamp(int(photo['lastupdate']))]
 
-    def syncRecentPhotos(self, username, days=1):
+    def _cursor(self, nsid):
+        return SyncCursor.objects.get_or_create(nsid=nsid)[0]
+
+    def syncRecentPhotos(self, username, days=None, hydrate=True):
         """
-        Synchronize recent public photos from a flickr user.
+        Synchronize recent public photos from a flickr user. Only new
+        photos and ones changed since they were saved are fetched.
 
         Required arguments
           username: a flickr username as a string
         Optional arguments
-          days: sync photos since this number of days, defaults
-                to 1 (yesterday)
+          days: sync photos since this number of days, defaults to
+                those uploaded since the last sync (or all of them)
+          hydrate: as for _syncPhotoXMLList()
         """
-        syncSince = datetime.now() - timedelta(days=days)
-        timestamp = calendar.timegm(syncSince.timetuple())
         nsid = self.user2nsid(username)
+        cursor = self._cursor(nsid)
+        if days is None:
+            timestamp = cursor.last_upload
+        else:
+            syncSince = datetime.now() - timedelta(days=days)
+            timestamp = calendar.timegm(syncSince.timetuple())
+
+        last_upload = cursor.last_upload
+        with self._workerPool():
+            for photos_xml in self._pages(self.flickr.photos_search, user_id=nsid, min_upload_date=timestamp,
+                                          extras=PHOTO_EXTRAS):
+                self._syncPhotoXMLList(self._changedPhotos(photos_xml), hydrate)
+                last_upload = max([last_upload] + [int(photo['dateupload']) for photo in photos_xml])
+        cursor.last_upload = last_upload
+        cursor.save()
+
+    def syncUpdated(self, username, hydrate=True):
+        """
+        Synchronize the photos a flickr user has uploaded or changed since
+        the last sync, or all of them the first time. Photos that haven't
+        changed since they were saved aren't fetched.
 
-        result = self.flickr.photos_search(user_id=nsid, per_page=500,
-                                           min_upload_date=timestamp)
-        page_count = result.photos[0]['pages']
+        flickr.photos.recentlyUpdated only answers for the user flickrapi
+        is authenticated as, with read permission, so `username` has to be
+        that user.
 
-        for page in range(1, int(page_count)+1):
-            photo_list = self._syncPhotoXMLList(result.photos[0].photo)
-            result = self.flickr.photos_search(user_id=nsid, page=page+1,
-                        per_page=500, min_upload_date=timestamp)
+        Required arguments
+          username: a flickr username as a string
+        Optional arguments
+          hydrate: as for _syncPhotoXMLList()
+        """
+        nsid = self.user2nsid(username)
+        cursor = self._cursor(nsid)
+        last_update = cursor.last_update
+        with self._workerPool():
+            for photos_xml in self._pages(self.flickr.photos_recentlyUpdated, min_date=cursor.last_update,
+                                          extras=PHOTO_EXTRAS):
+                self._syncPhotoXMLList(self._changedPhotos(photos_xml), hydrate)
+                last_update = max([last_update] + [int(photo['lastupdate']) for photo in photos_xml])
+        cursor.last_update = last_update
+        cursor.save()
 
     def syncMinimal(self, username, days=1):
         """
-        Synchronize recent public photos from a flickr user.
+        Synchronize recent public photos from a flickr user, saving only
+        placeholders for the ones not yet saved. The next sync of another
+        kind fills them in.
 
         Required arguments
           username: a flickr username as a string
@@ -418,7 +702,7 @@ class FlickrSyncr:
                 photo_db, created = Photo.objects.get_or_create(
                     flickr_id = photo['id'],
                     defaults=default_dict)
-                print " ---> %s: %s" % (photo_db.title, "NEW" if created else "already saved")
+                logging.debug(" ---> %s: %s" % (photo_db.title, "NEW" if created else "already saved"))
 
     def syncPublicFavorites(self, username):
         """Synchronize a flickr user's public favorites.
@@ -428,19 +712,20 @@ class FlickrSyncr:
         """
         nsid = self.user2nsid(username)
         favList, created = FavoriteList.objects.get_or_create( \
-	    owner = username, defaults = {'sync_date': datetime.now()})
+            owner = username, defaults = {'sync_date': datetime.now()})
 
         result = self.flickr.favorites_getPublicList(user_id=nsid, per_page=500)
         page_count = int(result.photos[0]['pages'])
-        for page in range(1, page_count+1):
-            photo_list = self._syncPhotoXMLList(result.photos[0].photo)
-            for photo in photo_list:
-                favList.photos.add(photo)
-		if page == 1:
-		    favList.primary = photo
-		    favList.save()
-            result = self.flickr.favorites_getPublicList(user_id=nsid,
-                        per_page=500, page=page+1)
+        with self._workerPool():
+            for page in range(1, page_count+1):
+                photo_list = self._syncPhotoXMLList(result.photos[0].photo)
+                for photo in photo_list:
+                    favList.photos.add(photo)
+                    if page == 1:
+                        favList.primary = photo
+                        favList.save()
+                result = self.flickr.favorites_getPublicList(user_id=nsid,
+                            per_page=500, page=page+1)
 
     def syncPhotoSet(self, photoset_id, order=None):
         """
@@ -454,36 +739,37 @@ class FlickrSyncr:
         username = self.flickr.people_getInfo(user_id = nsid).person[0].username[0].text
         result = self.flickr.photosets_getPhotos(photoset_id = photoset_id)
         page_count = int(result.photoset[0]['pages'])
-	primary = self.syncPhoto(photoset_xml.photoset[0]['primary'])
+        primary = self.syncPhoto(photoset_xml.photoset[0]['primary'])
 
         d_photoset, created = PhotoSet.objects.get_or_create(
                 flickr_id = photoset_id,
                 defaults = {
-			'owner': username,
-			'flickr_id': result.photoset[0]['id'],
-			'title': photoset_xml.photoset[0].title[0].text,
-			'description': photoset_xml.photoset[0].description[0].text,
-			'primary': primary,
-			'order': order
-			}
-		)
-	if not created: # update it
-	    d_photoset.owner  = username
-	    d_photoset.title  = photoset_xml.photoset[0].title[0].text
-	    d_photoset.description=photoset_xml.photoset[0].description[0].text
-	    d_photoset.primary = primary
-	    d_photoset.save()
-
-	page_count = int(result.photoset[0]['pages'])
-	
-        for page in range(1, page_count+1):
-            if page > 1:
-                result = self.flickr.photosets_getPhotos(
-                    photoset_id = photoset_id, page = page+1)
-            photo_list = self._syncPhotoXMLList(result.photoset[0].photo)
-            for photo in photo_list:
-                if photo is not None:
-                    d_photoset.photos.add(photo)
+                        'owner': username,
+                        'flickr_id': result.photoset[0]['id'],
+                        'title': photoset_xml.photoset[0].title[0].text,
+                        'description': photoset_xml.photoset[0].description[0].text,
+                        'primary': primary,
+                        'order': order
+                        }
+                )
+        if not created: # update it
+            d_photoset.owner  = username
+            d_photoset.title  = photoset_xml.photoset[0].title[0].text
+            d_photoset.description=photoset_xml.photoset[0].description[0].text
+            d_photoset.primary = primary
+            d_photoset.save()
+
+        page_count = int(result.photoset[0]['pages'])
+        
+        with self._workerPool():
+            for page in range(1, page_count+1):
+                if page > 1:
+                    result = self.flickr.photosets_getPhotos(
+                        photoset_id = photoset_id, page = page+1)
+                photo_list = self._syncPhotoXMLList(result.photoset[0].photo)
+                for photo in photo_list:
+                    if photo is not None:
+                        d_photoset.photos.add(photo)
 
         # Set primary photo and order
         d_photoset.primary = Photo.objects.get(flickr_id__exact=result.photoset[0]['primary']) # TODO: This query isn't in need, we have the ``flickr_id``...
@@ -500,5 +786,6 @@ class FlickrSyncr:
         nsid = self.user2nsid(username)
         result = self.flickr.photosets_getList(user_id=nsid)
 
-        for i, photoset in enumerate(result.photosets[0].photoset):
-            self.syncPhotoSet(photoset['id'], i + 1)
+        with self._workerPool():
+            for i, photoset in enumerate(result.photosets[0].photoset):
+                self.syncPhotoSet(photoset['id'], i + 1)
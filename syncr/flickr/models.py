@@ -83,6 +83,9 @@ class Photo(models.Model):
     class Meta:
         ordering = ('-taken_date',)
         get_latest_by = 'upload_date'
+        # slug.py looks up the slugs taken on a day. Its create_indexes(),
+        # run by sync_flickr, adds this to tables from before it was here.
+        indexes = [models.Index(fields=['taken_date', 'slug'])]
 
     def __unicode__(self):
         return u'%s' % self.title
@@ -178,6 +181,18 @@ class Photo(models.Model):
         """
         return self._next_previous_helper('previous', *args, **kwargs)
 
+class SyncCursor(models.Model):
+    """
+    How far FlickrSyncr has got with a flickr user, as unix times: the
+    newest upload and the newest update it has synced.
+    """
+    nsid = models.CharField(primary_key=True, max_length=50)
+    last_upload = models.PositiveIntegerField(default=0)
+    last_update = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return u"%s synced to %s" % (self.nsid, self.last_update)
+
 class FavoriteList(models.Model):
     owner = models.CharField(max_length=50)
     sync_date = models.DateTimeField()
@@ -1,16 +1,89 @@
-from syncr.flickr.models import Photo
-from datetime import datetime
+from syncr.flickr.models import Photo, SyncCursor
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.db.models import Q
+
+# Days of slugs to load per query, two parameters each.
+DAYS_PER_QUERY = 200
+
+def day_range(day):
+    """
+    Q for photos taken on `day`, as a range the (taken_date, slug) index
+    can answer, unlike taken_date__year/month/day.
+    """
+    start = datetime(day.year, day.month, day.day)
+    return Q(taken_date__gte=start, taken_date__lt=start + timedelta(days=1))
+
+def taken_slugs(days):
+    """
+    The slugs already used on each of `days`, as {date: set of slugs}.
+    """
+    days = sorted(set(days))
+    taken = dict((day, set()) for day in days)
+    for i in range(0, len(days), DAYS_PER_QUERY):
+        q = Q()
+        for day in days[i:i + DAYS_PER_QUERY]:
+            q |= day_range(day)
+        for taken_date, slug in Photo.objects.filter(q).order_by().values_list('taken_date', 'slug'):
+            taken[taken_date.date()].add(slug)
+    return taken
+
+def get_unique_slugs_for_photos(photos):
+    """
+    A unique slug for each (taken_date, proposed_slug) in `photos`, in
+    order, as get_unique_slug_for_photo() would pick them if the photos
+    were saved one by one.
+    """
+    taken = taken_slugs(taken_date.date() for taken_date, _ in photos)
+    next_suffix = {}
+    slugs = []
+    for taken_date, calculate_slug in photos:
+        day = taken_date.date()
+        proposed_slug = calculate_slug
+        # Carry on from the last suffix handed out, so a run of "img"s
+        # doesn't test img-1, img-2... again for each one.
+        l = next_suffix.get((day, calculate_slug), 1)
+        while proposed_slug in taken[day]:
+            proposed_slug = calculate_slug + '-' + str(l)
+            l = l+1
+        next_suffix[(day, calculate_slug)] = l
+        taken[day].add(proposed_slug)
+        slugs.append(proposed_slug)
+    return slugs
 
 def get_unique_slug_for_photo(taken_date, proposed_slug):
-    l=1
-    calculate_slug = proposed_slug
-    while check_slug_photo(taken_date, proposed_slug):
-        proposed_slug = calculate_slug + '-' + str(l)
-        l = l+1
-    return proposed_slug
+    return get_unique_slugs_for_photos([(taken_date, proposed_slug)])[0]
 
 def check_slug_photo(taken_date, proposed_slug):
-    if Photo.objects.filter(taken_date__year=taken_date.year, taken_date__month=taken_date.month, taken_date__day=taken_date.day).filter(slug=proposed_slug):
-        return True
-    else:
-        return False
\ No newline at end of file
+    return Photo.objects.filter(day_range(taken_date), slug=proposed_slug).exists()
+
+def create_tables():
+    """
+    Create the SyncCursor table if it's missing, and return the models
+    whose tables were created. This app has no migrations, so a database
+    from before SyncCursor was added has every table but that one.
+    """
+    missing = [model for model in [SyncCursor]
+               if model._meta.db_table not in connection.introspection.table_names()]
+    with connection.schema_editor() as editor:
+        for model in missing:
+            editor.create_model(model)
+    return missing
+
+def create_indexes():
+    """
+    Create whichever of Photo's Meta.indexes its table lacks, and return
+    them. This app has no migrations, so nothing alters a table that's
+    already there: one from before the (taken_date, slug) index that
+    taken_slugs() reads was declared doesn't have it.
+    """
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, Photo._meta.db_table)
+    indexed = [c['columns'] for c in constraints.values() if c['index']]
+    missing = [index for index in Photo._meta.indexes
+               if [Photo._meta.get_field(name).column for name in index.fields] not in indexed]
+    with connection.schema_editor() as editor:
+        for index in missing:
+            editor.add_index(Photo, index)
+    return missing
@@ -53,6 +53,25 @@ urlpatterns = [
         {"document_root": settings.MEDIA_ROOT + "/../sunraylab"},
     ),
     re_path(r"^boston-bikes/$", views.bikes, name="bikes"),
+    re_path(
+        r"^boston-bikes/data/(?P<name>bike-crashes|bike-requests)\.csv$", views.bike_data, name="bike_data"
+    ),
+    re_path(
+        r"^boston-bikes/data/(?P<name>[a-z-]+)-z(?P<zoom>\d+)\.json$",
+        views.bike_map_layer,
+        name="bike_map_layer",
+    ),
+    re_path(
+        r"^boston-bikes/bins/(?P<name>[a-z-]+)/(?P<kind>[a-z]+)-z(?P<zoom>\d+)\.json$",
+        views.bike_bins,
+        name="bike_bins",
+    ),
+    re_path(r"^boston-bikes/stream/(?P<name>[a-z-]+)\.ndjson$", views.bike_stream, name="bike_stream"),
+    re_path(
+        r"^boston-bikes/tiles/(?P<name>[a-z-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.json$",
+        views.bike_tile,
+        name="bike_tile",
+    ),
     re_path(
         r"^boston-bikes/(?P<path>.*)$",
         serve,
@@ -75,6 +94,7 @@ urlpatterns = [
     ),
     re_path(r"^portfolio/$", views.portfolio, name="portfolio"),
     re_path(r"^portfolio/(?P<path>.*)$", serve, {"document_root": settings.MEDIA_ROOT + "/../portfolio"}),
+    re_path(r"^cache-stats/?$", views.cache_stats, name="cache_stats"),
     path("admin/", admin.site.urls),
 ]
 
@@ -6,7 +6,22 @@ https://docs.djangoproject.com/en/1.7/howto/deployment/wsgi/
 """
 
 import os
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
\ No newline at end of file
+
+from com.manifest import load_manifest
+from com.static import StaticFiles
+from com.warmup import warm
+
+application = StaticFiles(
+    get_wsgi_application(),
+    settings.STATIC_MOUNTS,
+    manifest=load_manifest(settings.STATIC_MANIFEST),
+    check_mtime=settings.DEBUG,
+)
+
+# Do what the first requests would, before gunicorn forks any workers.
+warm(application)